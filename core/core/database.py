@@ -0,0 +1,85 @@
+"""
+Профили соединений с базой для settings.DATABASES.
+
+'tuned' — постоянные соединения с проверкой перед использованием,
+для SQLite ещё WAL и прагмы при каждом подключении, для PostgreSQL —
+пул соединений (psycopg[pool]). 'baseline' — настройки Django по
+умолчанию, нужен для сравнения в команде benchmark_db.
+"""
+PROFILES = ('tuned', 'baseline')
+
+# Выполняются при каждом новом соединении (OPTIONS['init_command'])
+SQLITE_PRAGMAS = {
+    # Читатели не блокируют писателя и наоборот
+    'journal_mode': 'WAL',
+    # В режиме WAL fsync только на контрольных точках
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    # Ждать блокировку, а не сразу отвечать «database is locked»
+    'busy_timeout': 5000,
+    # Отрицательное значение — в КиБ
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+CONN_MAX_AGE = 60
+
+POSTGRES_POOL = {
+    'min_size': 2,
+    'max_size': 10,
+    'timeout': 10,
+}
+
+
+def sqlite_database(name, profile='tuned', pragmas=None, writer=True):
+    """writer=False — база только для чтения (реплика), транзакции остаются DEFERRED."""
+    config = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+    }
+    if profile == 'tuned':
+        pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
+        config.update({
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in pragmas.items()),
+            },
+        })
+        if writer:
+            # Транзакция сразу берёт блокировку на запись: иначе повышение
+            # блокировки внутри транзакции падает без ожидания busy_timeout.
+            # Цена — транзакции выполняются по одной, даже только читающие,
+            # поэтому на реплике, куда не пишут, режим по умолчанию (DEFERRED)
+            config['OPTIONS']['transaction_mode'] = 'IMMEDIATE'
+    return config
+
+
+def postgresql_database(environ, profile='tuned'):
+    config = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': environ['POSTGRES_DB'],
+        'USER': environ.get('POSTGRES_USER', ''),
+        'PASSWORD': environ.get('POSTGRES_PASSWORD', ''),
+        'HOST': environ.get('POSTGRES_HOST', ''),
+        'PORT': environ.get('POSTGRES_PORT', ''),
+    }
+    if profile == 'tuned':
+        config.update({
+            # С пулом Django требует CONN_MAX_AGE = 0, соединения держит пул
+            'CONN_MAX_AGE': 0,
+            'OPTIONS': {
+                'pool': {
+                    **POSTGRES_POOL,
+                    'max_size': int(environ.get('POSTGRES_POOL_SIZE', POSTGRES_POOL['max_size'])),
+                },
+            },
+        })
+    return config
+
+
+def default_database(environ, sqlite_name, profile='tuned'):
+    """PostgreSQL, если задан POSTGRES_DB, иначе SQLite-файл sqlite_name."""
+    if environ.get('POSTGRES_DB'):
+        return postgresql_database(environ, profile)
+    return sqlite_database(sqlite_name, profile)
@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 from pathlib import Path
 import os
 
+from .database import default_database, sqlite_database
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -44,6 +46,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'main.middleware.QueryBudgetMiddleware',
+    'main.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -77,13 +81,24 @@ WSGI_APPLICATION = 'core.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# 'tuned' (core/database.py) или 'baseline' — настройки Django по умолчанию.
+# При заданном POSTGRES_DB основная база — PostgreSQL с пулом соединений
+DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE', 'tuned')
+
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': default_database(os.environ, BASE_DIR / 'db.sqlite3', DATABASE_PROFILE),
+    # Локальная реплика только для чтения, обновляется командой sync_replicas
+    'replica': sqlite_database(BASE_DIR / 'db_replica.sqlite3', DATABASE_PROFILE, writer=False),
 }
 
+DATABASE_ROUTERS = ['main.db_router.PrimaryReplicaRouter']
+
+# Алиасы реплик для чтения, например DATABASE_REPLICAS=replica
+DATABASE_REPLICAS = [alias for alias in os.environ.get('DATABASE_REPLICAS', '').split(',') if alias]
+
+# Сколько секунд после записи пользователь читает из основной базы
+REPLICA_LAG_TOLERANCE = 5
+
 AUTH_USER_MODEL = 'user.MyUser'
 
 # Password validation
@@ -127,13 +142,166 @@ STATICFILES_DIRS = [
 
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# Хеши в именах, бандлы, .gz и раздача из WSGI (core/static_pipeline.py).
+# Нужен collectstatic; без DEBUG включено по умолчанию
+STATIC_PIPELINE = os.environ.get('STATIC_PIPELINE', '0' if DEBUG else '1') == '1'
+# Бандл -> исходные файлы в порядке подключения в base.html
+STATIC_BUNDLES = {
+    'bundles/site.css': [
+        'vendor/bootstrap/css/bootstrap.min.css',
+        'assets/css/fontawesome.css',
+        'assets/css/templatemo-cyborg-gaming.css',
+        'assets/css/owl.css',
+        'assets/css/animate.css',
+    ],
+    'bundles/site.js': [
+        'vendor/jquery/jquery.min.js',
+        'vendor/bootstrap/js/bootstrap.min.js',
+        'assets/js/isotope.min.js',
+        'assets/js/owl-carousel.js',
+        'assets/js/tabs.js',
+        'assets/js/popup.js',
+        'assets/js/custom.js',
+    ],
+}
+STATIC_IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+STATIC_CACHE_CONTROL = 'public, max-age=60'
+
 MEDIA_ROOT = 'media/'
 MEDIA_URL = '/media/'
 
+# Раздача медиа (main/media.py)
+MEDIA_MAX_AGE = 365 * 24 * 60 * 60
+MEDIA_PRIVATE_MAX_AGE = 60 * 60
+MEDIA_CHUNK_SIZE = 64 * 1024
+# None — файл читает Django; 'x-accel-redirect' (nginx) или 'x-sendfile'
+# (Apache, lighttpd) — файл отдаёт веб-сервер после проверки доступа
+MEDIA_SENDFILE = os.environ.get('MEDIA_SENDFILE') or None
+# internal location nginx с alias на MEDIA_ROOT
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+
+# Загрузки хранятся по содержимому (main/storage.py): MEDIA_BLOB_DIR/ab/cd/<sha256>.
+# Каталоги из MEDIA_PRIVATE_UPLOAD_DIRS остаются отдельными, доступ к ним проверяет main/media.py
+MEDIA_BLOB_DIR = 'media/blobs'
+MEDIA_PRIVATE_UPLOAD_DIRS = ('media/check',)
+# gc_media не трогает блобы моложе этого срока: строка с загрузкой может быть ещё не сохранена
+MEDIA_BLOB_GC_GRACE = 24 * 60 * 60
+
+STORAGES = {
+    'default': {'BACKEND': 'main.storage.ContentAddressedStorage'},
+    'staticfiles': {
+        'BACKEND': (
+            'core.static_pipeline.PipelineStaticFilesStorage' if STATIC_PIPELINE
+            else 'django.contrib.staticfiles.storage.StaticFilesStorage'
+        ),
+    },
+}
+
 AUTHENTICATION_BACKENDS = [
-    'django.contrib.auth.backends.ModelBackend',
+    # ModelBackend с пользователем из кеша (user/backends.py)
+    'user.backends.CachedModelBackend',
 ]
 
+# Общий кеш витрины, сессий и пользователей. Без REDIS_URL — память процесса,
+# тогда у каждого процесса свой кеш
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Сессии пишутся в базу и в кеш, читаются из кеша
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+# Сообщения только в cookie, чтобы messages.success() не сохранял сессию
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+AUTH_USER_CACHE_TIMEOUT = 5 * 60
+
+# Keyset pagination (main.pagination)
+
+PAGINATION_PAGE_SIZE = 20
+PAGINATION_MAX_PAGE_SIZE = 100
+CATALOG_PAGE_SIZE = 2
+# Границы ценовых диапазонов в фасетах каталога (main.facets)
+CATALOG_PRICE_BUCKETS = (100, 500, 1000, 5000)
+REVIEWS_PAGE_SIZE = 10
+
+# Уменьшенные копии изображений (main.thumbnails)
+
+IMAGE_VARIANT_WIDTHS = (200, 400, 800)
+IMAGE_VARIANT_FORMATS = ('webp', 'jpeg')
+IMAGE_VARIANT_QUALITY = 80
+IMAGE_VARIANT_WORKERS = 2
+IMAGE_VARIANTS_ASYNC = True
+# Сколько секунд помнить, что варианты готовы / ещё не созданы
+IMAGE_VARIANT_READY_TIMEOUT = 24 * 60 * 60
+IMAGE_VARIANT_PENDING_TIMEOUT = 30
+
+# Похожие продукты (main.recommendations)
+
+SIMILAR_PRODUCTS_TOP_K = 8
+SIMILAR_PRODUCTS_TEXT_DIM = 1024
+SIMILAR_PRODUCTS_WEIGHTS = {
+    'category': 1.0,
+    'price': 0.5,
+    'copurchase': 2.0,
+    'text': 1.5,
+}
+SIMILAR_PRODUCTS_ASYNC = True
+# Сколько матриц категорий держать в памяти процесса
+SIMILAR_PRODUCTS_CACHED_CATEGORIES = 32
+
+# Бюджеты SQL-запросов по url_name (main.query_budget)
+# 'off', 'warn' (лог) или 'raise'; задаётся явно, от DEBUG не зависит
+
+QUERY_BUDGET_MODE = os.environ.get('QUERY_BUDGET_MODE', 'off')
+QUERY_BUDGET_REPEAT_THRESHOLD = 3
+# Измерены на худшем случае: замена картинки из blob-хранилища, первая оплата
+# продавца за день, OTP из таблицы. В тестах atomic() даёт SAVEPOINT и RELEASE
+QUERY_BUDGETS = {
+    # main/urls.py
+    'index': 4,
+    'catalog': 6,
+    'product_detail': 10,
+    'product_reviews': 2,
+    'product_create': 8,
+    'product_update': 10,
+    'rating_create': 7,
+    'rating_answer_create': 5,
+    'user_profile': 4,
+    'payment_requests': 3,
+    'payment_request_update_status': 10,
+    'payment_request_bulk_update_status': 8,
+    'payments': 5,
+    'product_payment_create': 5,
+    'export': 2,
+    # user/urls.py
+    'register': 2,
+    'login': 10,
+    'logout': 4,
+    'otp_verify': 13,
+}
+
+# Кеш витрины: фрагменты главной и каталога, страницы продуктов для гостей
+STOREFRONT_CACHE_TIMEOUT = 300
+# Сколько ещё секунд отдавать просроченную запись, пока её перерисовывает один запрос
+STOREFRONT_CACHE_STALE = 60
+STOREFRONT_CACHE_LOCK_TIMEOUT = 10
+
+# Асинхронные варианты главной, каталога, страницы продукта и профиля (main/async_views.py)
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS') == '1'
+
+# Выгрузки для бухгалтера (main.exports)
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_BUFFER_SIZE = 64 * 1024
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -146,4 +314,27 @@ EMAIL_USE_TLS = True
 EMAIL_USE_SSL = False
 EMAIL_HOST_USER = "nurbeksagynbekov10@gmail.com"
 EMAIL_HOST_PASSWORD = "aara kqvs oyrc kixr"
-DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
\ No newline at end of file
+DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
+
+# Одноразовые коды (user.otp): 'totp' или 'table'
+OTP_MODE = 'totp'
+OTP_STEP = 5 * 60
+OTP_VALID_WINDOWS = 1
+
+# Ограничение попыток входа (user.throttling): точка входа -> {область:
+# (число попыток, за сколько секунд они восстанавливаются)}
+LOGIN_THROTTLES = {
+    'login': {'ip': (20, 60), 'email': (5, 5 * 60)},
+    'otp_verify': {'ip': (20, 60), 'user': (5, 5 * 60)},
+}
+# 'cache' — общий кеш, 'local' — память процесса
+LOGIN_THROTTLE_STORE = 'cache'
+LOGIN_THROTTLE_LOCAL_MAX_KEYS = 10000
+LOGIN_THROTTLE_STATS_TIMEOUT = 24 * 60 * 60
+
+# Очередь писем (user.mail)
+MAIL_QUEUE_BATCH_SIZE = 50
+MAIL_QUEUE_MAX_ATTEMPTS = 5
+MAIL_QUEUE_RETRY_DELAY = 30
+MAIL_QUEUE_MAX_RETRY_DELAY = 60 * 60
+MAIL_QUEUE_LEASE = 5 * 60
@@ -0,0 +1,243 @@
+"""
+Статика для продакшена: хеши в именах, бандлы, gzip и раздача из WSGI.
+
+collectstatic с PipelineStaticFilesStorage:
+1. склеивает файлы из STATIC_BUNDLES (CSS и JS из base.html) в несколько
+   файлов; относительные url() в CSS переписываются от пути бандла,
+   @import поднимаются в начало;
+2. как ManifestStaticFilesStorage добавляет хеш содержимого в имена и
+   пишет staticfiles.json;
+3. рядом с текстовыми файлами кладёт сжатые копии .gz.
+
+StaticFilesApplication оборачивает WSGI-приложение: запросы к STATIC_URL
+обслуживаются из STATIC_ROOT без Django. Если клиент принимает gzip,
+отдаётся готовый .gz; файлы с хешем в имени получают Cache-Control
+immutable на год, остальные — короткий max-age с ETag.
+"""
+import gzip
+import json
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+from email.utils import formatdate
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+logger = logging.getLogger(__name__)
+
+COMPRESS_EXTENSIONS = ('.css', '.js', '.map', '.svg', '.json', '.txt', '.xml', '.html', '.ttf', '.eot', '.otf')
+# Сжатая копия не нужна, если экономит меньше 5%
+COMPRESS_MIN_RATIO = 0.95
+STREAM_CHUNK_SIZE = 64 * 1024
+
+CSS_URL = re.compile(r'url\(\s*([\'"]?)(.*?)\1\s*\)')
+CSS_IMPORT = re.compile(r'^\s*@import\s+(?:url\([^)]*\)|"[^"]*"|\'[^\']*\')[^;]*;\s*$', re.MULTILINE)
+CSS_CHARSET = re.compile(r'^\ufeff?\s*@charset\s+[^;]+;')
+CSS_SOURCE_MAP = re.compile(r'/\*# sourceMappingURL=.*?\*/')
+JS_SOURCE_MAP = re.compile(r'^\s*//# sourceMappingURL=.*$', re.MULTILINE)
+
+
+def rebase_css_urls(content, source, bundle):
+    """url() из файла source, пересчитанные относительно bundle."""
+    source_dir = posixpath.dirname(source)
+    bundle_dir = posixpath.dirname(bundle) or '.'
+
+    def rebase(match):
+        quote, url = match.groups()
+        if not url or url.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+            return match.group(0)
+        path, suffix = re.match(r'([^?#]*)(.*)', url).groups()
+        target = posixpath.normpath(posixpath.join(source_dir, path))
+        return f'url({quote}{posixpath.relpath(target, bundle_dir)}{suffix}{quote})'
+
+    return CSS_URL.sub(rebase, content)
+
+
+def build_bundle(bundle, sources, read):
+    """Содержимое бандла; read(path) возвращает текст исходного файла."""
+    if bundle.endswith('.css'):
+        imports, parts = [], []
+        # Карты исходников относятся к отдельным файлам, а не к бандлу
+        for source in sources:
+            content = CSS_SOURCE_MAP.sub('', CSS_CHARSET.sub('', read(source)))
+            content = rebase_css_urls(content, source, bundle)
+            # @import действует только в начале таблицы стилей
+            imports += [line.strip() for line in CSS_IMPORT.findall(content)]
+            parts.append(f'/* {source} */\n{CSS_IMPORT.sub("", content)}')
+        # @charset исходных файлов вырезан: допустим только один и только первым
+        return '\n'.join(['@charset "UTF-8";', *dict.fromkeys(imports), *parts])
+
+    return '\n'.join(f'/* {source} */\n{JS_SOURCE_MAP.sub("", read(source))}\n;' for source in sources)
+
+
+class PipelineStaticFilesStorage(ManifestStaticFilesStorage):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.missing_references = set()
+
+    def url_converter(self, name, hashed_files, template=None):
+        converter = super().url_converter(name, hashed_files, template)
+
+        def convert(matchobj):
+            # В шаблоне темы есть ссылки на отсутствующие файлы, их оставляем как есть
+            try:
+                return converter(matchobj)
+            except ValueError as exc:
+                # Проходов post_process несколько, предупреждаем один раз
+                if (name, str(exc)) not in self.missing_references:
+                    self.missing_references.add((name, str(exc)))
+                    logger.warning('%s: %s', name, exc)
+                return matchobj.group('matched')
+
+        return convert
+
+    def build_bundles(self):
+        def read(path):
+            with self.open(path) as file:
+                return file.read().decode()
+
+        for bundle, sources in settings.STATIC_BUNDLES.items():
+            if self.exists(bundle):
+                self.delete(bundle)
+            self.save(bundle, ContentFile(build_bundle(bundle, sources, read).encode()))
+            yield bundle
+
+    def compress(self, name):
+        """Пишет name.gz и возвращает его имя, если сжатие имеет смысл."""
+        if not name.endswith(COMPRESS_EXTENSIONS):
+            return None
+        with self.open(name) as file:
+            content = file.read()
+        # mtime=0: одинаковый файл при каждой сборке
+        compressed = gzip.compress(content, compresslevel=9, mtime=0)
+        if len(compressed) >= len(content) * COMPRESS_MIN_RATIO:
+            return None
+        gz_name = f'{name}.gz'
+        if self.exists(gz_name):
+            self.delete(gz_name)
+        self.save(gz_name, ContentFile(compressed))
+        return gz_name
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            return
+
+        for bundle in self.build_bundles():
+            paths[bundle] = (self, bundle)
+
+        yield from super().post_process(paths, dry_run, **options)
+
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            gz_name = self.compress(name)
+            if gz_name:
+                yield name, gz_name, True
+
+
+class StaticFile:
+    """Файл из STATIC_ROOT и его сжатая копия; заголовки считаются один раз."""
+
+    def __init__(self, path, immutable):
+        content_type, _ = mimetypes.guess_type(path)
+        self.headers = [
+            ('Content-Type', content_type or 'application/octet-stream'),
+            ('Cache-Control', settings.STATIC_IMMUTABLE_CACHE_CONTROL if immutable else settings.STATIC_CACHE_CONTROL),
+        ]
+        self.variants = {None: self.variant(path, '')}
+        if os.path.exists(f'{path}.gz'):
+            self.variants['gzip'] = self.variant(f'{path}.gz', '-gz')
+            self.headers.append(('Vary', 'Accept-Encoding'))
+
+    @staticmethod
+    def variant(path, suffix):
+        stat = os.stat(path)
+        return {
+            'path': path,
+            'etag': f'"{stat.st_size:x}-{int(stat.st_mtime):x}{suffix}"',
+            'size': stat.st_size,
+            'last_modified': formatdate(stat.st_mtime, usegmt=True),
+        }
+
+
+def read_file(file):
+    with file:
+        while chunk := file.read(STREAM_CHUNK_SIZE):
+            yield chunk
+
+
+def accepts_gzip(environ):
+    for part in environ.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = part.partition(';')
+        if coding.strip().lower() in ('gzip', '*'):
+            _, _, quality = params.partition('q=')
+            try:
+                return float(quality or 1) > 0
+            except ValueError:
+                return False
+    return False
+
+
+class StaticFilesApplication:
+    """WSGI-обёртка, раздающая собранную статику из STATIC_ROOT."""
+
+    def __init__(self, application, root=None, prefix=None):
+        self.application = application
+        self.root = root or settings.STATIC_ROOT
+        self.prefix = prefix or settings.STATIC_URL
+        if not self.prefix.startswith('/'):
+            self.prefix = f'/{self.prefix}'
+        self.files = self.scan()
+
+    def scan(self):
+        manifest_path = os.path.join(self.root, ManifestStaticFilesStorage.manifest_name)
+        hashed = set()
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as file:
+                hashed = set(json.load(file).get('paths', {}).values())
+
+        files = {}
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith('.gz'):
+                    continue
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, self.root).replace(os.sep, '/')
+                files[self.prefix + name] = StaticFile(path, name in hashed)
+        return files
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if not path.startswith(self.prefix):
+            return self.application(environ, start_response)
+
+        static_file = self.files.get(path)
+        if static_file is None:
+            start_response('404 Not Found', [('Content-Type', 'text/plain; charset=utf-8')])
+            return [b'Not Found']
+        if environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+            start_response('405 Method Not Allowed', [('Allow', 'GET, HEAD')])
+            return [b'']
+
+        encoding = 'gzip' if 'gzip' in static_file.variants and accepts_gzip(environ) else None
+        variant = static_file.variants[encoding]
+        headers = static_file.headers + [('ETag', variant['etag']), ('Last-Modified', variant['last_modified'])]
+        if variant['etag'] in environ.get('HTTP_IF_NONE_MATCH', ''):
+            start_response('304 Not Modified', headers)
+            return [b'']
+
+        if encoding:
+            headers.append(('Content-Encoding', encoding))
+        headers.append(('Content-Length', str(variant['size'])))
+        start_response('200 OK', headers)
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return [b'']
+
+        file = open(variant['path'], 'rb')
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if file_wrapper:
+            return file_wrapper(file, STREAM_CHUNK_SIZE)
+        return read_file(file)
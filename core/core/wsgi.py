@@ -9,8 +9,15 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_wsgi_application()
+
+if settings.STATIC_PIPELINE:
+    # Собранная статика отдаётся до Django, см. core/static_pipeline.py
+    from core.static_pipeline import StaticFilesApplication
+
+    application = StaticFilesApplication(application)
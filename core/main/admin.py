@@ -1,4 +1,7 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+
+from .choices import OrderStatusEnum
+from .orders import BulkStatusError, bulk_update_status
 from .models import Category, Image, Product, Rating, RatingAnswer, PaymentMethod, PaymentRequest
 
 admin.site.register(Category)
@@ -7,5 +10,26 @@ admin.site.register(Product)
 admin.site.register(Rating)
 admin.site.register(RatingAnswer)
 admin.site.register(PaymentMethod)
-admin.site.register(PaymentRequest)
 
+
+@admin.register(PaymentRequest)
+class PaymentRequestAdmin(admin.ModelAdmin):
+    list_display = ('user', 'product', 'quantity', 'total_price', 'status', 'created_date')
+    list_filter = ('status', )
+    actions = ('accept_requests', 'deny_requests')
+
+    def _set_status(self, request, queryset, status):
+        try:
+            updated, _ = bulk_update_status(queryset.values_list('id', flat=True), status)
+        except BulkStatusError as exc:
+            self.message_user(request, str(exc), messages.ERROR)
+        else:
+            self.message_user(request, f'Статус изменён у заявок: {updated}', messages.SUCCESS)
+
+    @admin.action(description='Принять выбранные заявки')
+    def accept_requests(self, request, queryset):
+        self._set_status(request, queryset, OrderStatusEnum.ACCEPTED)
+
+    @admin.action(description='Отклонить выбранные заявки')
+    def deny_requests(self, request, queryset):
+        self._set_status(request, queryset, OrderStatusEnum.DENIED)
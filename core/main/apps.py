@@ -1,6 +1,32 @@
 from django.apps import AppConfig
+from django.db import router
+from django.db.models.signals import post_migrate, pre_migrate
 
 
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        pre_migrate.connect(drop_search_triggers, sender=self)
+        post_migrate.connect(install_search_index, sender=self)
+
+
+def drop_search_triggers(using='default', plan=None, **kwargs):
+    from .search import drop_product_fts_triggers
+
+    if not router.allow_migrate(using, 'main'):
+        return
+    if any(migration.app_label == 'main' for migration, backwards in plan or ()):
+        drop_product_fts_triggers(using)
+
+
+def install_search_index(using='default', **kwargs):
+    from .search import install_product_fts
+
+    # Реплики не мигрируются, индекс приходит в копии основной базы
+    if not router.allow_migrate(using, 'main'):
+        return
+    install_product_fts(using)
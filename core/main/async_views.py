@@ -0,0 +1,109 @@
+"""
+Асинхронные варианты читающих вьюх витрины для запуска под ASGI.
+
+Включаются настройкой ASYNC_VIEWS (main/urls.py подставляет их под теми же
+именами маршрутов). Независимые части страницы запрашиваются через
+асинхронный ORM и asyncio.gather, шаблон рендерится в sync-потоке, потому
+что формы и теги шаблонов обращаются к базе синхронно.
+
+Django пока выполняет запросы асинхронного ORM в одном общем sync-потоке,
+поэтому запросы одной страницы не идут параллельно; выигрыш в том, что
+event loop не блокируется и обслуживает другие запросы, пока этот ждёт
+базу. Сравнить с WSGI-путём: benchmark --asgi при ASYNC_VIEWS=1.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.http import Http404
+from django.shortcuts import redirect, render
+from django.template.loader import render_to_string
+
+from .caching import CATALOG, acached_page, aget_or_render, can_cache_page, product_scope
+from .conditional import catalog_validators, conditional_page, product_validators
+from .facets import acatalog_facets
+from .models import Product
+from .recommendations import similar_products_for
+from .views import (
+    catalog_filter, catalog_query, fallback_similar_products, first_reviews_page, index_products,
+    product_detail_context, product_detail_queryset, profile_payment_requests, render_catalog_results
+)
+
+arender = sync_to_async(render)
+arender_to_string = sync_to_async(render_to_string)
+
+
+async def alist(queryset):
+    return [obj async for obj in queryset]
+
+
+@conditional_page(catalog_validators)
+async def index_view(request):
+    async def render_grid():
+        products = await alist(index_products())
+        return await arender_to_string('main/product_grid.html', {"products": products}, request=request)
+
+    products_grid = await aget_or_render('index_grid', [], [CATALOG], render_grid)
+    return await arender(request, 'main/index.html', {"products_grid": products_grid})
+
+
+@conditional_page(product_validators)
+async def product_detail_view(request, product_id):
+    async def render_page(extra_context=None):
+        try:
+            product = await product_detail_queryset().aget(id=product_id)
+        except Product.DoesNotExist:
+            raise Http404()
+
+        reviews_page, similar_products = await asyncio.gather(
+            sync_to_async(first_reviews_page)(product.id),
+            alist(similar_products_for(product)),
+        )
+        if not similar_products:
+            similar_products = await alist(fallback_similar_products(product))
+
+        return await arender(
+            request,
+            'main/product_detail.html',
+            product_detail_context(product, reviews_page, similar_products, extra_context)
+        )
+
+    if await sync_to_async(can_cache_page)(request):
+        return await acached_page(request, 'product_detail', [product_id], [product_scope(product_id)], render_page)
+    return await render_page()
+
+
+@conditional_page(catalog_validators)
+async def product_list_view(request):
+    products = catalog_filter(request)
+    query = await sync_to_async(catalog_query)(request, products)
+    catalog_results = await aget_or_render(
+        'catalog', [query.urlencode()], [CATALOG],
+        sync_to_async(lambda: render_catalog_results(request, products, query))
+    )
+    facets = await acatalog_facets(products)
+    return await arender(request, 'main/product_list.html', {
+        'catalog_results': catalog_results,
+        'products': products,
+        'facets': facets,
+    })
+
+
+async def user_profile_view(request):
+    # Не request.auser(): шаблон читает request.user, и пользователь загрузился бы дважды
+    if not await sync_to_async(lambda: request.user.is_authenticated)():
+        messages.error(request, 'Только авторизованные!')
+        return redirect('index')
+
+    payment_requests, payment_methods = await asyncio.gather(
+        alist(profile_payment_requests(request.user)),
+        alist(request.user.payment_methods.all()),
+    )
+    return await arender(
+        request=request,
+        template_name='main/user_profile.html',
+        context={
+            'payment_requests': payment_requests,
+            'payment_methods': payment_methods
+        }
+    )
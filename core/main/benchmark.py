@@ -0,0 +1,357 @@
+"""
+Нагрузочный прогон всех маршрутов main/urls.py и user/urls.py.
+
+Запросы идут через django.test.Client (с asgi=True — через AsyncClient,
+то есть ASGIHandler) в нескольких потоках, у каждого потока свой клиент
+и своё соединение с базой. Пишущие запросы выполняются в транзакции,
+которая откатывается, поэтому POST-маршруты можно гонять много раз на
+одних и тех же данных; после прогона в базе остаются только сессии,
+созданные для входа. Читающие идут без транзакции, как в работе: с
+transaction_mode IMMEDIATE каждая транзакция SQLite берёт блокировку
+записи и выстроила бы GET-запросы потоков в очередь. Файлы, загруженные
+пишущими маршрутами, откат не удаляет, поэтому они сохраняются во
+временный MEDIA_ROOT, который удаляется после маршрута.
+Данные берутся из текущей базы (удобно после generate_dataset):
+продавец — пользователь с наибольшим числом продуктов.
+
+По каждому маршруту считаются p50/p95/p99 и среднее время, пропускная
+способность, число SQL-запросов (через QueryRecorder) и пиковая память
+одного запроса (через tracemalloc, отдельным проходом).
+"""
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connections, transaction
+from django.db.models import Count
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from user import urls as user_urls
+from user.choices import UserRoleEnum
+from . import urls as main_urls
+from .choices import OrderStatusEnum
+from .models import Category, Image, PaymentRequest, Product, Rating
+from .query_budget import QueryRecorder
+
+User = get_user_model()
+
+# Минимальный валидный GIF 1x1
+GIF = (
+    b'GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00\x00\x00\x00'
+    b',\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;'
+)
+
+
+class BenchmarkDataError(Exception):
+    pass
+
+
+class Route:
+    def __init__(self, url_name, method='get', args=(), data=None, user=None, writes=None):
+        self.url_name = url_name
+        self.method = method
+        # Пишущий маршрут выполняется в откатываемой транзакции
+        self.writes = method != 'get' if writes is None else writes
+        self.url = reverse(url_name, args=args)
+        # data — словарь или функция от номера итерации (файлы нельзя отправить дважды)
+        self.data = data
+        self.user = user
+
+    def request_data(self, iteration):
+        return self.data(iteration) if callable(self.data) else self.data
+
+
+def url_names():
+    return {pattern.name for urlconf in (main_urls, user_urls) for pattern in urlconf.urlpatterns}
+
+
+def build_routes(password='password'):
+    """url_name -> Route для всех маршрутов на данных из текущей базы."""
+    seller = (
+        User.objects.annotate(products_count=Count('product'))
+        .filter(products_count__gt=0)
+        .order_by('-products_count', 'id')
+        .first()
+    )
+    if seller is None:
+        raise BenchmarkDataError('В базе нет продуктов, сначала запустите generate_dataset')
+
+    product = Product.objects.filter(user=seller).order_by('-rating_count', 'id').first()
+    other_product = Product.objects.exclude(user=seller).order_by('-rating_count', 'id').first() or product
+    rating = Rating.objects.filter(product__user=seller).order_by('id').first()
+    pending_ids = list(
+        PaymentRequest.objects.filter(product__user=seller, status=OrderStatusEnum.IN_PROCESSING)
+        .order_by('id').values_list('id', flat=True)[:10]
+    )
+    if rating is None or not pending_ids:
+        raise BenchmarkDataError('У продавца нет отзывов или заявок в обработке')
+
+    accountant = User.objects.filter(role=UserRoleEnum.ACCOUNTANT).order_by('id').first()
+    if accountant is None:
+        raise BenchmarkDataError('В базе нет бухгалтера, перезапустите generate_dataset')
+
+    image_ids = list(Image.objects.order_by('id').values_list('id', flat=True)[:3])
+    category_id = Category.objects.order_by('id').values_list('id', flat=True).first()
+    search_term = product.title.split()[0]
+
+    def product_form(iteration):
+        return {
+            'title': f'Продукт {iteration}',
+            'category': category_id,
+            'main_image': SimpleUploadedFile(f'bench{iteration}.gif', GIF, content_type='image/gif'),
+            'images': image_ids,
+            'description': 'Описание',
+            'price': 100,
+        }
+
+    routes = [
+        Route('index'),
+        Route('catalog', data={'product_search': search_term, 'ordering': '-rating'}),
+        Route('product_detail', args=[product.id]),
+        Route('product_reviews', args=[product.id]),
+        Route('product_create', 'post', data=product_form, user=seller),
+        Route('product_update', 'post', args=[product.id], data=product_form, user=seller),
+        Route('rating_create', 'post', args=[other_product.id], data={'comment': 'Хорошо', 'count': 4}, user=seller),
+        Route('rating_answer_create', 'post', args=[rating.id], data={'comment': 'Спасибо'}, user=seller),
+        Route('user_profile', user=seller),
+        Route('payment_requests', user=seller),
+        Route(
+            'payment_request_update_status', 'post', args=[pending_ids[0]],
+            data={'status': OrderStatusEnum.ACCEPTED}, user=seller
+        ),
+        Route(
+            'payment_request_bulk_update_status', 'post',
+            data={'status': OrderStatusEnum.ACCEPTED, 'payment_request_ids': pending_ids}, user=seller
+        ),
+        Route('payments', user=seller),
+        Route('export', args=['payment_requests'], data={'format': 'xlsx', 'seller': seller.id}, user=accountant),
+        Route(
+            'product_payment_create', 'post', args=[other_product.id],
+            data=lambda iteration: {
+                'quantity': 1,
+                'check': SimpleUploadedFile(f'check{iteration}.gif', GIF, content_type='image/gif'),
+            },
+            user=seller
+        ),
+        Route('register', 'post', data=lambda iteration: {
+            'first_name': 'Нагрузка',
+            'email': f'bench-{iteration}@example.com',
+            'phone_number': '0700000000',
+            'password1': 'Sup3r-secret-pass',
+            'password2': 'Sup3r-secret-pass',
+        }),
+        Route('login', 'post', data={'email': seller.email, 'password': password}),
+        # Удаляет сессию
+        Route('logout', user=seller, writes=True),
+        # Код одноразовый и требует пароля в той же сессии, поэтому меряется
+        # только ответ без него (редирект на вход)
+        Route('otp_verify', args=[seller.id]),
+    ]
+    return {route.url_name: route for route in routes}
+
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)), 3) if values else None
+
+
+class RouteRunner:
+    """Прогоняет один маршрут заданное число раз в concurrency потоках."""
+
+    def __init__(self, route, iterations, concurrency, warmup, asgi=False):
+        self.route = route
+        self.asgi = asgi
+        self.iterations = iterations
+        self.concurrency = concurrency
+        self.warmup = warmup
+        self.counter = iter(range(10 ** 9))
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def next_iteration(self):
+        with self.lock:
+            return next(self.counter)
+
+    def client(self):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client_class = AsyncClient if self.asgi else Client
+            client = self.local.client = client_class(raise_request_exception=False)
+        if self.route.user is None:
+            # Сессия анонима из POST создаётся внутри откатываемой транзакции и
+            # остаётся только в кеше сессий, поэтому каждый запрос — новый посетитель
+            client.cookies.pop(settings.SESSION_COOKIE_NAME, None)
+        session_cookie = client.cookies.get(settings.SESSION_COOKIE_NAME)
+        # Куки может не быть совсем или её сбросил logout
+        if self.route.user is not None and (session_cookie is None or not session_cookie.value):
+            client.force_login(self.route.user)
+        return client
+
+    def request(self, record_queries=False):
+        client = self.client()
+        data = self.route.request_data(self.next_iteration())
+        send = getattr(client, self.route.method)
+        if self.asgi:
+            # async_to_sync из рабочего потока: sync-код вьюх выполнится в нём же,
+            # с тем же соединением и транзакцией
+            send = async_to_sync(send)
+        recorder = QueryRecorder()
+        with transaction.atomic() if self.route.writes else nullcontext():
+            started = time.perf_counter()
+            if record_queries:
+                with recorder:
+                    response = self.send(send, data)
+            else:
+                response = self.send(send, data)
+            elapsed = time.perf_counter() - started
+            if self.route.writes:
+                transaction.set_rollback(True)
+        return elapsed, response.status_code, recorder.count
+
+    def send(self, send, data):
+        response = send(self.route.url, data)
+        if response.streaming:
+            # Выгрузки читают базу, пока отдаётся тело ответа
+            b''.join(response.streaming_content)
+        return response
+
+    def worker(self, count):
+        for _ in range(self.warmup):
+            self.request()
+        return [self.request(record_queries=True) for _ in range(count)]
+
+    def thread_worker(self, count):
+        try:
+            return self.worker(count)
+        finally:
+            # Соединения у каждого потока свои
+            connections.close_all()
+
+    def run(self):
+        shares = [
+            self.iterations // self.concurrency + (index < self.iterations % self.concurrency)
+            for index in range(self.concurrency)
+        ]
+        started = time.perf_counter()
+        if self.concurrency == 1:
+            results = self.worker(self.iterations)
+        else:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                results = [result for chunk in executor.map(self.thread_worker, shares) for result in chunk]
+        wall_time = time.perf_counter() - started
+
+        latencies = [elapsed * 1000 for elapsed, _, _ in results]
+        queries = [count for _, _, count in results]
+        return {
+            'method': self.route.method.upper(),
+            'url': self.route.url,
+            'requests': len(results),
+            'errors': sum(1 for _, status, _ in results if status >= 400),
+            'throughput_rps': round(len(results) / wall_time, 2) if wall_time else None,
+            'latency_ms': {
+                'p50': percentile(latencies, 50),
+                'p95': percentile(latencies, 95),
+                'p99': percentile(latencies, 99),
+                'mean': round(float(np.mean(latencies)), 3) if latencies else None,
+                'max': round(max(latencies), 3) if latencies else None,
+            },
+            'queries': {
+                'median': int(np.median(queries)) if queries else None,
+                'max': max(queries, default=None),
+            },
+            'peak_memory_kb': self.peak_memory(),
+        }
+
+    def peak_memory(self):
+        """Пиковая память одного запроса, отдельно от замеров времени."""
+        tracemalloc.start()
+        try:
+            self.request()
+            return round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+        finally:
+            tracemalloc.stop()
+
+
+@contextmanager
+def route_media(route):
+    """Временный MEDIA_ROOT для пишущего маршрута: строки Blob откатываются, файлы — нет."""
+    if not route.writes:
+        yield
+        return
+    with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+        yield
+
+
+def run_benchmark(routes, iterations=50, concurrency=1, warmup=2, asgi=False):
+    results = {}
+    # Без этого login и otp_verify после нескольких итераций отвечали бы 429
+    with override_settings(LOGIN_THROTTLES={}):
+        for url_name, route in routes.items():
+            with route_media(route):
+                results[url_name] = RouteRunner(route, iterations, concurrency, warmup, asgi).run()
+    return {
+        'meta': {
+            'interface': 'asgi' if asgi else 'wsgi',
+            'async_views': settings.ASYNC_VIEWS,
+            'iterations': iterations,
+            'concurrency': concurrency,
+            'warmup': warmup,
+            'database': settings.DATABASES['default']['ENGINE'],
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'routes': results,
+    }
+
+
+def _metric(result, path):
+    value = result
+    for key in path.split('.'):
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+
+COMPARE_METRICS = ('latency_ms.p50', 'latency_ms.p95', 'latency_ms.p99', 'queries.max', 'peak_memory_kb')
+
+
+def compare(base, new, threshold=10.0, min_delta_ms=1.0):
+    """
+    Сравнивает два прогона. Возвращает (строки, регрессии), где строка —
+    (маршрут, метрика, было, стало, изменение в %). Регрессия — рост
+    времени или памяти больше threshold процентов (для времени ещё и больше
+    min_delta_ms) либо любой рост числа запросов.
+    """
+    rows = []
+    regressions = []
+    for url_name in sorted(base['routes'].keys() | new['routes'].keys()):
+        before = base['routes'].get(url_name)
+        after = new['routes'].get(url_name)
+        if before is None or after is None:
+            rows.append((url_name, 'route', bool(before), bool(after), None))
+            continue
+
+        for metric in COMPARE_METRICS:
+            old, current = _metric(before, metric), _metric(after, metric)
+            if old is None or current is None:
+                continue
+            change = (current - old) / old * 100 if old else (100.0 if current else 0.0)
+            row = (url_name, metric, old, current, round(change, 1))
+            rows.append(row)
+
+            if metric.startswith('queries'):
+                regressed = current > old
+            elif metric.startswith('latency'):
+                regressed = change > threshold and current - old > min_delta_ms
+            else:
+                regressed = change > threshold
+            if regressed:
+                regressions.append(row)
+
+    return rows, regressions
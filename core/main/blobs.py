@@ -0,0 +1,200 @@
+"""
+Счётчики ссылок на блобы ContentAddressedStorage, сборка мусора и
+перенос старых загрузок.
+
+Ссылка — значение файлового поля в строке модели. Сигналы
+(main/signals.py) меняют Blob.refcount при создании, изменении и
+удалении строк, bulk_create учитывается явно через add_references.
+queryset.update() и delete() без сигналов счётчики не видят, поэтому
+collect_garbage перед удалением пересчитывает их по базе: счётчик —
+быстрый фильтр кандидатов, а не единственный источник правды.
+"""
+import os
+import shutil
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Count, F, FileField
+from django.utils import timezone
+
+from user.backends import user_cache_key
+from .caching import invalidate_products
+from .models import Blob, Image, Product
+from .storage import ContentAddressedStorage, blob_name, file_digest, is_blob_name
+from .thumbnails import forget_variants, variant_names
+
+
+def blob_fields():
+    """[(модель, поле)] файловых полей, которые пишут в ContentAddressedStorage."""
+    return [
+        (model, field)
+        for model in apps.get_models()
+        for field in model._meta.concrete_fields
+        if isinstance(field, FileField) and isinstance(field.storage, ContentAddressedStorage)
+    ]
+
+
+def register_blob(name, size):
+    # Одним INSERT: параллельная загрузка того же файла могла создать строку первой
+    Blob.objects.bulk_create([Blob(name=name, size=size)], ignore_conflicts=True)
+
+
+def add_references(names, delta=1):
+    """Меняет счётчики на delta за каждое вхождение имени; одинаковые приращения — одним UPDATE."""
+    by_count = defaultdict(list)
+    for name, count in Counter(name for name in names if name and is_blob_name(name)).items():
+        by_count[count].append(name)
+    for count, batch in by_count.items():
+        Blob.objects.filter(name__in=batch).update(refcount=F('refcount') + count * delta)
+
+
+def count_references():
+    counts = Counter()
+    for model, field in blob_fields():
+        rows = (
+            model._default_manager.exclude(**{field.attname: ''})
+            .values_list(field.attname).annotate(count=Count('pk')).order_by()
+        )
+        for name, count in rows:
+            counts[name] += count
+    return counts
+
+
+def is_referenced(name):
+    return any(
+        model._default_manager.filter(**{field.attname: name}).exists()
+        for model, field in blob_fields()
+    )
+
+
+def recount():
+    """Сверяет Blob.refcount с базой, возвращает число исправленных строк."""
+    counts = count_references()
+    changed = []
+    for blob in Blob.objects.only('id', 'name', 'refcount').iterator(chunk_size=2000):
+        if blob.refcount != counts[blob.name]:
+            blob.refcount = counts[blob.name]
+            changed.append(blob)
+    Blob.objects.bulk_update(changed, ['refcount'], batch_size=500)
+    return len(changed)
+
+
+def delete_file(name):
+    """Удаляет файл с вариантами, возвращает число освобождённых байт."""
+    freed = 0
+    for path in (name, *variant_names(name)):
+        if default_storage.exists(path):
+            freed += default_storage.size(path)
+            default_storage.delete(path)
+    forget_variants(name)
+    return freed
+
+
+def collect_garbage(grace=None, dry_run=False):
+    """Удаляет блобы без ссылок старше grace секунд: загрузка ещё может ждать сохранения строки."""
+    grace = settings.MEDIA_BLOB_GC_GRACE if grace is None else grace
+    stats = {'recounted': recount(), 'deleted': 0, 'bytes_freed': 0}
+    candidates = Blob.objects.filter(refcount__lte=0, created_date__lt=timezone.now() - timedelta(seconds=grace))
+    for blob in candidates.iterator():
+        if dry_run:
+            stats['deleted'] += 1
+            stats['bytes_freed'] += blob.size
+            continue
+        with transaction.atomic():
+            # Ссылка могла появиться после пересчёта
+            unused = Blob.objects.filter(id=blob.id, refcount__lte=0).select_for_update().exists()
+            if not unused or is_referenced(blob.name):
+                continue
+            blob.delete()
+        stats['deleted'] += 1
+        stats['bytes_freed'] += delete_file(blob.name)
+    return stats
+
+
+def link_or_copy(source, target):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def replace_references(old, new):
+    """Заменяет имя файла во всех полях, возвращает {модель: [pk]} изменённых строк."""
+    changed = {}
+    for model, field in blob_fields():
+        rows = model._default_manager.filter(**{field.attname: old})
+        pks = list(rows.values_list('pk', flat=True))
+        if pks:
+            rows.update(**{field.attname: new})
+            changed.setdefault(model, []).extend(pks)
+    return changed
+
+
+def invalidate_cached(changed):
+    """Сбрасывает кеши, где лежат URL файлов: карточки продуктов и пользователь сессии."""
+    product_ids = set(changed.get(Product, []))
+    if changed.get(Image):
+        product_ids.update(
+            Product.images.through.objects.filter(image_id__in=changed[Image]).values_list('product_id', flat=True)
+        )
+    invalidate_products(product_ids)
+    user_model = get_user_model()
+    cache.delete_many([user_cache_key(pk) for pk in changed.get(user_model, [])])
+
+
+def migrate_legacy_files(dry_run=False):
+    """
+    Переносит файлы, сохранённые до ContentAddressedStorage, в блобы.
+    Блоб создаётся жёсткой ссылкой (или копией), затем в транзакции
+    меняются ссылки в базе, и только потом удаляется старый файл.
+    """
+    legacy = set()
+    for model, field in blob_fields():
+        names = model._default_manager.exclude(**{field.attname: ''}).values_list(field.attname, flat=True)
+        legacy.update(name for name in names.distinct() if not is_blob_name(name))
+
+    stats = Counter()
+    seen = set()
+    changed = defaultdict(list)
+    for old in sorted(legacy):
+        if not default_storage.exists(old):
+            stats['missing'] += 1
+            continue
+        with default_storage.open(old) as file:
+            new = blob_name(old, file_digest(file))
+        size = default_storage.size(old)
+        stats['files'] += 1
+        duplicate = new in seen or default_storage.exists(new)
+        seen.add(new)
+        if duplicate:
+            stats['duplicates'] += 1
+            stats['bytes_freed'] += size
+        if dry_run:
+            continue
+
+        moves = [(old, new)] + [
+            (old_variant, new_variant)
+            for old_variant, new_variant in zip(variant_names(old), variant_names(new))
+            if default_storage.exists(old_variant)
+        ]
+        for source, target in moves:
+            if not default_storage.exists(target):
+                link_or_copy(default_storage.path(source), default_storage.path(target))
+        with transaction.atomic():
+            register_blob(new, size)
+            for model, pks in replace_references(old, new).items():
+                changed[model].extend(pks)
+        for source, _ in moves:
+            default_storage.delete(source)
+
+    if not dry_run:
+        invalidate_cached(changed)
+        stats['recounted'] = recount()
+    return dict(stats)
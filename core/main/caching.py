@@ -0,0 +1,215 @@
+"""
+Кеш витрины: фрагменты главной и каталога, страницы продуктов для гостей.
+
+Каждая запись помечается версиями своих областей: CATALOG — всё, что
+видно в списках продуктов, CATEGORIES — список категорий,
+product_scope(id) — страница продукта.
+Сигналы (main/signals.py) меняют версии при изменении продуктов,
+отзывов, ответов, изображений, категорий и продавцов, и запись с
+устаревшими версиями считается просроченной. Версия начинается со
+времени изменения, из неё же main/conditional.py берёт Last-Modified. Версия меняется сразу и ещё раз после
+коммита, чтобы не пережила рендер, сделанный между ними.
+
+Защита от лавины: просроченную запись перерисовывает только запрос,
+взявший блокировку (cache.add), остальные в это время получают прежнее
+содержимое или, если его нет, ждут появления новой записи.
+"""
+import asyncio
+import hashlib
+import time
+import uuid
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+
+CATALOG = 'catalog'
+CATEGORIES = 'categories'
+KEY_PREFIX = 'storefront'
+# Подставляется вместо CSRF-токена в сохранённую страницу и заменяется при отдаче
+CSRF_PLACEHOLDER = 'CSRFTOKENPLACEHOLDER'
+
+
+def product_scope(product_id):
+    return f'product:{product_id}'
+
+
+def _version_key(scope):
+    return f'{KEY_PREFIX}:version:{scope}'
+
+
+def _new_version():
+    return f'{time.time():.6f}:{uuid.uuid4().hex}'
+
+
+def version_time(version):
+    """Когда версия была выдана."""
+    return datetime.fromtimestamp(float(version.partition(':')[0]), tz=timezone.utc)
+
+
+def get_versions(scopes):
+    keys = [_version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        # Версию могли вытеснить: новая не должна совпасть со старыми записями
+        for key in missing:
+            cache.add(key, _new_version(), None)
+        versions.update(cache.get_many(missing))
+    return tuple(versions.get(key) for key in keys)
+
+
+def _bump(scopes):
+    cache.set_many({_version_key(scope): _new_version() for scope in scopes}, None)
+
+
+def invalidate(scopes):
+    scopes = set(scopes)
+    if not scopes:
+        return
+    _bump(scopes)
+    transaction.on_commit(lambda: _bump(scopes))
+
+
+def invalidate_products(product_ids, catalog=True):
+    scopes = {product_scope(product_id) for product_id in product_ids}
+    if scopes and catalog:
+        scopes.add(CATALOG)
+    invalidate(scopes)
+
+
+def _entry_key(name, parts):
+    digest = hashlib.md5(repr(tuple(parts)).encode(), usedforsecurity=False).hexdigest()
+    return f'{KEY_PREFIX}:{name}:{digest}'
+
+
+def get_or_render(name, parts, scopes, render, timeout=None):
+    """
+    Возвращает сохранённое значение для (name, parts) или результат render().
+    Запись хранится как (версии, свежа_до, значение).
+    """
+    timeout = timeout or settings.STOREFRONT_CACHE_TIMEOUT
+    key = _entry_key(name, parts)
+    versions = get_versions(scopes)
+    entry = cache.get(key)
+    if entry is not None and entry[0] == versions and entry[1] > time.time():
+        return entry[2]
+
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, True, settings.STOREFRONT_CACHE_LOCK_TIMEOUT):
+        try:
+            value = render()
+            cache.set(key, (versions, time.time() + timeout, value), timeout + settings.STOREFRONT_CACHE_STALE)
+            return value
+        finally:
+            cache.delete(lock_key)
+
+    if entry is not None:
+        # Перерисовкой уже занят другой запрос
+        return entry[2]
+
+    deadline = time.time() + settings.STOREFRONT_CACHE_LOCK_TIMEOUT
+    while time.time() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None and entry[0] == versions:
+            return entry[2]
+    return render()
+
+
+async def aget_versions(scopes):
+    keys = [_version_key(scope) for scope in scopes]
+    versions = await cache.aget_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            await cache.aadd(key, _new_version(), None)
+        versions.update(await cache.aget_many(missing))
+    return tuple(versions.get(key) for key in keys)
+
+
+async def aget_or_render(name, parts, scopes, render, timeout=None):
+    """Асинхронный get_or_render: render — корутинная функция."""
+    timeout = timeout or settings.STOREFRONT_CACHE_TIMEOUT
+    key = _entry_key(name, parts)
+    versions = await aget_versions(scopes)
+    entry = await cache.aget(key)
+    if entry is not None and entry[0] == versions and entry[1] > time.time():
+        return entry[2]
+
+    lock_key = f'{key}:lock'
+    if await cache.aadd(lock_key, True, settings.STOREFRONT_CACHE_LOCK_TIMEOUT):
+        try:
+            value = await render()
+            await cache.aset(
+                key, (versions, time.time() + timeout, value), timeout + settings.STOREFRONT_CACHE_STALE
+            )
+            return value
+        finally:
+            await cache.adelete(lock_key)
+
+    if entry is not None:
+        return entry[2]
+
+    deadline = time.time() + settings.STOREFRONT_CACHE_LOCK_TIMEOUT
+    while time.time() < deadline:
+        await asyncio.sleep(0.05)
+        entry = await cache.aget(key)
+        if entry is not None and entry[0] == versions:
+            return entry[2]
+    return await render()
+
+
+def can_cache_page(request):
+    """Целиком кешируются только GET-страницы гостей без ожидающих сообщений."""
+    return (
+        request.method in ('GET', 'HEAD')
+        and not request.user.is_authenticated
+        and not len(messages.get_messages(request))
+    )
+
+
+def cached_page(request, name, parts, scopes, render):
+    """
+    render(extra_context) возвращает HttpResponse; сохраняются только ответы 200.
+    Строка запроса в ключ не входит: параметры, от которых зависит страница,
+    передаются в parts.
+    CSRF-токен в сохранённой странице заменяется на токен текущего посетителя.
+    """
+    def render_page():
+        response = render({'csrf_token': CSRF_PLACEHOLDER})
+        if response.status_code != 200:
+            raise _NotCacheable(response)
+        return response.content.decode(response.charset), response['Content-Type']
+
+    try:
+        content, content_type = get_or_render(name, parts, scopes, render_page)
+    except _NotCacheable as exc:
+        return exc.response
+
+    return HttpResponse(content.replace(CSRF_PLACEHOLDER, get_token(request)), content_type=content_type)
+
+
+async def acached_page(request, name, parts, scopes, render):
+    """Асинхронный cached_page: render(extra_context) — корутинная функция."""
+    async def render_page():
+        response = await render({'csrf_token': CSRF_PLACEHOLDER})
+        if response.status_code != 200:
+            raise _NotCacheable(response)
+        return response.content.decode(response.charset), response['Content-Type']
+
+    try:
+        content, content_type = await aget_or_render(name, parts, scopes, render_page)
+    except _NotCacheable as exc:
+        return exc.response
+
+    return HttpResponse(content.replace(CSRF_PLACEHOLDER, get_token(request)), content_type=content_type)
+
+
+class _NotCacheable(Exception):
+    def __init__(self, response):
+        self.response = response
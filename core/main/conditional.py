@@ -0,0 +1,112 @@
+"""
+Условные GET-запросы для витрины.
+
+Валидаторы считаются одним дешёвым запросом по индексам ещё до того, как
+вьюха выбирает продукты и рендерит шаблон: для страницы продукта — его
+updated_date и reviews_updated_date по первичному ключу, для списков —
+Max() этих полей и число активных продуктов (индексы is_active + дата).
+К ним добавляются версии областей кеша витрины (main/caching.py): их
+меняют и изменения, не трогающие даты продукта, — изображения,
+категории, пересчёт похожих, аватар и имя продавца. Если клиент или
+промежуточный кеш прислал совпадающий ETag или If-Modified-Since, сразу
+отдаётся 304.
+
+Шапка страницы зависит от пользователя, поэтому он входит в ETag, а
+страницы вошедших помечаются как private. При ожидающих сообщениях
+страница всегда рендерится, иначе сообщение потеряется.
+"""
+import hashlib
+from calendar import timegm
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.contrib import messages
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .caching import CATALOG, CATEGORIES, get_versions, product_scope, version_time
+from .models import Product
+
+
+def product_validators(request, product_id):
+    row = Product.objects.filter(id=product_id).values_list('updated_date', 'reviews_updated_date').first()
+    if row is None:
+        return None
+    versions = get_versions([product_scope(product_id), CATALOG])
+    return (product_id, *row, *versions), max(*row, *map(version_time, versions))
+
+
+def catalog_validators(request):
+    stats = Product.objects.filter(is_active=True).aggregate(
+        count=Count('id'),
+        updated=Max('updated_date'),
+        reviews_updated=Max('reviews_updated_date'),
+    )
+    if stats['updated'] is None:
+        return None
+    # Число продуктов меняется при удалении, даже если даты остались прежними;
+    # переименование категории видно только по версиям в кеше
+    versions = get_versions([CATALOG, CATEGORIES])
+    return (
+        (stats['count'], stats['updated'], stats['reviews_updated'], *versions),
+        max(stats['updated'], stats['reviews_updated'], *map(version_time, versions))
+    )
+
+
+def _prepare(validators, request, args, kwargs):
+    """Возвращает (etag, last_modified, готовый ответ или None) либо None без валидаторов."""
+    if request.method not in ('GET', 'HEAD') or len(messages.get_messages(request)):
+        return None
+
+    state = validators(request, *args, **kwargs)
+    if state is None:
+        return None
+
+    parts, last_modified = state
+    etag = quote_etag(hashlib.md5(
+        repr((*parts, request.user.pk, request.get_full_path())).encode(),
+        usedforsecurity=False
+    ).hexdigest())
+    last_modified = timegm(last_modified.utctimetuple())
+    return etag, last_modified, get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def _finish(request, response, etag, last_modified):
+    if response.status_code in (200, 304):
+        response.headers.setdefault('ETag', etag)
+        response.headers.setdefault('Last-Modified', http_date(last_modified))
+        patch_cache_control(response, no_cache=True, private=request.user.is_authenticated)
+        patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def conditional_page(validators):
+    """
+    validators(request, *args, **kwargs) возвращает (части ETag, last_modified)
+    или None, если условный ответ невозможен. Подходит и для async-вьюх.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                state = await sync_to_async(_prepare)(validators, request, args, kwargs)
+                if state is None:
+                    return await view(request, *args, **kwargs)
+                etag, last_modified, response = state
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return _finish(request, response, etag, last_modified)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            state = _prepare(validators, request, args, kwargs)
+            if state is None:
+                return view(request, *args, **kwargs)
+            etag, last_modified, response = state
+            if response is None:
+                response = view(request, *args, **kwargs)
+            return _finish(request, response, etag, last_modified)
+        return wrapper
+    return decorator
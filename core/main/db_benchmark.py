@@ -0,0 +1,197 @@
+"""
+Параллельные чтение и запись в базу при разных профилях соединений
+(core/database.py).
+
+Читатели открывают главную и страницу продукта (запросы из views.py),
+писатели принимают и возвращают в обработку заявки на оплату через
+bulk_update_status — как продавцы на payment_requests. У каждого
+писателя свои заявки, поэтому конфликтовать они могут только за
+блокировки базы.
+
+Для SQLite каждый профиль гоняется на своей копии текущей базы (через
+backup API), в исходной базе ничего не меняется. Для PostgreSQL копии
+нет: профили работают с основной базой, а транзакции писателей
+откатываются.
+"""
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+
+from core.database import postgresql_database, sqlite_database
+from .benchmark import BenchmarkDataError, percentile
+from .choices import OrderStatusEnum
+from .db_router import routing_context
+from .models import PaymentRequest, Product
+from .orders import BulkStatusError, bulk_update_status
+from .views import first_reviews_page, index_products, product_detail_queryset
+
+
+def copy_sqlite_database(path):
+    """Копия основной SQLite-базы в режиме журнала по умолчанию."""
+    source = connections[DEFAULT_DB_ALIAS]
+    source.ensure_connection()
+    target = sqlite3.connect(path)
+    try:
+        source.connection.backup(target)
+        # Копия наследует режим журнала; профиль сам включит WAL при подключении
+        target.execute('PRAGMA journal_mode=DELETE')
+    finally:
+        target.close()
+
+
+@contextmanager
+def profile_database(profile, workdir):
+    """
+    Подменяет настройки основной базы для новых потоков. Текущий поток
+    продолжает работать со своим соединением.
+    """
+    if connections[DEFAULT_DB_ALIAS].vendor == 'sqlite':
+        path = os.path.join(workdir, f'{profile}.sqlite3')
+        copy_sqlite_database(path)
+        config = sqlite_database(path, profile)
+    else:
+        config = postgresql_database(os.environ, profile)
+
+    original = connections.settings[DEFAULT_DB_ALIAS]
+    connections.settings[DEFAULT_DB_ALIAS] = connections.configure_settings({DEFAULT_DB_ALIAS: config})[
+        DEFAULT_DB_ALIAS
+    ]
+    try:
+        yield config
+    finally:
+        connections.settings[DEFAULT_DB_ALIAS] = original
+
+
+class Worker(threading.Thread):
+    def __init__(self, operation, duration, barrier):
+        super().__init__(daemon=True)
+        self.operation = operation
+        self.duration = duration
+        self.barrier = barrier
+        self.latencies = []
+        self.errors = []
+
+    def run(self):
+        # Все чтения — из основной базы, даже если настроены реплики
+        with routing_context(pinned=True):
+            try:
+                # Потоки стартуют одновременно
+                self.barrier.wait()
+                deadline = time.perf_counter() + self.duration
+                iteration = 0
+                while time.perf_counter() < deadline:
+                    started = time.perf_counter()
+                    try:
+                        self.operation(iteration)
+                    except (DatabaseError, BulkStatusError) as exc:
+                        self.errors.append(str(exc))
+                    else:
+                        self.latencies.append((time.perf_counter() - started) * 1000)
+                    iteration += 1
+            finally:
+                connections.close_all()
+
+
+def reader(product_ids):
+    def read(iteration):
+        list(index_products()[:settings.PAGINATION_PAGE_SIZE])
+        product = product_detail_queryset().get(id=random.choice(product_ids))
+        first_reviews_page(product.id)
+    return read
+
+
+def writer(request_ids, commit=True):
+    def write(iteration):
+        request_id = request_ids[iteration % len(request_ids)]
+        # Принять, затем вернуть в обработку, чтобы следующее принятие снова создало оплату
+        accept = iteration // len(request_ids) % 2 == 0
+        status = OrderStatusEnum.ACCEPTED if accept else OrderStatusEnum.IN_PROCESSING
+        with transaction.atomic():
+            bulk_update_status([request_id], status)
+            if not commit:
+                transaction.set_rollback(True)
+    return write
+
+
+def summary(workers, wall_time):
+    latencies = [latency for worker in workers for latency in worker.latencies]
+    errors = [error for worker in workers for error in worker.errors]
+    return {
+        'threads': len(workers),
+        'operations': len(latencies),
+        'throughput_ops': round(len(latencies) / wall_time, 2) if wall_time else None,
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+        'latency_ms': {
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'mean': round(float(np.mean(latencies)), 3) if latencies else None,
+        },
+    }
+
+
+def load_data(writers):
+    product_ids = list(Product.objects.filter(is_active=True).order_by('id').values_list('id', flat=True)[:500])
+    request_ids = list(
+        PaymentRequest.objects.filter(status=OrderStatusEnum.IN_PROCESSING)
+        .order_by('id').values_list('id', flat=True)[:writers * 20]
+    )
+    if not product_ids or len(request_ids) < writers:
+        raise BenchmarkDataError('Нужны активные продукты и заявки в обработке, сначала запустите generate_dataset')
+    # Каждому писателю свои заявки
+    return product_ids, [request_ids[index::writers] for index in range(writers)]
+
+
+def run_profile(profile, workdir, product_ids, request_chunks, readers, duration):
+    commit = connections[DEFAULT_DB_ALIAS].vendor == 'sqlite'
+    with profile_database(profile, workdir):
+        barrier = threading.Barrier(readers + len(request_chunks) + 1)
+        read_workers = [Worker(reader(product_ids), duration, barrier) for _ in range(readers)]
+        write_workers = [Worker(writer(chunk, commit), duration, barrier) for chunk in request_chunks]
+        workers = read_workers + write_workers
+
+        for worker in workers:
+            worker.start()
+        barrier.wait()
+        started = time.perf_counter()
+        for worker in workers:
+            worker.join()
+        wall_time = time.perf_counter() - started
+
+    return {
+        'reads': summary(read_workers, wall_time),
+        'writes': summary(write_workers, wall_time),
+    }
+
+
+def run_db_benchmark(profiles=('baseline', 'tuned'), readers=8, writers=2, duration=5.0):
+    product_ids, request_chunks = load_data(writers)
+    workdir = tempfile.mkdtemp(prefix='db_benchmark_')
+    try:
+        results = {
+            profile: run_profile(profile, workdir, product_ids, request_chunks, readers, duration)
+            for profile in profiles
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'meta': {
+            'database': connections[DEFAULT_DB_ALIAS].vendor,
+            'readers': readers,
+            'writers': writers,
+            'duration': duration,
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'profiles': results,
+    }
@@ -0,0 +1,92 @@
+"""
+Чтение с реплик, запись в основную базу.
+
+Реплики перечислены в settings.DATABASE_REPLICAS (алиасы DATABASES).
+Чтение идёт на случайную реплику, кроме случаев, когда в текущем
+контексте уже была запись или открыта транзакция на основной базе:
+тогда до конца запроса читается основная база, чтобы пользователь видел
+свои изменения. ReplicaRoutingMiddleware переносит это на следующие
+запросы через cookie на REPLICA_LAG_TOLERANCE секунд — столько реплика
+может отставать (например, продавец принял заявку и после редиректа
+видит её принятой).
+
+Для SQLite реплика — копия файла, sync_replicas обновляет её через
+backup API.
+"""
+import contextvars
+import random
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+PRIMARY = 'default'
+
+
+class RoutingState:
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.written = False
+
+
+_state = contextvars.ContextVar('main_db_routing_state', default=None)
+
+
+def get_state():
+    state = _state.get()
+    if state is None:
+        # Вне запроса (команды, оболочка) состояние живёт до конца контекста
+        state = RoutingState()
+        _state.set(state)
+    return state
+
+
+@contextmanager
+def routing_context(pinned=False):
+    """Отдельное состояние маршрутизации, например на один HTTP-запрос."""
+    state = RoutingState(pinned)
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or get_state().pinned or connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Связанные объекты читаются оттуда же, откуда сам объект
+            return instance._state.db
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = get_state()
+        state.pinned = state.written = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {PRIMARY, *settings.DATABASE_REPLICAS}
+        return obj1._state.db in aliases and obj2._state.db in aliases
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == PRIMARY
+
+
+def sync_sqlite_replicas(aliases=None):
+    """Копирует основную SQLite-базу в реплики. Возвращает список обновлённых алиасов."""
+    primary = connections[PRIMARY]
+    synced = []
+    for alias in aliases or settings.DATABASE_REPLICAS:
+        replica = connections[alias]
+        if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+            raise ValueError(f'{alias}: копирование поддерживается только для SQLite')
+        primary.ensure_connection()
+        replica.ensure_connection()
+        primary.connection.backup(replica.connection)
+        synced.append(alias)
+    return synced
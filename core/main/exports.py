@@ -0,0 +1,269 @@
+"""
+Выгрузка оплат и заявок на оплату для бухгалтера.
+
+Строки читаются через values_list(...).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+и сразу превращаются в байты для StreamingHttpResponse или файла, поэтому
+память не зависит от числа строк. Байты отдаются порциями примерно по
+EXPORT_BUFFER_SIZE.
+
+XLSX собирается без сторонних библиотек: zip пишется в поток по мере
+готовности строк (с дескрипторами данных, без seek), строки хранятся
+inline, без таблицы общих строк. Лист XLSX вмещает 1 048 576 строк —
+для больших выгрузок нужен CSV.
+"""
+import csv
+import io
+import zipfile
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.utils import timezone
+
+from .choices import OrderStatusEnum
+from .filters import PaymentExportFilter, PaymentRequestExportFilter
+from .models import Payment, PaymentRequest
+
+
+class ExportFilterError(Exception):
+    def __init__(self, errors):
+        super().__init__(errors.as_text())
+        self.errors = errors
+
+
+def format_datetime(value):
+    return timezone.localtime(value).strftime('%Y-%m-%d %H:%M:%S') if value else ''
+
+
+def format_status(value):
+    return OrderStatusEnum(value).label if value in OrderStatusEnum.values else value
+
+
+class Export:
+    """columns — (заголовок, поле для values_list, функция форматирования или None)."""
+
+    def __init__(self, name, title, model, filterset_class, columns):
+        self.name = name
+        self.title = title
+        self.model = model
+        self.filterset_class = filterset_class
+        self.columns = columns
+
+    @property
+    def headers(self):
+        return [header for header, _, _ in self.columns]
+
+    def queryset(self, data):
+        filterset = self.filterset_class(data, queryset=self.model.objects.order_by('id'))
+        if not filterset.is_valid():
+            raise ExportFilterError(filterset.errors)
+        return filterset.qs
+
+    def rows(self, queryset):
+        fields = [field for _, field, _ in self.columns]
+        formatters = [formatter for _, _, formatter in self.columns]
+        for values in queryset.values_list(*fields).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+            yield [
+                formatter(value) if formatter else value
+                for formatter, value in zip(formatters, values)
+            ]
+
+
+EXPORTS = {
+    export.name: export
+    for export in (
+        Export('payments', 'Оплаты', Payment, PaymentExportFilter, [
+            ('ID', 'id', None),
+            ('Продавец', 'seller__email', None),
+            ('Покупатель', 'user', None),
+            ('Продукт', 'product', None),
+            ('Количество', 'quantity', None),
+            ('Сумма', 'total_price', None),
+            ('Дата', 'created_date', format_datetime),
+        ]),
+        Export('payment_requests', 'Заявки на оплату', PaymentRequest, PaymentRequestExportFilter, [
+            ('ID', 'id', None),
+            ('Продавец', 'product__user__email', None),
+            ('Покупатель', 'user__email', None),
+            ('Продукт', 'product__title', None),
+            ('Количество', 'quantity', None),
+            ('Сумма', 'total_price', None),
+            ('Статус', 'status', format_status),
+            ('Дата создания', 'created_date', format_datetime),
+            ('Дата изменения', 'update_date', format_datetime),
+        ]),
+    )
+}
+
+
+class _Echo:
+    """Файл для csv.writer, который возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def csv_chunks(title, headers, rows):
+    writer = csv.writer(_Echo())
+    # BOM, чтобы Excel открыл кириллицу в UTF-8
+    lines = ['\ufeff' + writer.writerow(headers)]
+    size = 0
+    for row in rows:
+        line = writer.writerow(row)
+        lines.append(line)
+        size += len(line)
+        if size >= settings.EXPORT_BUFFER_SIZE:
+            yield ''.join(lines).encode()
+            lines, size = [], 0
+    yield ''.join(lines).encode()
+
+
+class _StreamBuffer(io.RawIOBase):
+    """Поток без seek для zipfile: записанное забирается через drain()."""
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks, self.size = [], 0
+        return data
+
+
+XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+XLSX_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{title}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/>'
+    '</Relationships>'
+)
+XLSX_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+    '</styleSheet>'
+)
+XLSX_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetViews><sheetView workbookViewId="0">'
+    '<pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/>'
+    '</sheetView></sheetViews>'
+    '<sheetData>'
+)
+XLSX_SHEET_END = '</sheetData></worksheet>'
+
+# Символы, недопустимые в XML 1.0
+_XML_ILLEGAL = dict.fromkeys(code for code in range(32) if code not in (9, 10, 13))
+
+
+def _column_letter(index):
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def _xlsx_row(number, values, columns, style=''):
+    cells = []
+    for column, value in zip(columns, values):
+        ref = f'{column}{number}'
+        if isinstance(value, bool) or value is None:
+            value = '' if value is None else str(value)
+        if isinstance(value, (int, float)):
+            cells.append(f'<c r="{ref}"{style}><v>{value}</v></c>')
+        else:
+            text = escape(str(value).translate(_XML_ILLEGAL))
+            cells.append(f'<c r="{ref}"{style} t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>')
+    return f'<row r="{number}">{"".join(cells)}</row>'
+
+
+def xlsx_chunks(title, headers, rows):
+    columns = [_column_letter(index) for index in range(len(headers))]
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', XLSX_CONTENT_TYPES)
+        archive.writestr('_rels/.rels', XLSX_ROOT_RELS)
+        archive.writestr('xl/workbook.xml', XLSX_WORKBOOK.format(title=escape(title[:31])))
+        archive.writestr('xl/_rels/workbook.xml.rels', XLSX_WORKBOOK_RELS)
+        archive.writestr('xl/styles.xml', XLSX_STYLES)
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write(XLSX_SHEET_START.encode())
+            sheet.write(_xlsx_row(1, headers, columns, style=' s="1"').encode())
+            for number, row in enumerate(rows, 2):
+                sheet.write(_xlsx_row(number, row, columns).encode())
+                if buffer.size >= settings.EXPORT_BUFFER_SIZE:
+                    yield buffer.drain()
+            sheet.write(XLSX_SHEET_END.encode())
+    yield buffer.drain()
+
+
+FORMATS = {
+    'csv': (csv_chunks, 'text/csv; charset=utf-8'),
+    'xlsx': (xlsx_chunks, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+
+def export_chunks(export, queryset, file_format):
+    """Генератор байтов файла выгрузки."""
+    write, _ = FORMATS[file_format]
+    return write(export.title, export.headers, export.rows(queryset))
+
+
+def export_filename(export, file_format):
+    return f'{export.name}-{timezone.localdate():%Y-%m-%d}.{file_format}'
@@ -0,0 +1,129 @@
+"""
+Фасеты каталога: число продуктов по категориям, ценовым диапазонам и
+рейтингу.
+
+Все три распределения считаются одним GROUP BY (категория, диапазон цены,
+полоса рейтинга) по отфильтрованному queryset и складываются в Python.
+Результат кешируется по нормализованному ключу фильтра: учитываются
+только очищенные формой значения, без сортировки и пагинации, поэтому
+?ordering=price и ?cursor=... используют ту же запись. Записи помечены
+областью CATALOG и устаревают вместе с фрагментами каталога.
+
+Список категорий для фильтра и фасетов тоже берётся из кеша (область
+CATEGORIES), а не запрашивается на каждый запрос.
+"""
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Case, Count, IntegerField, Value, When
+
+from .caching import CATALOG, CATEGORIES, aget_or_render, get_or_render
+from .models import Category
+
+# Параметры, которые не влияют на набор продуктов
+IGNORED_PARAMS = ('ordering',)
+RATING_BANDS = (4, 3, 2, 1)
+
+
+def load_categories():
+    return list(Category.objects.order_by('title', 'id').values_list('id', 'title'))
+
+
+def cached_categories():
+    """[(id, title)] всех категорий."""
+    return get_or_render('categories', [], [CATEGORIES], load_categories)
+
+
+def price_buckets():
+    """[(от, до)] по границам CATALOG_PRICE_BUCKETS; None — без ограничения."""
+    bounds = [Decimal(bound) for bound in settings.CATALOG_PRICE_BUCKETS]
+    return list(zip([None, *bounds], [*bounds, None]))
+
+
+def cleaned_filters(filterset):
+    # Как и filterset.qs, неверные значения просто не участвуют в фильтрации
+    filterset.is_valid()
+    return filterset.form.cleaned_data
+
+
+def facet_key(filterset):
+    return sorted(
+        (name, str(value))
+        for name, value in cleaned_filters(filterset).items()
+        if name not in IGNORED_PARAMS and value not in (None, '')
+    )
+
+
+def count_facets(queryset):
+    buckets = price_buckets()
+    rows = queryset.order_by().annotate(
+        price_bucket=Case(
+            *[When(price__lt=upper, then=Value(index)) for index, (_, upper) in enumerate(buckets[:-1])],
+            default=Value(len(buckets) - 1),
+            output_field=IntegerField(),
+        ),
+        rating_band=Case(
+            When(rating_count=0, then=Value(0)),
+            *[When(rating_score__gte=band, then=Value(band)) for band in RATING_BANDS],
+            default=Value(0),
+            output_field=IntegerField(),
+        ),
+    ).values('category_id', 'price_bucket', 'rating_band').annotate(count=Count('id'))
+
+    facets = {'total': 0, 'categories': {}, 'prices': [0] * len(buckets), 'ratings': dict.fromkeys(RATING_BANDS, 0)}
+    for row in rows:
+        count = row['count']
+        facets['total'] += count
+        facets['categories'][row['category_id']] = facets['categories'].get(row['category_id'], 0) + count
+        facets['prices'][row['price_bucket']] += count
+        # Полосы накопительные: «от 3» включает продукты с рейтингом 4 и выше
+        for band in RATING_BANDS:
+            if row['rating_band'] >= band:
+                facets['ratings'][band] += count
+    return facets
+
+
+def build_facets(filterset, counts):
+    """Данные для main/catalog_facets.html: подписи, числа и выбранные значения."""
+    data = cleaned_filters(filterset)
+    selected_category = int(data['category']) if data.get('category') else None
+    categories = [
+        {'id': category_id, 'title': title, 'count': counts['categories'].get(category_id, 0),
+         'active': category_id == selected_category}
+        for category_id, title in cached_categories()
+        if counts['categories'].get(category_id) or category_id == selected_category
+    ]
+
+    prices = []
+    for (lower, upper), count in zip(price_buckets(), counts['prices']):
+        if lower is None:
+            label = f'до {upper:g}'
+        elif upper is None:
+            label = f'от {lower:g}'
+        else:
+            label = f'{lower:g} – {upper:g}'
+        prices.append({
+            'gte': lower, 'lt': upper, 'label': label, 'count': count,
+            'active': (data.get('price__gte'), data.get('price__lt')) == (lower, upper),
+        })
+
+    ratings = [
+        {'band': band, 'count': counts['ratings'][band], 'active': data.get('rating__gte') == band}
+        for band in RATING_BANDS
+    ]
+    return {'total': counts['total'], 'categories': categories, 'prices': prices, 'ratings': ratings}
+
+
+def catalog_facets(filterset):
+    counts = get_or_render('catalog_facets', facet_key(filterset), [CATALOG], lambda: count_facets(filterset.qs))
+    return build_facets(filterset, counts)
+
+
+async def acatalog_facets(filterset):
+    # Валидация формы может прочитать категории из базы
+    key = await sync_to_async(facet_key)(filterset)
+    counts = await aget_or_render(
+        'catalog_facets', key, [CATALOG], sync_to_async(lambda: count_facets(filterset.qs))
+    )
+    return await sync_to_async(build_facets)(filterset, counts)
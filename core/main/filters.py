@@ -1,10 +1,57 @@
 import django_filters
-from .models import Product
+from django import forms
+
+from .choices import OrderStatusEnum
+from .facets import cached_categories
+from .models import Payment, PaymentRequest, Product
+from .search import search_products
 
 class ProductListFilter(django_filters.FilterSet):
+    product_search = django_filters.CharFilter(method='filter_search', label='Поиск')
+    # Категории из кеша, а не ModelChoiceFilter с запросом на каждую форму
+    category = django_filters.ChoiceFilter(choices=cached_categories, label='Категория')
     price__gte = django_filters.NumberFilter(field_name='price', lookup_expr='gte')
     price__lte = django_filters.NumberFilter(field_name='price', lookup_expr='lte')
+    price__lt = django_filters.NumberFilter(field_name='price', lookup_expr='lt', widget=forms.HiddenInput)
+    rating__gte = django_filters.NumberFilter(field_name='rating_score', lookup_expr='gte', label='Рейтинг от')
+    ordering = django_filters.OrderingFilter(
+        fields=(
+            ('price', 'price'),
+            ('rating_score', 'rating'),
+            ('rating_count', 'reviews'),
+        ),
+        field_labels={
+            'price': 'Цена',
+            'rating_score': 'Рейтинг',
+            'rating_count': 'Количество отзывов',
+        },
+        label='Сортировка'
+    )
 
     class Meta:
         model = Product
         fields = ('category', 'price')  # Только реальные поля модели
+
+    def filter_search(self, queryset, name, value):
+        return search_products(queryset, value)
+
+
+class PaymentExportFilter(django_filters.FilterSet):
+    seller = django_filters.NumberFilter(field_name='seller_id', label='Продавец')
+    date_from = django_filters.DateFilter(field_name='created_date', lookup_expr='date__gte', label='С даты')
+    date_to = django_filters.DateFilter(field_name='created_date', lookup_expr='date__lte', label='По дату')
+
+    class Meta:
+        model = Payment
+        fields = ()
+
+
+class PaymentRequestExportFilter(django_filters.FilterSet):
+    seller = django_filters.NumberFilter(field_name='product__user_id', label='Продавец')
+    date_from = django_filters.DateFilter(field_name='created_date', lookup_expr='date__gte', label='С даты')
+    date_to = django_filters.DateFilter(field_name='created_date', lookup_expr='date__lte', label='По дату')
+    status = django_filters.ChoiceFilter(choices=OrderStatusEnum.choices, label='Статус')
+
+    class Meta:
+        model = PaymentRequest
+        fields = ()
@@ -0,0 +1,114 @@
+"""
+Журнал выручки продавцов.
+
+SellerDailyRevenue хранит по каждому продавцу и дню количество оплат,
+товаров и сумму. Строки обновляются в той же транзакции, что и создание
+Payment, поэтому страница оплат читает итоги из нескольких строк вместо
+Sum по всем Payment продавца.
+"""
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import Payment, SellerDailyRevenue
+
+ROLLUP_FIELDS = ('payments_count', 'quantity', 'revenue')
+
+
+def _payment_day(payment):
+    return timezone.localdate(payment.created_date or timezone.now())
+
+
+def _group_by_day(payments):
+    rollups = defaultdict(lambda: dict.fromkeys(ROLLUP_FIELDS, 0))
+    for payment in payments:
+        totals = rollups[payment.seller_id, _payment_day(payment)]
+        totals['payments_count'] += 1
+        totals['quantity'] += payment.quantity
+        totals['revenue'] += payment.total_price
+    return rollups
+
+
+def _add_to_rollup(seller_id, date, totals):
+    updated = SellerDailyRevenue.objects.filter(seller_id=seller_id, date=date).update(
+        **{field: F(field) + totals[field] for field in ROLLUP_FIELDS}
+    )
+    if updated:
+        return
+
+    try:
+        with transaction.atomic():
+            SellerDailyRevenue.objects.create(seller_id=seller_id, date=date, **totals)
+    except IntegrityError:
+        # Строку за этот день успел создать параллельный запрос
+        _add_to_rollup(seller_id, date, totals)
+
+
+def record_payments(payments):
+    """Добавляет созданные оплаты в дневные итоги. Вызывать внутри транзакции."""
+    for (seller_id, date), totals in _group_by_day(payments).items():
+        _add_to_rollup(seller_id, date, totals)
+
+
+def seller_totals(seller):
+    return SellerDailyRevenue.objects.filter(seller=seller).aggregate(
+        payments_count=Sum('payments_count'),
+        quantity=Sum('quantity'),
+        revenue=Sum('revenue'),
+    )
+
+
+def _reconcile_seller(seller_id, chunk_size, fix):
+    payments = Payment.objects.filter(seller_id=seller_id).order_by().only(
+        'seller_id', 'created_date', 'quantity', 'total_price'
+    )
+    empty = dict.fromkeys(ROLLUP_FIELDS, 0)
+    mismatches = []
+    with transaction.atomic():
+        stored_rows = {
+            (row.seller_id, row.date): row
+            for row in SellerDailyRevenue.objects.filter(seller_id=seller_id).select_for_update()
+        }
+        # Оплаты суммируются после блокировки строк продавца: параллельная
+        # оплата либо уже видна здесь, либо ждёт блокировку и добавит свою
+        # сумму к исправленной строке. В SQLite транзакция IMMEDIATE
+        # (core/database.py) сама блокирует запись на всё время сверки.
+        actual = _group_by_day(payments.iterator(chunk_size=chunk_size))
+
+        for key in sorted(stored_rows.keys() | actual.keys()):
+            row = stored_rows.get(key)
+            stored = {field: getattr(row, field) for field in ROLLUP_FIELDS} if row else empty
+            expected = actual.get(key, empty)
+            if stored == expected:
+                continue
+
+            mismatches.append((*key, stored, expected))
+            if not fix:
+                continue
+            if row is None:
+                SellerDailyRevenue.objects.create(seller_id=key[0], date=key[1], **expected)
+            elif key not in actual:
+                row.delete()
+            else:
+                SellerDailyRevenue.objects.filter(pk=row.pk).update(**expected)
+    return mismatches
+
+
+def reconcile(seller_ids=None, chunk_size=2000, fix=True):
+    """
+    Пересчитывает дневные итоги из Payment по одному продавцу в
+    транзакции, читая оплаты потоком по chunk_size строк. Возвращает
+    список (seller_id, date, stored, actual) для расхождений; при fix=True
+    расхождения исправляются.
+    """
+    if seller_ids is None:
+        seller_ids = set(Payment.objects.values_list('seller_id', flat=True).distinct()) | set(
+            SellerDailyRevenue.objects.values_list('seller_id', flat=True).distinct()
+        )
+
+    mismatches = []
+    for seller_id in sorted(seller_ids):
+        mismatches += _reconcile_seller(seller_id, chunk_size, fix)
+    return mismatches
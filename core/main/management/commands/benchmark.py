@@ -0,0 +1,88 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.benchmark import BenchmarkDataError, build_routes, compare, run_benchmark, url_names
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогоняет все маршруты через тестовый клиент и сохраняет p50/p95/p99, '
+        'пропускную способность, число запросов и пиковую память в JSON. '
+        'С --compare сравнивает два прогона и завершается ошибкой при регрессии'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--route', action='append', dest='routes', help='Только указанные маршруты')
+        parser.add_argument('--iterations', type=int, default=50, help='Запросов на маршрут')
+        parser.add_argument('--concurrency', type=int, default=1, help='Число потоков')
+        parser.add_argument('--warmup', type=int, default=2, help='Прогревочных запросов на поток')
+        parser.add_argument(
+            '--asgi',
+            action='store_true',
+            help='Запросы через ASGI-обработчик; с ASYNC_VIEWS=1 — async-варианты вьюх',
+        )
+        parser.add_argument('--password', default='password', help='Пароль продавца для маршрута login')
+        parser.add_argument('--output', help='Файл для результата, по умолчанию stdout')
+        parser.add_argument(
+            '--compare',
+            nargs=2,
+            metavar=('BASE', 'NEW'),
+            help='Сравнить два JSON-файла с результатами',
+        )
+        parser.add_argument('--threshold', type=float, default=10.0, help='Допустимый рост, %%')
+        parser.add_argument('--min-delta-ms', type=float, default=1.0, help='Допустимый рост времени, мс')
+
+    def handle(self, *args, **options):
+        if options['compare']:
+            return self.compare(*options['compare'], options['threshold'], options['min_delta_ms'])
+
+        try:
+            routes = build_routes(password=options['password'])
+        except BenchmarkDataError as exc:
+            raise CommandError(str(exc))
+
+        missing = url_names() - routes.keys()
+        if missing:
+            raise CommandError(f'Нет сценария для маршрутов: {", ".join(sorted(missing))}')
+
+        if options['routes']:
+            unknown = set(options['routes']) - routes.keys()
+            if unknown:
+                raise CommandError(f'Неизвестные маршруты: {", ".join(sorted(unknown))}')
+            routes = {url_name: routes[url_name] for url_name in options['routes']}
+
+        result = run_benchmark(
+            routes, options['iterations'], options['concurrency'], options['warmup'], asgi=options['asgi']
+        )
+        output = json.dumps(result, ensure_ascii=False, indent=2)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
+
+        for url_name, stats in result['routes'].items():
+            latency = stats['latency_ms']
+            self.stderr.write(
+                f'{url_name:<36} p50 {latency["p50"]:>8} мс  p95 {latency["p95"]:>8} мс  '
+                f'p99 {latency["p99"]:>8} мс  {stats["throughput_rps"]:>8} rps  '
+                f'{stats["queries"]["max"]:>3} запросов  ошибок {stats["errors"]}'
+            )
+
+    def compare(self, base_path, new_path, threshold, min_delta_ms):
+        with open(base_path, encoding='utf-8') as base_file, open(new_path, encoding='utf-8') as new_file:
+            rows, regressions = compare(json.load(base_file), json.load(new_file), threshold, min_delta_ms)
+
+        for url_name, metric, before, after, change in rows:
+            if change is None:
+                self.stdout.write(f'{url_name:<36} есть только в {"BASE" if before else "NEW"}')
+                continue
+            line = f'{url_name:<36} {metric:<16} {before:>10} -> {after:<10} {change:+.1f}%'
+            regressed = (url_name, metric, before, after, change) in regressions
+            self.stdout.write(self.style.ERROR(line) if regressed else line)
+
+        if regressions:
+            raise CommandError(f'Регрессий: {len(regressions)}')
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
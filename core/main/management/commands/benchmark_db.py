@@ -0,0 +1,58 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.database import PROFILES
+from main.benchmark import BenchmarkDataError
+from main.db_benchmark import run_db_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Параллельные чтение и запись с профилями соединений baseline и tuned: '
+        'пропускная способность, p50/p95/p99 и число ошибок «database is locked»'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--profile',
+            action='append',
+            dest='profiles',
+            choices=PROFILES,
+            help='Только указанные профили, по умолчанию baseline и tuned',
+        )
+        parser.add_argument('--readers', type=int, default=8, help='Потоков чтения')
+        parser.add_argument('--writers', type=int, default=2, help='Потоков записи')
+        parser.add_argument('--duration', type=float, default=5.0, help='Секунд на профиль')
+        parser.add_argument('--output', help='Файл для результата, по умолчанию stdout')
+
+    def handle(self, *args, **options):
+        if options['readers'] < 0 or options['writers'] < 1:
+            raise CommandError('Нужен хотя бы один поток записи')
+
+        try:
+            result = run_db_benchmark(
+                options['profiles'] or ('baseline', 'tuned'),
+                options['readers'],
+                options['writers'],
+                options['duration'],
+            )
+        except BenchmarkDataError as exc:
+            raise CommandError(str(exc))
+        output = json.dumps(result, ensure_ascii=False, indent=2)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
+
+        for profile, stats in result['profiles'].items():
+            for kind in ('reads', 'writes'):
+                kind_stats = stats[kind]
+                latency = kind_stats['latency_ms']
+                self.stderr.write(
+                    f'{profile:<9} {kind:<7} {kind_stats["throughput_ops"]:>9} оп/с  '
+                    f'p50 {latency["p50"]} мс  p95 {latency["p95"]} мс  p99 {latency["p99"]} мс  '
+                    f'ошибок {kind_stats["errors"]}'
+                )
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from main.blobs import migrate_legacy_files
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит загрузки, сохранённые до хранилища по содержимому, в блобы: '
+        'одинаковые файлы остаются в одном экземпляре, ссылки в базе обновляются'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать, ничего не менять')
+
+    def handle(self, *args, dry_run=False, **options):
+        stats = migrate_legacy_files(dry_run=dry_run)
+        self.stdout.write(
+            f"Файлов: {stats.get('files', 0)}, дубликатов: {stats.get('duplicates', 0)}, "
+            f"освобождено: {stats.get('bytes_freed', 0)} байт, не найдено на диске: {stats.get('missing', 0)}"
+        )
+        if not dry_run:
+            self.stdout.write(self.style.SUCCESS(f"Исправлено счётчиков ссылок: {stats.get('recounted', 0)}"))
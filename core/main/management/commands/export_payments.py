@@ -0,0 +1,73 @@
+import calendar
+import gzip
+import os
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.choices import OrderStatusEnum
+from main.exports import EXPORTS, FORMATS, ExportFilterError, export_chunks
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает оплаты или заявки на оплату в файл для закрытия месяца. '
+        'CSV сжимается gzip, XLSX уже является zip-архивом'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS), help='Что выгружать')
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv', dest='file_format')
+        parser.add_argument('--month', help='Месяц YYYY-MM, задаёт --date-from и --date-to')
+        parser.add_argument('--date-from', help='С даты YYYY-MM-DD включительно')
+        parser.add_argument('--date-to', help='По дату YYYY-MM-DD включительно')
+        parser.add_argument('--seller', type=int, help='ID продавца')
+        parser.add_argument(
+            '--status',
+            choices=OrderStatusEnum.values,
+            help='Статус заявки (только для payment_requests)',
+        )
+        parser.add_argument('--output', help='Путь к файлу, по умолчанию <kind>-<месяц или дата>.<формат>[.gz]')
+
+    def handle(self, *args, kind, file_format, month=None, output=None, **options):
+        export = EXPORTS[kind]
+        data = {
+            'seller': options['seller'],
+            'date_from': options['date_from'],
+            'date_to': options['date_to'],
+            'status': options['status'],
+        }
+        if month:
+            try:
+                year, month_number = map(int, month.split('-'))
+                last_day = calendar.monthrange(year, month_number)[1]
+            except ValueError:
+                raise CommandError(f'Неверный месяц: {month}, нужен YYYY-MM')
+            data['date_from'] = date(year, month_number, 1).isoformat()
+            data['date_to'] = date(year, month_number, last_day).isoformat()
+
+        if data['status'] and kind != 'payment_requests':
+            raise CommandError('--status есть только у payment_requests')
+
+        try:
+            queryset = export.queryset({key: value for key, value in data.items() if value is not None})
+        except ExportFilterError as exc:
+            raise CommandError(str(exc))
+
+        compress = file_format == 'csv'
+        if output is None:
+            output = f'{kind}-{month or date.today().isoformat()}.{file_format}' + ('.gz' if compress else '')
+
+        # Файл появляется под своим именем только целиком
+        partial = f'{output}.part'
+        opener = gzip.open if compress else open
+        try:
+            with opener(partial, 'wb') as file:
+                for chunk in export_chunks(export, queryset, file_format):
+                    file.write(chunk)
+            os.replace(partial, output)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+
+        self.stdout.write(self.style.SUCCESS(f'{output}: {os.path.getsize(output)} байт'))
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main.blobs import collect_garbage
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает ссылки на файлы хранилища и удаляет файлы, на которые никто не ссылается'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать, ничего не удалять')
+        parser.add_argument(
+            '--grace',
+            type=int,
+            default=settings.MEDIA_BLOB_GC_GRACE,
+            help='Не удалять файлы моложе стольких секунд',
+        )
+
+    def handle(self, *args, dry_run=False, grace=None, **options):
+        stats = collect_garbage(grace=grace, dry_run=dry_run)
+        self.stdout.write(self.style.SUCCESS(
+            f"Исправлено счётчиков: {stats['recounted']}, удалено файлов: {stats['deleted']}, "
+            f"освобождено: {stats['bytes_freed']} байт"
+        ))
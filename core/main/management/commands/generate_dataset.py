@@ -0,0 +1,397 @@
+import io
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+from django.utils import timezone
+
+from main.caching import CATALOG, invalidate
+from main.choices import OrderStatusEnum
+from main.ledger import reconcile
+from main.models import (
+    Category, Image, Payment, PaymentMethod, PaymentRequest, Product, Rating, RatingAnswer
+)
+from main.recommendations import refresh_similar_products
+from user.choices import UserRoleEnum
+
+User = get_user_model()
+
+WORDS = (
+    'игра', 'книга', 'ключ', 'аккаунт', 'скин', 'подписка', 'набор', 'коллекция', 'издание',
+    'премиум', 'стандарт', 'делюкс', 'редкий', 'новый', 'золотой', 'legend', 'ultimate', 'pro',
+    'steam', 'mobile', 'сервер', 'оружие', 'броня', 'кейс', 'валюта', 'бонус', 'пропуск',
+)
+RATING_PROBABILITIES = (0.05, 0.05, 0.15, 0.35, 0.40)
+PLACEHOLDER_COLORS = ((200, 60, 60), (60, 160, 80), (50, 90, 200), (230, 180, 40), (120, 120, 120))
+PLACEHOLDER_FIELDS = {
+    'main_covers': Product._meta.get_field('main_image'),
+    'product_file': Image._meta.get_field('file'),
+    'qr': PaymentMethod._meta.get_field('qr_image'),
+    'check': PaymentRequest._meta.get_field('check_image'),
+}
+STATUS_PROBABILITIES = {
+    OrderStatusEnum.ACCEPTED: 0.6,
+    OrderStatusEnum.IN_PROCESSING: 0.25,
+    OrderStatusEnum.DENIED: 0.15,
+}
+
+
+@contextmanager
+def manual_dates(*model_classes):
+    """Отключает auto_now/auto_now_add, чтобы сохранить сгенерированные даты."""
+    fields = [
+        field for model in model_classes for field in model._meta.concrete_fields
+        if isinstance(field, models.DateTimeField) and (field.auto_now or field.auto_now_add)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = (
+        'Генерирует воспроизводимый синтетический набор данных: пользователи, продукты, '
+        'отзывы, заявки и оплаты с распределением Ципфа для популярных продуктов и продавцов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10_000)
+        parser.add_argument('--sellers-ratio', type=float, default=0.1)
+        parser.add_argument('--categories', type=int, default=30)
+        parser.add_argument('--products', type=int, default=50_000)
+        parser.add_argument('--images-per-product', type=int, default=3)
+        parser.add_argument('--ratings', type=int, default=200_000)
+        parser.add_argument('--answers-ratio', type=float, default=0.3)
+        parser.add_argument('--payment-methods', type=int, default=2, help='Способов оплаты на продавца')
+        parser.add_argument('--payment-requests', type=int, default=100_000)
+        parser.add_argument('--zipf', type=float, default=1.1, help='Показатель распределения Ципфа')
+        parser.add_argument('--days', type=int, default=365, help='За сколько дней распределить даты')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5_000)
+        parser.add_argument(
+            '--skip-derived',
+            action='store_true',
+            help=(
+                'Не пересчитывать дневную выручку и похожие продукты: они останутся '
+                'пустыми до reconcile_revenue и rebuild_similar_products'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.rng = np.random.default_rng(options['seed'])
+        self.now = timezone.now()
+        self.batch_size = options['batch_size']
+        self.prefix = f'synthetic{options["seed"]}'
+
+        if User.objects.filter(email__startswith=f'{self.prefix}-').exists():
+            raise CommandError(f'Данные с seed={options["seed"]} уже созданы, укажите другой --seed')
+
+        started = time.monotonic()
+        with manual_dates(User, Rating, RatingAnswer, PaymentMethod, PaymentRequest, Payment):
+            placeholders = self.create_placeholders()
+            users = self.create_users()
+            sellers = users[:max(1, int(len(users) * options['sellers_ratio']))]
+            categories = self.create_categories()
+            products, product_sellers, product_prices = self.create_products(sellers, categories, placeholders)
+            self.create_payment_methods(sellers, placeholders)
+            self.create_ratings(users, products, product_sellers)
+            self.create_payment_requests(users, products, product_sellers, product_prices, placeholders)
+
+        self.rebuild_derived(skip=options['skip_derived'])
+        # bulk_create не вызывает сигналы, которые сбрасывают кеш витрины
+        invalidate([CATALOG])
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Готово за {elapsed:.1f} с'))
+
+    # Распределения
+
+    def zipf_choice(self, values, size):
+        """Выбор с весами 1/rank^s; ранги случайно перемешаны, чтобы популярные не были подряд."""
+        ranks = self.rng.permutation(len(values)) + 1
+        weights = ranks.astype(np.float64) ** -self.options['zipf']
+        return values[self.rng.choice(len(values), size=size, p=weights / weights.sum())]
+
+    def random_dates(self, size):
+        seconds = self.rng.integers(0, self.options['days'] * 24 * 60 * 60, size=size)
+        return [self.now - timedelta(seconds=int(value)) for value in seconds]
+
+    def random_titles(self, size, words=3):
+        picked = self.rng.choice(len(WORDS), size=(size, words))
+        return [' '.join(WORDS[index] for index in row).capitalize() for row in picked]
+
+    # Вставка
+
+    def insert(self, model, total, build_batch, manager=None):
+        """
+        build_batch(start, stop) возвращает объекты для строк [start, stop).
+        Каждая пачка вставляется в своей транзакции. Возвращает id новых строк.
+        """
+        manager = manager or model._default_manager
+        label = model._meta.verbose_name_plural
+        last_id = manager.order_by('-id').values_list('id', flat=True).first() or 0
+        started = time.monotonic()
+
+        for start in range(0, total, self.batch_size):
+            stop = min(start + self.batch_size, total)
+            with transaction.atomic():
+                manager.bulk_create(build_batch(start, stop), batch_size=self.batch_size)
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'\r{label}: {stop}/{total} ({stop / max(elapsed, 1e-6):,.0f} строк/с)',
+                ending=''
+            )
+            self.stdout.flush()
+
+        self.stdout.write('')
+        return np.array(
+            manager.filter(id__gt=last_id).order_by('id').values_list('id', flat=True),
+            dtype=np.int64
+        )
+
+    def create_placeholders(self):
+        """
+        Картинки одинаковы при каждом запуске, поэтому хранилище по
+        содержимому отдаёт уже сохранённые блобы, а не пишет новые файлы.
+        """
+        from PIL import Image as PillowImage
+
+        names = {}
+        for key, field in PLACEHOLDER_FIELDS.items():
+            names[key] = []
+            for color in PLACEHOLDER_COLORS:
+                buffer = io.BytesIO()
+                PillowImage.new('RGB', (640, 480), color).save(buffer, format='JPEG')
+                # Каталог из upload_to: чеки остаются в закрытом каталоге
+                name = field.generate_filename(None, 'placeholder.jpg')
+                names[key].append(default_storage.save(name, ContentFile(buffer.getvalue())))
+        return names
+
+    def create_users(self):
+        password = make_password('password')
+        total = self.options['users']
+        dates = self.random_dates(total)
+
+        def build(start, stop):
+            return [
+                User(
+                    email=f'{self.prefix}-{index}@example.com',
+                    first_name=f'Пользователь {index}',
+                    phone_number=f'0700{index:08d}',
+                    password=password,
+                    # Последний пользователь — бухгалтер, для выгрузок и benchmark
+                    role=UserRoleEnum.ACCOUNTANT if index == total - 1 else UserRoleEnum.USER,
+                    created_date=dates[index],
+                )
+                for index in range(start, stop)
+            ]
+
+        return self.insert(User, total, build)
+
+    def create_categories(self):
+        total = self.options['categories']
+        titles = self.random_titles(total, words=1)
+        return self.insert(
+            Category,
+            total,
+            lambda start, stop: [
+                Category(title=f'{titles[index]} {index}') for index in range(start, stop)
+            ]
+        )
+
+    def create_products(self, sellers, categories, placeholders):
+        total = self.options['products']
+        owners = self.zipf_choice(sellers, total)
+        product_categories = self.zipf_choice(categories, total)
+        prices = np.round(self.rng.lognormal(mean=6, sigma=1.2, size=total), 2).clip(1, 999_999)
+        titles = self.random_titles(total)
+        descriptions = self.random_titles(total, words=12)
+        covers = placeholders['main_covers']
+
+        product_ids = self.insert(
+            Product,
+            total,
+            lambda start, stop: [
+                Product(
+                    user_id=int(owners[index]),
+                    category_id=int(product_categories[index]),
+                    title=titles[index],
+                    description=descriptions[index],
+                    main_image=covers[index % len(covers)],
+                    price=float(prices[index]),
+                )
+                for index in range(start, stop)
+            ]
+        )
+
+        per_product = min(self.options['images_per_product'], len(placeholders['product_file']))
+        if per_product:
+            files = placeholders['product_file']
+            image_ids = self.insert(
+                Image,
+                len(files),
+                lambda start, stop: [Image(file=files[index]) for index in range(start, stop)]
+            )
+            through = Product.images.through
+            self.insert(
+                through,
+                total * per_product,
+                lambda start, stop: [
+                    through(
+                        product_id=int(product_ids[index // per_product]),
+                        image_id=int(image_ids[(index % per_product + index // per_product) % len(image_ids)])
+                    )
+                    for index in range(start, stop)
+                ]
+            )
+
+        return product_ids, owners, prices
+
+    def create_payment_methods(self, sellers, placeholders):
+        per_seller = self.options['payment_methods']
+        total = len(sellers) * per_seller
+        dates = self.random_dates(total)
+        qr_images = placeholders['qr']
+        self.insert(
+            PaymentMethod,
+            total,
+            lambda start, stop: [
+                PaymentMethod(
+                    user_id=int(sellers[index // per_seller]),
+                    title=('MBank', 'Optima', 'O!Деньги', 'Элсом')[index % 4],
+                    qr_image=qr_images[index % len(qr_images)],
+                    created_date=dates[index],
+                )
+                for index in range(start, stop)
+            ]
+        )
+
+    def create_ratings(self, users, products, product_sellers):
+        total = self.options['ratings']
+        chosen = self.rng.choice(len(products), size=total, p=self._product_popularity(len(products)))
+        authors = users[self.rng.integers(0, len(users), size=total)]
+        counts = self.rng.choice(5, size=total, p=RATING_PROBABILITIES) + 1
+        dates = self.random_dates(total)
+        comments = self.random_titles(total, words=8)
+
+        # Статистика продуктов пересчитывается один раз в конце, а не на каждую пачку
+        raw_ratings = models.QuerySet(Rating)
+        rating_ids = self.insert(
+            Rating,
+            total,
+            lambda start, stop: [
+                Rating(
+                    user_id=int(authors[index]),
+                    product_id=int(products[chosen[index]]),
+                    count=int(counts[index]),
+                    comment=comments[index],
+                    created_date=dates[index],
+                )
+                for index in range(start, stop)
+            ],
+            manager=raw_ratings
+        )
+
+        answered = np.flatnonzero(self.rng.random(total) < self.options['answers_ratio'])
+        answer_texts = self.random_titles(len(answered), words=6)
+        self.insert(
+            RatingAnswer,
+            len(answered),
+            lambda start, stop: [
+                RatingAnswer(
+                    user_id=int(product_sellers[chosen[answered[index]]]),
+                    rating_id=int(rating_ids[answered[index]]),
+                    comment=answer_texts[index],
+                    created_date=dates[answered[index]] + timedelta(hours=1),
+                    update_date=dates[answered[index]] + timedelta(hours=1),
+                )
+                for index in range(start, stop)
+            ]
+        )
+
+    def create_payment_requests(self, users, products, product_sellers, product_prices, placeholders):
+        total = self.options['payment_requests']
+        chosen = self.rng.choice(len(products), size=total, p=self._product_popularity(len(products)))
+        buyers = users[self.rng.integers(0, len(users), size=total)]
+        quantities = self.rng.integers(1, 4, size=total)
+        statuses = self.rng.choice(
+            list(STATUS_PROBABILITIES), size=total, p=list(STATUS_PROBABILITIES.values())
+        )
+        dates = self.random_dates(total)
+        checks = placeholders['check']
+
+        def total_price(index):
+            return int(quantities[index] * product_prices[chosen[index]])
+
+        self.insert(
+            PaymentRequest,
+            total,
+            lambda start, stop: [
+                PaymentRequest(
+                    user_id=int(buyers[index]),
+                    product_id=int(products[chosen[index]]),
+                    quantity=int(quantities[index]),
+                    check_image=checks[index % len(checks)],
+                    total_price=total_price(index),
+                    status=str(statuses[index]),
+                    created_date=dates[index],
+                    update_date=dates[index],
+                )
+                for index in range(start, stop)
+            ]
+        )
+
+        accepted = np.flatnonzero(statuses == OrderStatusEnum.ACCEPTED)
+        buyer_names = dict(User.objects.filter(id__in=set(buyers[accepted].tolist())).values_list('id', 'first_name'))
+        product_titles = dict(
+            Product.objects.filter(id__in=set(products[chosen[accepted]].tolist())).values_list('id', 'title')
+        )
+        self.insert(
+            Payment,
+            len(accepted),
+            lambda start, stop: [
+                Payment(
+                    seller_id=int(product_sellers[chosen[index]]),
+                    user=buyer_names[int(buyers[index])],
+                    product=product_titles[int(products[chosen[index]])],
+                    quantity=int(quantities[index]),
+                    check_image=checks[index % len(checks)],
+                    total_price=total_price(index),
+                    created_date=dates[index],
+                )
+                for index in accepted[start:stop]
+            ]
+        )
+
+    def _product_popularity(self, size):
+        if not hasattr(self, '_popularity'):
+            ranks = self.rng.permutation(size) + 1
+            weights = ranks.astype(np.float64) ** -self.options['zipf']
+            self._popularity = weights / weights.sum()
+        return self._popularity
+
+    def rebuild_derived(self, skip=False):
+        # Отзывы вставлены в обход сигналов; без статистики в каталоге были бы пустые рейтинги
+        steps = [('Статистика отзывов', lambda: Product.rebuild_rating_stats())]
+        if not skip:
+            steps += [
+                ('Дневная выручка', lambda: reconcile()),
+                ('Похожие продукты', lambda: refresh_similar_products()),
+            ]
+        for label, step in steps:
+            started = time.monotonic()
+            step()
+            self.stdout.write(f'{label}: {time.monotonic() - started:.1f} с')
@@ -0,0 +1,65 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main.signals import IMAGE_FIELDS
+from main.thumbnails import generate_variants, remember_variants
+
+
+class Command(BaseCommand):
+    help = 'Создаёт уменьшенные варианты для уже загруженных изображений'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Пересоздать варианты, даже если они уже есть',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.IMAGE_VARIANT_WORKERS,
+        )
+
+    def iter_names(self):
+        seen = set()
+        for model, field_names in IMAGE_FIELDS.items():
+            for field_name in field_names:
+                names = (
+                    model._default_manager.exclude(**{field_name: ''})
+                    .exclude(**{f'{field_name}__isnull': True})
+                    .values_list(field_name, flat=True)
+                    .iterator()
+                )
+                for name in names:
+                    if name not in seen:
+                        seen.add(name)
+                        yield name
+
+    def handle(self, *args, force=False, workers=1, **options):
+        created = failed = 0
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for name in self.iter_names():
+                try:
+                    future = generate_variants(name, force=force, executor=executor)
+                except OSError as exc:
+                    self.stderr.write(f'{name}: {exc}')
+                    failed += 1
+                    continue
+                if future is None:
+                    remember_variants(name, True)
+                else:
+                    futures[future] = name
+
+            for future in as_completed(futures):
+                try:
+                    created += len(future.result())
+                except Exception as exc:
+                    self.stderr.write(f'{futures[future]}: {exc}')
+                    failed += 1
+                else:
+                    remember_variants(futures[future], True)
+
+        self.stdout.write(self.style.SUCCESS(f'Создано вариантов: {created}, ошибок: {failed}'))
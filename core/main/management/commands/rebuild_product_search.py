@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main.search import fts_supported, rebuild_product_fts
+
+
+class Command(BaseCommand):
+    help = 'Пересоздаёт полнотекстовый индекс продуктов (SQLite FTS5)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, database='default', **options):
+        if not fts_supported(database):
+            raise CommandError('FTS5 недоступен, поиск работает через icontains')
+
+        indexed = rebuild_product_fts(database)
+        self.stdout.write(self.style.SUCCESS(f'Проиндексировано продуктов: {indexed}'))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from main.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает статистику отзывов продуктов и показывает расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только проверить расхождения, ничего не сохраняя',
+        )
+        parser.add_argument(
+            '--product',
+            type=int,
+            action='append',
+            dest='product_ids',
+            help='Пересчитать только указанные продукты (можно несколько раз)',
+        )
+
+    def handle(self, *args, check=False, product_ids=None, **options):
+        with transaction.atomic():
+            drifted = Product.rebuild_rating_stats(product_ids)
+            if check:
+                transaction.set_rollback(True)
+
+        for product_id, stored, actual in drifted:
+            self.stdout.write(f'Продукт {product_id}: сохранено {stored}, фактически {actual}')
+
+        if check and drifted:
+            raise CommandError(f'Найдено расхождений: {len(drifted)}')
+
+        action = 'Найдено' if check else 'Исправлено'
+        self.stdout.write(self.style.SUCCESS(f'{action} расхождений: {len(drifted)}'))
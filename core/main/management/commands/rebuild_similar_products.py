@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.recommendations import refresh_similar_products
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает похожие продукты для всех (или указанных) продуктов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--product',
+            type=int,
+            action='append',
+            dest='product_ids',
+            help='Пересчитать только указанные продукты (можно несколько раз)',
+        )
+        parser.add_argument('--batch-size', type=int, default=256)
+
+    def handle(self, *args, product_ids=None, batch_size=256, **options):
+        started = time.monotonic()
+        processed = refresh_similar_products(product_ids, batch_size=batch_size)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Обработано продуктов: {processed} за {elapsed:.1f} с'))
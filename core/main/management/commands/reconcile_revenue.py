@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main.ledger import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает дневную выручку продавцов из Payment и показывает расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только проверить расхождения, ничего не сохраняя',
+        )
+        parser.add_argument(
+            '--seller',
+            type=int,
+            action='append',
+            dest='seller_ids',
+            help='Проверить только указанных продавцов (можно несколько раз)',
+        )
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, check=False, seller_ids=None, chunk_size=2000, **options):
+        mismatches = reconcile(seller_ids, chunk_size=chunk_size, fix=not check)
+
+        for seller_id, date, stored, actual in mismatches:
+            self.stdout.write(f'Продавец {seller_id}, {date}: сохранено {stored}, фактически {actual}')
+
+        if check and mismatches:
+            raise CommandError(f'Найдено расхождений: {len(mismatches)}')
+
+        action = 'Найдено' if check else 'Исправлено'
+        self.stdout.write(self.style.SUCCESS(f'{action} расхождений: {len(mismatches)}'))
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from main.db_router import sync_sqlite_replicas
+
+
+class Command(BaseCommand):
+    help = 'Копирует основную SQLite-базу в реплики из DATABASE_REPLICAS'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database',
+            action='append',
+            dest='aliases',
+            help='Обновить только указанные реплики (можно несколько раз)',
+        )
+
+    def handle(self, *args, aliases=None, **options):
+        aliases = aliases or settings.DATABASE_REPLICAS
+        if not aliases:
+            raise CommandError('Реплики не настроены: задайте DATABASE_REPLICAS')
+
+        try:
+            synced = sync_sqlite_replicas(aliases)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(self.style.SUCCESS(f'Обновлены реплики: {", ".join(synced)}'))
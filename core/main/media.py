@@ -0,0 +1,164 @@
+"""
+Раздача загруженных файлов из MEDIA_ROOT.
+
+Загрузки не перезаписываются (storage подбирает новое имя), поэтому
+публичные файлы отдаются с Cache-Control immutable на MEDIA_MAX_AGE.
+ETag строится из размера и mtime, If-None-Match и If-Modified-Since
+дают 304 без чтения файла. Поддерживается один диапазон Range (докачка,
+просмотр больших файлов), If-Range сверяется с ETag.
+
+Файлы из PRIVATE_MEDIA (чеки) доступны только участникам сделки: право
+проверяется одним запросом по индексу check_image, чужим отвечаем 404.
+Такие ответы помечаются private и Vary: Cookie.
+
+MEDIA_SENDFILE = 'x-accel-redirect' или 'x-sendfile': Django только
+проверяет доступ и ставит заголовки, файл с диапазонами отдаёт
+веб-сервер (nginx — через internal location MEDIA_ACCEL_PREFIX).
+"""
+import mimetypes
+import os
+import posixpath
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.db.models import Q
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from .models import Payment, PaymentRequest
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def can_view_check(user, name):
+    """Чек видят покупатель, продавец и бухгалтерия."""
+    if not user.is_authenticated:
+        return False
+    if user.is_staff or user.is_accountant:
+        return True
+    # Оплата хранит копию имени чека из заявки, но заявку могли удалить
+    payment_requests = PaymentRequest.objects.filter(Q(user=user) | Q(product__user=user), check_image=name)
+    payments = Payment.objects.filter(seller=user, check_image=name)
+    return payment_requests.values('id').union(payments.values('id')).exists()
+
+
+# Префикс имени файла -> проверка доступа (user, name)
+PRIVATE_MEDIA = {
+    'media/check/': can_view_check,
+}
+
+
+def access_check(name):
+    return next((check for prefix, check in PRIVATE_MEDIA.items() if name.startswith(prefix)), None)
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    """
+    (начало, конец включительно) для одного диапазона или None, если файл
+    нужно отдать целиком: несколько диапазонов и неверный синтаксис
+    игнорируются, как разрешает RFC 9110.
+    """
+    match = RANGE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if not start:
+        # bytes=-500 — последние 500 байт
+        if int(end) == 0:
+            raise RangeNotSatisfiable()
+        return max(size - int(end), 0), size - 1
+    start = int(start)
+    if end and int(end) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    return start, min(int(end), size - 1) if end else size - 1
+
+
+def read_range(path, start, length):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(length, settings.MEDIA_CHUNK_SIZE))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def file_response(request, path, name, size, etag, content_type):
+    if settings.MEDIA_SENDFILE == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + quote(name)
+        return response
+    if settings.MEDIA_SENDFILE == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = os.path.abspath(path)
+        return response
+
+    byte_range = None
+    range_header = request.headers.get('Range')
+    # If-Range с другим ETag или датой: файл изменился, отдаём целиком
+    if range_header and request.headers.get('If-Range', etag) == etag:
+        try:
+            byte_range = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    if byte_range is None:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(read_range(path, start, end - start + 1), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def media_view(request, path):
+    name = posixpath.normpath(path).lstrip('/')
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, name)
+    except SuspiciousFileOperation:
+        raise Http404()
+
+    check = access_check(name)
+    if check is not None and not check(request.user, name):
+        raise Http404()
+
+    try:
+        file_stat = os.stat(full_path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404()
+    if not stat.S_ISREG(file_stat.st_mode):
+        raise Http404()
+
+    etag = f'"{file_stat.st_size:x}-{file_stat.st_mtime_ns:x}"'
+    last_modified = int(file_stat.st_mtime)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        content_type, _ = mimetypes.guess_type(name)
+        response = file_response(
+            request, full_path, name, file_stat.st_size, etag, content_type or 'application/octet-stream'
+        )
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    if check is None:
+        patch_cache_control(response, public=True, max_age=settings.MEDIA_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, private=True, max_age=settings.MEDIA_PRIVATE_MAX_AGE)
+        patch_vary_headers(response, ['Cookie'])
+    return response
@@ -0,0 +1,72 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .db_router import routing_context
+from .query_budget import QueryBudgetExceeded, QueryRecorder, check_budget
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetMiddleware:
+    """
+    Считает SQL-запросы и их время для каждого запроса и сверяет с
+    settings.QUERY_BUDGETS. QUERY_BUDGET_MODE: 'off' — отключено,
+    'warn' — пишет в лог, 'raise' — бросает QueryBudgetExceeded.
+    В ответ добавляются заголовки X-Query-Count и X-Query-Time.
+    """
+
+    def __init__(self, get_response):
+        if settings.QUERY_BUDGET_MODE == 'off':
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+
+        response['X-Query-Count'] = str(recorder.count)
+        response['X-Query-Time'] = f'{recorder.duration * 1000:.1f}ms'
+
+        match = request.resolver_match
+        if match is None or not match.url_name:
+            return response
+
+        try:
+            check_budget(match.url_name, recorder)
+        except QueryBudgetExceeded as exc:
+            if settings.QUERY_BUDGET_MODE == 'raise':
+                raise
+            logger.warning('%s %s\n%s', request.method, request.path, exc)
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Закрепляет чтение за основной базой в пределах запроса после записи и
+    на REPLICA_LAG_TOLERANCE секунд после него (cookie с временем окончания).
+    """
+    cookie_name = 'db_primary_until'
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            pinned_until = float(request.COOKIES.get(self.cookie_name, 0))
+        except ValueError:
+            pinned_until = 0
+
+        with routing_context(pinned=pinned_until > time.time()) as state:
+            response = self.get_response(request)
+
+        if state.written:
+            lag = settings.REPLICA_LAG_TOLERANCE
+            response.set_cookie(
+                self.cookie_name, str(time.time() + lag), max_age=lag, httponly=True, samesite='Lax'
+            )
+        return response
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:46
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def fill_rating_stats(apps, schema_editor):
+    Product = apps.get_model('main', 'Product')
+    Rating = apps.get_model('main', 'Rating')
+
+    aggregates = {'rating_count': Count('id'), 'rating_sum': Sum('count')}
+    for count in range(1, 6):
+        aggregates[f'rating_{count}'] = Count('id', filter=Q(count=count))
+
+    for row in Rating.objects.values('product').annotate(**aggregates):
+        Product.objects.filter(id=row.pop('product')).update(**row)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_payment_created_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_1',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок 1'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок 2'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок 3'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок 4'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок 5'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество отзывов'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Сумма оценок'),
+        ),
+        migrations.RunPython(fill_rating_stats, migrations.RunPython.noop),
+    ]
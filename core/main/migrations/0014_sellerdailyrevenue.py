@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def fill_daily_revenue(apps, schema_editor):
+    Payment = apps.get_model('main', 'Payment')
+    SellerDailyRevenue = apps.get_model('main', 'SellerDailyRevenue')
+
+    rows = (
+        Payment.objects.annotate(date=TruncDate('created_date'))
+        .values('seller', 'date')
+        .annotate(payments_count=Count('id'), quantity=Sum('quantity'), revenue=Sum('total_price'))
+    )
+    SellerDailyRevenue.objects.bulk_create(
+        [
+            SellerDailyRevenue(
+                seller_id=row['seller'],
+                date=row['date'],
+                payments_count=row['payments_count'],
+                quantity=row['quantity'],
+                revenue=row['revenue'],
+            )
+            for row in rows
+        ],
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_product_rating_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SellerDailyRevenue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('payments_count', models.PositiveIntegerField(default=0, verbose_name='Количество оплат')),
+                ('quantity', models.PositiveIntegerField(default=0, verbose_name='Количество товаров')),
+                ('revenue', models.PositiveBigIntegerField(default=0, verbose_name='Выручка')),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_revenue', to=settings.AUTH_USER_MODEL, verbose_name='Продавец')),
+            ],
+            options={
+                'verbose_name': 'Выручка за день',
+                'verbose_name_plural': 'Выручка по дням',
+                'constraints': [models.UniqueConstraint(fields=('seller', 'date'), name='unique_seller_daily_revenue')],
+            },
+        ),
+        migrations.RunPython(fill_daily_revenue, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_sellerdailyrevenue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveSmallIntegerField(verbose_name='Позиция')),
+                ('score', models.FloatField(verbose_name='Оценка похожести')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_links', to='main.product', verbose_name='Продукт')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_to', to='main.product', verbose_name='Похожий продукт')),
+            ],
+            options={
+                'verbose_name': 'Похожий продукт',
+                'verbose_name_plural': 'Похожие продукты',
+                'constraints': [models.UniqueConstraint(fields=('product', 'position'), name='unique_similar_product_position')],
+            },
+        ),
+    ]
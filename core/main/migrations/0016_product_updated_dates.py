@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:09
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_similarproduct'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='reviews_updated_date',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Дата изменения отзывов'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='updated_date',
+            field=models.DateTimeField(auto_now=True, verbose_name='Дата изменения'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'updated_date'], name='product_active_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'reviews_updated_date'], name='product_active_reviews_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_product_updated_dates'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='payment',
+            name='check_image',
+            field=models.ImageField(db_index=True, upload_to='media/check', verbose_name='Чек'),
+        ),
+        migrations.AlterField(
+            model_name='paymentrequest',
+            name='check_image',
+            field=models.ImageField(db_index=True, upload_to='media/check', verbose_name='Чек'),
+        ),
+    ]
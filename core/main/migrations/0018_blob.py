@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0017_check_image_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Имя файла')),
+                ('size', models.PositiveBigIntegerField(verbose_name='Размер')),
+                ('refcount', models.IntegerField(default=0, verbose_name='Число ссылок')),
+                ('created_date', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+            ],
+            options={
+                'verbose_name': 'Файл хранилища',
+                'verbose_name_plural': 'Файлы хранилища',
+                'indexes': [models.Index(fields=['refcount', 'created_date'], name='blob_refcount_created_idx')],
+            },
+        ),
+    ]
@@ -1,7 +1,11 @@
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Cast, Coalesce, NullIf
+from django.utils import timezone
 from django.core.validators import MaxValueValidator, MinValueValidator
 
+from .caching import invalidate_products
 from .choices import OrderStatusEnum
 
 User = get_user_model()
@@ -35,6 +39,17 @@ class Image(models.Model):
         verbose_name_plural = 'Изображения продуктов'
 
 
+class ProductQuerySet(models.QuerySet):
+    def with_rating_score(self):
+        # Средняя оценка из сохранённых полей, без агрегации по Rating
+        return self.annotate(
+            rating_score=Coalesce(
+                Cast('rating_sum', models.FloatField()) / NullIf('rating_count', 0),
+                0.0
+            )
+        )
+
+
 #  TODO: Cделать связь на таблицу User
 class Product(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -68,13 +83,151 @@ class Product(models.Model):
         default=True,
         verbose_name='Активен'
     )
+    updated_date = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
+    # Последнее изменение отзывов и ответов, обновляется сигналами
+    reviews_updated_date = models.DateTimeField(
+        default=timezone.now,
+        editable=False,
+        verbose_name='Дата изменения отзывов'
+    )
+
+    # Денормализованная статистика отзывов, обновляется сигналами Rating
+    rating_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество отзывов'
+    )
+    rating_sum = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Сумма оценок'
+    )
+    rating_1 = models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок 1')
+    rating_2 = models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок 2')
+    rating_3 = models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок 3')
+    rating_4 = models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок 4')
+    rating_5 = models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок 5')
+
+    objects = ProductQuerySet.as_manager()
 
     def __str__(self):
         return self.title
 
+    @property
+    def rating_avg(self):
+        if not self.rating_count:
+            return None
+        return round(self.rating_sum / self.rating_count, 1)
+
+    @property
+    def rating_histogram(self):
+        return {count: getattr(self, f'rating_{count}') for count in RATING_VALUES}
+
+    @classmethod
+    def rebuild_rating_stats(cls, product_ids=None):
+        """
+        Пересчитывает сохранённую статистику отзывов по таблице Rating.
+        Возвращает [(product_id, сохранено, фактически)] для разошедшихся продуктов.
+        """
+        products = cls.objects.all()
+        if product_ids is not None:
+            products = products.filter(id__in=product_ids)
+
+        drifted = []
+        with transaction.atomic():
+            actual_stats = {
+                row.pop('product'): row
+                for row in Rating.objects.filter(product__in=products)
+                .values('product')
+                .annotate(**rating_stats_aggregates())
+            }
+            for product in products.select_for_update().only('id', *RATING_STAT_FIELDS):
+                actual = actual_stats.get(product.id, dict.fromkeys(RATING_STAT_FIELDS, 0))
+                actual = {field: actual[field] or 0 for field in RATING_STAT_FIELDS}
+                stored = {field: getattr(product, field) for field in RATING_STAT_FIELDS}
+                if stored != actual:
+                    drifted.append((product.id, stored, actual))
+                    cls.objects.filter(id=product.id).update(**actual, reviews_updated_date=timezone.now())
+            drifted_ids = [product_id for product_id, _, _ in drifted]
+            # После коммита: при откате (rebuild_rating_stats --check) кеш не трогаем
+            transaction.on_commit(lambda: invalidate_products(drifted_ids))
+        return drifted
+
     class Meta:
         verbose_name = 'Продукт'
         verbose_name_plural = 'Продукты'
+        indexes = [
+            # Max() по активным продуктам для ETag/Last-Modified списков
+            models.Index(fields=['is_active', 'updated_date'], name='product_active_updated_idx'),
+            models.Index(fields=['is_active', 'reviews_updated_date'], name='product_active_reviews_idx'),
+        ]
+
+
+RATING_VALUES = (1, 2, 3, 4, 5)
+RATING_STAT_FIELDS = ('rating_count', 'rating_sum') + tuple(f'rating_{count}' for count in RATING_VALUES)
+
+
+def rating_stats_aggregates():
+    aggregates = {
+        'rating_count': Count('id'),
+        'rating_sum': Sum('count'),
+    }
+    for count in RATING_VALUES:
+        aggregates[f'rating_{count}'] = Count('id', filter=Q(count=count))
+    return aggregates
+
+
+def apply_rating_delta(product_id, count, sign):
+    """Атомарно добавляет (sign=1) или убирает (sign=-1) одну оценку из статистики продукта."""
+    Product.objects.filter(id=product_id).update(**{
+        'rating_count': F('rating_count') + sign,
+        'rating_sum': F('rating_sum') + sign * count,
+        f'rating_{count}': F(f'rating_{count}') + sign,
+        'reviews_updated_date': timezone.now(),
+    })
+
+
+def touch_reviews(product_id):
+    """Отмечает изменение отзывов продукта без изменения статистики."""
+    Product.objects.filter(id=product_id).update(reviews_updated_date=timezone.now())
+
+
+class RatingQuerySet(models.QuerySet):
+    """
+    bulk_create(), bulk_update() и update() не шлют сигналов модели, поэтому
+    статистика затронутых продуктов пересчитывается целиком.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            Product.rebuild_rating_stats({obj.product_id for obj in objs})
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        with transaction.atomic(using=self.db):
+            product_ids = set(
+                self.filter(pk__in=[obj.pk for obj in objs]).values_list('product_id', flat=True)
+            )
+            rows = super().bulk_update(objs, fields, *args, **kwargs)
+            Product.rebuild_rating_stats(product_ids | {obj.product_id for obj in objs})
+        return rows
+
+    def update(self, **kwargs):
+        if not {'count', 'product', 'product_id'} & kwargs.keys():
+            return super().update(**kwargs)
+
+        with transaction.atomic(using=self.db):
+            pks = list(self.values_list('pk', flat=True))
+            touched = self.model._base_manager.using(self.db).filter(pk__in=pks)
+            product_ids = set(touched.values_list('product_id', flat=True))
+            rows = super().update(**kwargs)
+            product_ids |= set(touched.values_list('product_id', flat=True))
+            Product.rebuild_rating_stats(product_ids)
+        return rows
 
 
 class Rating(models.Model):
@@ -97,9 +250,26 @@ class Rating(models.Model):
         auto_now_add=True
     )
 
+    objects = RatingQuerySet.as_manager()
+
     def __str__(self):
         return f'{self.user} --> {self.product}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_stats_state()
+        return instance
+
+    def remember_stats_state(self):
+        # Значения, которые уже учтены в статистике продукта
+        self._stats_state = (self.product_id, self.count)
+
+    def save(self, *args, **kwargs):
+        # post_save обновляет статистику продукта в той же транзакции
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = 'Отзыв'
         verbose_name_plural = 'Отзывы'
@@ -198,7 +368,9 @@ class PaymentRequest(models.Model):
     )
     check_image = models.ImageField(
         verbose_name='Чек',
-        upload_to='media/check'
+        upload_to='media/check',
+        # Проверка доступа к чеку в main/media.py
+        db_index=True
     )
     total_price = models.PositiveIntegerField(
         verbose_name='Сумма'
@@ -237,7 +409,9 @@ class Payment(models.Model):
     )
     check_image = models.ImageField(
         verbose_name='Чек',
-        upload_to='media/check'
+        upload_to='media/check',
+        # Проверка доступа к чеку в main/media.py
+        db_index=True
     )
     total_price = models.PositiveIntegerField(
         verbose_name='Сумма'
@@ -250,3 +424,100 @@ class Payment(models.Model):
     class Meta:
         verbose_name = 'Оплата'
         verbose_name_plural = 'Оплаты'
+
+
+class SellerDailyRevenue(models.Model):
+    seller = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='daily_revenue',
+        verbose_name='Продавец'
+    )
+    date = models.DateField(
+        verbose_name='Дата'
+    )
+    payments_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество оплат'
+    )
+    quantity = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество товаров'
+    )
+    revenue = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name='Выручка'
+    )
+
+    class Meta:
+        verbose_name = 'Выручка за день'
+        verbose_name_plural = 'Выручка по дням'
+        constraints = [
+            models.UniqueConstraint(fields=['seller', 'date'], name='unique_seller_daily_revenue'),
+        ]
+
+    def __str__(self):
+        return f'{self.seller} --> {self.date}: {self.revenue}'
+
+
+class SimilarProduct(models.Model):
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='similar_links',
+        verbose_name='Продукт'
+    )
+    similar = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='similar_to',
+        verbose_name='Похожий продукт'
+    )
+    position = models.PositiveSmallIntegerField(
+        verbose_name='Позиция'
+    )
+    score = models.FloatField(
+        verbose_name='Оценка похожести'
+    )
+
+    class Meta:
+        verbose_name = 'Похожий продукт'
+        verbose_name_plural = 'Похожие продукты'
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'position'], name='unique_similar_product_position'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id} --> {self.similar_id}'
+
+
+class Blob(models.Model):
+    """Файл в хранилище по содержимому (main/storage.py) и число ссылок на него."""
+
+    name = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name='Имя файла'
+    )
+    size = models.PositiveBigIntegerField(
+        verbose_name='Размер'
+    )
+    refcount = models.IntegerField(
+        default=0,
+        verbose_name='Число ссылок'
+    )
+    created_date = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата создания'
+    )
+
+    class Meta:
+        verbose_name = 'Файл хранилища'
+        verbose_name_plural = 'Файлы хранилища'
+        indexes = [
+            # Кандидаты на удаление в gc_media
+            models.Index(fields=['refcount', 'created_date'], name='blob_refcount_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.refcount})'
@@ -0,0 +1,76 @@
+"""
+Массовая смена статуса заявок на оплату.
+
+Вместо запроса на каждую заявку: одна выборка с проверкой владельца,
+один условный UPDATE, один bulk_create оплат и обновление дневных итогов.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .blobs import add_references
+from .choices import OrderStatusEnum
+from .ledger import record_payments
+from .models import Payment, PaymentRequest
+
+
+class BulkStatusError(Exception):
+    pass
+
+
+def bulk_update_status(request_ids, status, seller=None):
+    """
+    Переводит заявки в status. Если передан seller, все заявки должны
+    принадлежать его продуктам. Заявки, уже имеющие этот статус,
+    пропускаются, поэтому повторное принятие не создаёт дублей оплат.
+    Возвращает (число изменённых заявок, список созданных Payment).
+    """
+    if status not in OrderStatusEnum.values:
+        raise BulkStatusError(f'Неизвестный статус: {status}')
+
+    request_ids = set(request_ids)
+    if not request_ids:
+        return 0, []
+
+    with transaction.atomic():
+        payment_requests = PaymentRequest.objects.filter(id__in=request_ids).select_related(
+            'user', 'product'
+        ).only(
+            'id', 'status', 'quantity', 'check_image', 'total_price',
+            'user__first_name', 'product__title', 'product__user_id'
+        ).select_for_update()
+        if seller is not None:
+            payment_requests = payment_requests.filter(product__user=seller)
+        payment_requests = list(payment_requests)
+
+        if len(payment_requests) != len(request_ids):
+            raise BulkStatusError('Часть заявок не найдена или принадлежит другому продавцу')
+
+        changing = [payment_request for payment_request in payment_requests if payment_request.status != status]
+        if not changing:
+            return 0, []
+
+        updated = PaymentRequest.objects.filter(
+            id__in=[payment_request.id for payment_request in changing]
+        ).exclude(status=status).update(status=status, update_date=timezone.now())
+        if updated != len(changing):
+            raise BulkStatusError('Статус заявок изменился во время обработки, повторите попытку')
+
+        if status != OrderStatusEnum.ACCEPTED:
+            return updated, []
+
+        payments = Payment.objects.bulk_create([
+            Payment(
+                seller_id=payment_request.product.user_id,
+                user=payment_request.user.first_name,
+                product=payment_request.product.title,
+                quantity=payment_request.quantity,
+                check_image=payment_request.check_image,
+                total_price=payment_request.total_price
+            )
+            for payment_request in changing
+        ], batch_size=500)
+        # bulk_create не шлёт post_save, ссылки на чеки учитываются здесь
+        add_references(payment.check_image.name for payment in payments)
+        record_payments(payments)
+
+    return updated, payments
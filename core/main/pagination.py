@@ -0,0 +1,186 @@
+"""
+Keyset (cursor) pagination.
+
+Вместо OFFSET страница продолжается после последнего ключа сортировки
+предыдущей страницы, поэтому стоимость запроса не зависит от глубины.
+Курсор подписан и непрозрачен для клиента: в нём лежат значения полей
+сортировки последней (или первой) записи и направление.
+"""
+import datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+
+CURSOR_SALT = 'main.pagination.cursor'
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def _signer():
+    # Без метки времени: курсор одной и той же записи всегда одинаков,
+    # и ссылки в кешируемых фрагментах не меняются от секунды рендера
+    return signing.Signer(salt=CURSOR_SALT)
+
+
+def get_page_size(request, default=None):
+    default = default or settings.PAGINATION_PAGE_SIZE
+    try:
+        page_size = int(request.GET.get('page_size', default))
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(page_size, settings.PAGINATION_MAX_PAGE_SIZE))
+
+
+def _dump_value(value):
+    # Значения курсора хранятся в JSON, фильтр по строке приводится к типу поля
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, previous_cursor, page_size, count=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.page_size = page_size
+        self.count = count
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Пагинация по ключу сортировки queryset.
+
+    Сортировка берётся из ordering или из queryset.order_by; первичный ключ
+    всегда добавляется последним, чтобы порядок был однозначным.
+    count() выполняется только при with_count=True.
+    """
+
+    def __init__(self, queryset, per_page, ordering=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = self._normalize_ordering(ordering or queryset.query.order_by or ('-pk',))
+
+    def _normalize_ordering(self, ordering):
+        pk_name = self.queryset.model._meta.pk.name
+        ordering = [
+            field.replace('pk', pk_name) if field.lstrip('-') == 'pk' else field
+            for field in ordering
+            if isinstance(field, str) and field != '?'
+        ]
+        if pk_name not in {field.lstrip('-') for field in ordering}:
+            # Направление по первичному ключу совпадает с последним полем сортировки
+            ordering.append(f'-{pk_name}' if ordering and ordering[-1].startswith('-') else pk_name)
+        return tuple(ordering)
+
+    def encode_cursor(self, obj, backwards=False):
+        values = [_dump_value(getattr(obj, field.lstrip('-'))) for field in self.ordering]
+        return _signer().sign_object({'v': values, 'b': backwards}, compress=True)
+
+    def decode_cursor(self, cursor):
+        try:
+            data = _signer().unsign_object(cursor)
+        except signing.BadSignature as exc:
+            raise InvalidCursor(cursor) from exc
+
+        values = data.get('v') if isinstance(data, dict) else None
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise InvalidCursor(cursor)
+        return values, bool(data.get('b'))
+
+    def _after(self, values, backwards):
+        """Условие "строго после ключа" для составной сортировки."""
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != backwards
+            condition |= equal & Q(**{f'{name}__{"lt" if descending else "gt"}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def page(self, cursor=None, with_count=False):
+        backwards = False
+        queryset = self.queryset
+        if cursor:
+            values, backwards = self.decode_cursor(cursor)
+            queryset = queryset.filter(self._after(values, backwards))
+
+        ordering = self.ordering
+        if backwards:
+            ordering = tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+
+        # Одна лишняя запись показывает, есть ли следующая страница
+        rows = list(queryset.order_by(*ordering)[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or backwards:
+                next_cursor = self.encode_cursor(rows[-1])
+            if cursor and (has_more or not backwards):
+                previous_cursor = self.encode_cursor(rows[0], backwards=True)
+
+        count = self.queryset.count() if with_count else None
+        return KeysetPage(rows, next_cursor, previous_cursor, self.per_page, count)
+
+    def get_page(self, cursor=None, with_count=False):
+        """Как page(), но повреждённый курсор возвращает первую страницу."""
+        try:
+            return self.page(cursor, with_count)
+        except InvalidCursor:
+            return self.page(None, with_count)
+
+
+def pagination_params(request, default_page_size=None):
+    """
+    Параметры пагинации запроса в каноническом виде для ключей кеша:
+    значения по умолчанию и неподписанные курсоры отбрасываются.
+    """
+    params = {}
+    cursor = request.GET.get('cursor')
+    if cursor:
+        try:
+            _signer().unsign_object(cursor)
+        except signing.BadSignature:
+            pass
+        else:
+            params['cursor'] = cursor
+    page_size = get_page_size(request, default_page_size)
+    if page_size != (default_page_size or settings.PAGINATION_PAGE_SIZE):
+        params['page_size'] = str(page_size)
+    if request.GET.get('count') == '1':
+        params['count'] = '1'
+    return params
+
+
+def paginate_request(request, queryset, ordering=None, default_page_size=None):
+    paginator = KeysetPaginator(queryset, get_page_size(request, default_page_size), ordering)
+    return paginator.get_page(
+        request.GET.get('cursor'),
+        with_count=request.GET.get('count') == '1'
+    )
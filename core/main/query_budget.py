@@ -0,0 +1,138 @@
+"""
+Учёт SQL-запросов на запрос и бюджеты по именам маршрутов.
+
+QueryRecorder подключается через connection.execute_wrapper и для каждого
+запроса сохраняет SQL, параметры, время и место вызова: строку шаблона,
+если запрос сделан при рендеринге, иначе строку кода проекта.
+Бюджеты задаются в settings.QUERY_BUDGETS по url_name из main/urls.py и
+user/urls.py. Используется и в QueryBudgetMiddleware, и в тестах.
+"""
+import sys
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+PROJECT_ROOT = str(settings.BASE_DIR)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def _query_origin():
+    """Ближайшая строка шаблона или файла проекта, откуда пришёл запрос."""
+    from django.template.base import Node
+
+    code_origin = None
+    frame = sys._getframe(2)
+    while frame is not None:
+        node = frame.f_locals.get('self')
+        # type(), а не isinstance: self может быть ленивым объектом (request.user),
+        # и его вычисление само сделает запрос
+        if issubclass(type(node), Node) and getattr(node, 'token', None) is not None and node.origin is not None:
+            return f'{node.origin.template_name}:{node.token.lineno}'
+
+        filename = frame.f_code.co_filename
+        if code_origin is None and filename.startswith(PROJECT_ROOT) and not filename.endswith('query_budget.py'):
+            code_origin = f'{filename[len(PROJECT_ROOT) + 1:]}:{frame.f_lineno}'
+        frame = frame.f_back
+    return code_origin or '?'
+
+
+class RecordedQuery:
+    def __init__(self, alias, sql, params, duration, origin):
+        self.alias = alias
+        self.sql = sql
+        self.params = params
+        self.duration = duration
+        self.origin = origin
+
+
+class QueryRecorder:
+    """
+    with QueryRecorder() as recorder:
+        ...
+    recorder.count, recorder.duration, recorder.repeated()
+    """
+
+    def __init__(self, using=None):
+        self.aliases = using or list(connections)
+        self.queries = []
+        self._stack = None
+
+    def _wrapper(self, alias):
+        def wrapper(execute, sql, params, many, context):
+            origin = _query_origin()
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                self.queries.append(
+                    RecordedQuery(alias, sql, params, time.perf_counter() - started, origin)
+                )
+        return wrapper
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for alias in self.aliases:
+            self._stack.enter_context(connections[alias].execute_wrapper(self._wrapper(alias)))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        return sum(query.duration for query in self.queries)
+
+    def duplicates(self):
+        """Одинаковые SQL с одинаковыми параметрами: [(sql, раз, места вызова)]."""
+        return self._group(lambda query: (query.sql, repr(query.params)), threshold=2)
+
+    def repeated(self, threshold=None):
+        """Один SQL с разными параметрами — типичный N+1."""
+        return self._group(
+            lambda query: query.sql,
+            threshold=threshold or settings.QUERY_BUDGET_REPEAT_THRESHOLD
+        )
+
+    def _group(self, key, threshold):
+        counts = Counter(key(query) for query in self.queries)
+        groups = []
+        for group_key, times in counts.items():
+            if times < threshold:
+                continue
+            origins = sorted({query.origin for query in self.queries if key(query) == group_key})
+            sql = group_key[0] if isinstance(group_key, tuple) else group_key
+            groups.append((sql, times, origins))
+        return sorted(groups, key=lambda group: -group[1])
+
+    def report(self):
+        lines = [f'{self.count} запросов, {self.duration * 1000:.1f} мс']
+        for title, groups in (('Дубли', self.duplicates()), ('Повторы', self.repeated())):
+            for sql, times, origins in groups:
+                lines.append(f'{title} x{times} из {", ".join(origins)}: {sql[:200]}')
+        return '\n'.join(lines)
+
+
+def get_budget(url_name):
+    return settings.QUERY_BUDGETS.get(url_name)
+
+
+def check_budget(url_name, recorder):
+    """Бросает QueryBudgetExceeded, если маршрут превысил бюджет или сделал N+1."""
+    budget = get_budget(url_name)
+    problems = []
+    if budget is not None and recorder.count > budget:
+        problems.append(f'{url_name}: {recorder.count} запросов при бюджете {budget}')
+    if recorder.repeated():
+        problems.append(f'{url_name}: повторяющиеся запросы')
+    if problems:
+        raise QueryBudgetExceeded('\n'.join(problems + [recorder.report()]))
@@ -0,0 +1,421 @@
+"""
+Похожие продукты.
+
+Для каждого активного продукта заранее считаются SIMILAR_PRODUCTS_TOP_K
+похожих и сохраняются в SimilarProduct, так что страница продукта
+читает их одним запросом по индексу (product, position).
+
+Кандидаты — активные продукты той же категории и продукты, которые
+покупали те же пользователи (по PaymentRequest). Оценка складывается из
+совпадения категории, близости цены, совместных покупок и косинусной
+близости TF-IDF векторов названия и описания (хешированный словарь
+размера SIMILAR_PRODUCTS_TEXT_DIM, считается в NumPy пачками).
+
+Матрица векторов категории строится один раз и хранится в памяти
+процесса (последние SIMILAR_PRODUCTS_CACHED_CATEGORIES категорий). Перед
+использованием она сверяется с базой по числу продуктов и Max(updated_date)
+и при расхождении перечитывает только изменённые строки, поэтому
+изменения из других процессов тоже подхватываются. IDF остаётся от
+построения матрицы, полный пересчёт (refresh_similar_products без
+аргументов, команда rebuild_similar_products) строит его заново.
+
+При изменении продукта (update_similar_products) пересчитываются строки
+оценок только для затронутых продуктов: его самого, тех, у кого он был в
+списке, тех, в чей список он теперь попадает (его оценка выше худшей в
+их списке), и его партнёров по совместным покупкам. Оценка без
+совместных покупок симметрична, поэтому попадание в чужие списки
+определяется по одной строке оценок.
+"""
+import logging
+import math
+import threading
+import zlib
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Count, F, Max, Min
+
+from .caching import invalidate_products
+from .models import PaymentRequest, Product, SimilarProduct
+from .search import normalize_query
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+# category_id -> CandidateSet, старые категории вытесняются
+_category_sets = OrderedDict()
+_lock = threading.RLock()
+
+CANDIDATE_FIELDS = ('id', 'category_id', 'price', 'title', 'description', 'updated_date')
+# Поля продукта, от которых зависит оценка; изменение других полей списки не трогает
+SCORE_FIELDS = ('category_id', 'price', 'title', 'description', 'is_active')
+
+
+class CandidateSet:
+    """
+    Векторы и цены кандидатов. Строки хранятся в массивах с запасом, чтобы
+    добавление продукта не копировало всю матрицу.
+    """
+
+    def __init__(self, rows, dim, idf=None):
+        self.dim = dim
+        self.size = 0
+        self.position = {}
+        self.updated = {}
+        self.stamp = None
+        counts = term_counts([f'{row[3]} {row[4]}' for row in rows], dim)
+        if idf is None:
+            document_frequency = (counts > 0).sum(axis=0)
+            idf = np.log((1 + len(rows)) / (1 + document_frequency)) + 1
+        self.idf = idf
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._category_ids = np.zeros(0, dtype=np.int64)
+        self._log_prices = np.zeros(0, dtype=np.float64)
+        self._vectors = np.zeros((0, dim), dtype=np.float32)
+        self._append(rows, tfidf(counts, self.idf))
+
+    @property
+    def ids(self):
+        return self._ids[:self.size]
+
+    @property
+    def category_ids(self):
+        return self._category_ids[:self.size]
+
+    @property
+    def log_prices(self):
+        return self._log_prices[:self.size]
+
+    @property
+    def vectors(self):
+        return self._vectors[:self.size]
+
+    def _reserve(self, extra):
+        capacity = len(self._ids)
+        if self.size + extra <= capacity:
+            return
+        capacity = max(self.size + extra, capacity * 2, 16)
+        self._ids = np.resize(self._ids, capacity)
+        self._category_ids = np.resize(self._category_ids, capacity)
+        self._log_prices = np.resize(self._log_prices, capacity)
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        vectors[:self.size] = self.vectors
+        self._vectors = vectors
+
+    def _write(self, index, row, vector):
+        self._ids[index] = row[0]
+        self._category_ids[index] = row[1]
+        self._log_prices[index] = math.log1p(float(row[2]))
+        self._vectors[index] = vector
+        self.position[row[0]] = index
+        self.updated[row[0]] = row[5]
+
+    def _append(self, rows, vectors):
+        self._reserve(len(rows))
+        for row, vector in zip(rows, vectors):
+            self._write(self.size, row, vector)
+            self.size += 1
+
+    def upsert(self, rows):
+        """Добавляет или заменяет строки продуктов, векторы считаются с текущим IDF."""
+        if not rows:
+            return
+        vectors = tfidf(term_counts([f'{row[3]} {row[4]}' for row in rows], self.dim), self.idf)
+        new_rows, new_vectors = [], []
+        for row, vector in zip(rows, vectors):
+            if row[0] in self.position:
+                self._write(self.position[row[0]], row, vector)
+            else:
+                new_rows.append(row)
+                new_vectors.append(vector)
+        self._append(new_rows, new_vectors)
+
+    def remove(self, product_ids):
+        """Удаляет строки, переставляя на их место последние."""
+        for product_id in product_ids:
+            index = self.position.pop(product_id, None)
+            if index is None:
+                continue
+            self.updated.pop(product_id, None)
+            last = self.size - 1
+            if index != last:
+                moved_id = int(self._ids[last])
+                self._ids[index] = self._ids[last]
+                self._category_ids[index] = self._category_ids[last]
+                self._log_prices[index] = self._log_prices[last]
+                self._vectors[index] = self._vectors[last]
+                self.position[moved_id] = index
+            self.size = last
+
+
+def term_counts(texts, dim):
+    counts = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for term in normalize_query(text):
+            counts[row, zlib.crc32(term.encode()) % dim] += 1
+    return counts
+
+
+def tfidf(counts, idf):
+    vectors = np.log1p(counts) * idf.astype(np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def category_candidates(category_id, rebuild=False):
+    """Матрица активных продуктов категории из памяти процесса, сверенная с базой."""
+    dim = settings.SIMILAR_PRODUCTS_TEXT_DIM
+    active = Product.objects.filter(is_active=True, category_id=category_id)
+    stats = active.aggregate(count=Count('id'), updated=Max('updated_date'))
+    stamp = (stats['count'], stats['updated'])
+
+    with _lock:
+        candidates = None if rebuild else _category_sets.get(category_id)
+        if candidates is None or candidates.dim != dim:
+            candidates = CandidateSet(list(active.values_list(*CANDIDATE_FIELDS)), dim)
+        elif candidates.stamp != stamp:
+            # Продукты менялись: перечитываем только изменённые строки
+            current = dict(active.values_list('id', 'updated_date'))
+            candidates.remove([product_id for product_id in list(candidates.position) if product_id not in current])
+            changed = [
+                product_id for product_id, updated in current.items()
+                if candidates.updated.get(product_id) != updated
+            ]
+            candidates.upsert(list(active.filter(id__in=changed).values_list(*CANDIDATE_FIELDS)))
+        candidates.stamp = stamp
+
+        _category_sets[category_id] = candidates
+        _category_sets.move_to_end(category_id)
+        while len(_category_sets) > settings.SIMILAR_PRODUCTS_CACHED_CATEGORIES:
+            _category_sets.popitem(last=False)
+    return candidates
+
+
+def clear_candidates():
+    with _lock:
+        _category_sets.clear()
+
+
+def _copurchases(product_ids):
+    """{product_id: {other_id: число общих покупателей}} для пачки продуктов."""
+    rows = (
+        PaymentRequest.objects.filter(product_id__in=product_ids)
+        .values('product_id', other_id=F('user__orders__product_id'))
+        .annotate(buyers=Count('user_id', distinct=True))
+        .order_by()
+    )
+    copurchases = defaultdict(dict)
+    for row in rows:
+        if row['other_id'] != row['product_id']:
+            copurchases[row['product_id']][row['other_id']] = row['buyers']
+    return copurchases
+
+
+def _base_scores(source, rows, target):
+    """Оценки строк rows из source против всех строк target без совместных покупок."""
+    weights = settings.SIMILAR_PRODUCTS_WEIGHTS
+    text = source.vectors[rows] @ target.vectors.T
+    price = np.exp(-np.abs(source.log_prices[rows][:, None] - target.log_prices[None, :]))
+    category = source.category_ids[rows][:, None] == target.category_ids[None, :]
+    return weights['text'] * text + weights['price'] * price + weights['category'] * category
+
+
+def _score_batch(batch_ids, candidates, copurchases, extras=None):
+    """
+    Списки похожих для batch_ids из candidates; extras — кандидаты из других
+    категорий (партнёры по покупкам) с тем же IDF.
+    """
+    top_k = settings.SIMILAR_PRODUCTS_TOP_K
+    rows = [candidates.position[product_id] for product_id in batch_ids]
+    targets = [candidates] + ([extras] if extras is not None and extras.size else [])
+
+    scores = np.hstack([_base_scores(candidates, rows, target) for target in targets])
+    ids = np.concatenate([target.ids for target in targets])
+
+    weight = settings.SIMILAR_PRODUCTS_WEIGHTS['copurchase']
+    for batch_row, product_id in enumerate(batch_ids):
+        counts = copurchases.get(product_id, {})
+        if counts:
+            top = max(counts.values())
+            for other_id, buyers in counts.items():
+                column = candidates.position.get(other_id)
+                if column is None and len(targets) > 1:
+                    column = extras.position.get(other_id)
+                    column = None if column is None else candidates.size + column
+                if column is not None:
+                    scores[batch_row, column] += weight * buyers / top
+
+    scores[np.arange(len(rows)), rows] = -np.inf
+
+    k = min(top_k, len(ids) - 1)
+    links = []
+    if k <= 0:
+        return links
+
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    for batch_row, product_id in enumerate(batch_ids):
+        columns = best[batch_row][np.argsort(-scores[batch_row, best[batch_row]], kind='stable')]
+        links.extend(
+            SimilarProduct(
+                product_id=product_id,
+                similar_id=int(ids[column]),
+                position=position,
+                score=float(scores[batch_row, column])
+            )
+            for position, column in enumerate(columns)
+            if math.isfinite(scores[batch_row, column])
+        )
+    return links
+
+
+def _extras(candidates, copurchases):
+    """Партнёры по покупкам не из категории, векторы с IDF категории."""
+    extra_ids = {other_id for counts in copurchases.values() for other_id in counts}
+    extra_ids -= candidates.position.keys()
+    if not extra_ids:
+        return None
+    rows = list(Product.objects.filter(is_active=True, id__in=extra_ids).values_list(*CANDIDATE_FIELDS))
+    return CandidateSet(rows, candidates.dim, idf=candidates.idf)
+
+
+def _save_links(candidates, product_ids, batch_size):
+    processed = 0
+    for start in range(0, len(product_ids), batch_size):
+        batch_ids = product_ids[start:start + batch_size]
+        copurchases = _copurchases(batch_ids)
+        links = _score_batch(batch_ids, candidates, copurchases, _extras(candidates, copurchases))
+        with transaction.atomic():
+            SimilarProduct.objects.filter(product_id__in=batch_ids).delete()
+            SimilarProduct.objects.bulk_create(links, batch_size=1000)
+            invalidate_products(batch_ids, catalog=False)
+        processed += len(batch_ids)
+    return processed
+
+
+def refresh_similar_products(product_ids=None, batch_size=256):
+    """
+    Пересчитывает похожие продукты для product_ids (или для всех, с новыми
+    матрицами категорий). Возвращает количество обработанных продуктов.
+    """
+    active = Product.objects.filter(is_active=True)
+    sources = active if product_ids is None else active.filter(id__in=product_ids)
+
+    if product_ids is not None:
+        # У неактивных и удалённых продуктов списка похожих нет
+        SimilarProduct.objects.filter(product_id__in=product_ids).exclude(product__in=sources).delete()
+
+    by_category = defaultdict(list)
+    for product_id, category_id in sources.values_list('id', 'category_id').order_by('category_id', 'id'):
+        by_category[category_id].append(product_id)
+
+    processed = 0
+    with _lock:
+        for category_id, category_product_ids in by_category.items():
+            candidates = category_candidates(category_id, rebuild=product_ids is None)
+            processed += _save_links(candidates, category_product_ids, batch_size)
+    return processed
+
+
+def _entering_lists(product_id, candidates):
+    """Продукты категории, в чей список product_id попадает с новой оценкой."""
+    top_k = settings.SIMILAR_PRODUCTS_TOP_K
+    row = candidates.position[product_id]
+    # Без совместных покупок оценка симметрична: строка продукта = его столбец
+    scores = _base_scores(candidates, [row], candidates)[0]
+
+    partners = _copurchases([product_id]).get(product_id, {})
+    if partners:
+        weight = settings.SIMILAR_PRODUCTS_WEIGHTS['copurchase']
+        tops = {other_id: max(counts.values()) for other_id, counts in _copurchases(list(partners)).items()}
+        for other_id, buyers in partners.items():
+            column = candidates.position.get(other_id)
+            if column is not None and tops.get(other_id):
+                scores[column] += weight * buyers / tops[other_id]
+    scores[row] = -np.inf
+
+    lists = {
+        item['product_id']: item
+        for item in SimilarProduct.objects.filter(
+            product__category_id=int(candidates.category_ids[row]), product__is_active=True
+        ).values('product_id').annotate(count=Count('id'), worst=Min('score')).order_by()
+    }
+    k = min(top_k, candidates.size - 1)
+    entering = set()
+    for other_id, score in zip(candidates.ids.tolist(), scores.tolist()):
+        current = lists.get(other_id)
+        if current is None or current['count'] < k or score > current['worst']:
+            entering.add(other_id)
+    entering.discard(product_id)
+    return entering, set(partners)
+
+
+def update_similar_products(product_ids, extra_ids=()):
+    """
+    Обновляет списки после изменения product_ids: пересчитываются только
+    затронутые продукты (см. описание модуля). extra_ids — продукты,
+    которые нужно пересчитать в любом случае, например ссылавшиеся на
+    удалённый продукт. Возвращает количество пересчитанных продуктов.
+    """
+    affected = set(extra_ids) | set(product_ids)
+    affected.update(SimilarProduct.objects.filter(similar_id__in=product_ids).values_list('product_id', flat=True))
+
+    with _lock:
+        changed = Product.objects.filter(is_active=True, id__in=product_ids).values_list('id', 'category_id')
+        for product_id, category_id in changed:
+            entering, partners = _entering_lists(product_id, category_candidates(category_id))
+            affected |= entering | partners
+
+        active = Product.objects.filter(is_active=True, id__in=affected)
+        SimilarProduct.objects.filter(product_id__in=affected).exclude(product__in=active).delete()
+
+        by_category = defaultdict(list)
+        for product_id, category_id in active.values_list('id', 'category_id').order_by('category_id', 'id'):
+            by_category[category_id].append(product_id)
+
+        processed = 0
+        for category_id, category_product_ids in by_category.items():
+            processed += _save_links(category_candidates(category_id), category_product_ids, batch_size=256)
+    return processed
+
+
+def _update_in_thread(product_ids, extra_ids):
+    try:
+        update_similar_products(product_ids, extra_ids)
+    except Exception:
+        logger.exception('Не удалось обновить похожие продукты для %s', product_ids or extra_ids)
+    finally:
+        connections.close_all()
+
+
+def schedule_update(product_ids, extra_ids=()):
+    """Обновляет списки после коммита, по умолчанию в фоновом потоке."""
+    product_ids, extra_ids = set(product_ids), set(extra_ids)
+    if not product_ids and not extra_ids:
+        return
+
+    def submit():
+        global _executor
+        if not settings.SIMILAR_PRODUCTS_ASYNC:
+            update_similar_products(product_ids, extra_ids)
+            return
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1)
+        _executor.submit(_update_in_thread, product_ids, extra_ids)
+
+    transaction.on_commit(submit)
+
+
+def referrer_ids(product_id):
+    """Продукты, у которых product_id сейчас в списке похожих."""
+    return set(SimilarProduct.objects.filter(similar_id=product_id).values_list('product_id', flat=True))
+
+
+def similar_products_for(product):
+    return Product.objects.filter(
+        similar_to__product_id=product.id,
+        is_active=True
+    ).select_related('user').order_by('similar_to__position')
@@ -0,0 +1,201 @@
+"""
+Полнотекстовый поиск продуктов на SQLite FTS5.
+
+Индекс main_product_fts (title, description, category) поддерживается
+триггерами на main_product и main_category. Если FTS5 недоступен
+(другая СУБД или SQLite без модуля), поиск работает через icontains.
+"""
+import re
+
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'main_product_fts'
+
+# Веса колонок для bm25: title, description, category
+BM25_WEIGHTS = (10.0, 1.0, 3.0)
+
+# unicode61 приводит кириллицу к нижнему регистру, но не считает "ё" буквой "е" с диакритикой
+FOLD_SQL = "replace(replace({}, 'ё', 'е'), 'Ё', 'Е')"
+
+_INDEXED_ROW_SQL = (
+    f"{FOLD_SQL.format('{row}.title')}, "
+    f"{FOLD_SQL.format('{row}.description')}, "
+    f"{FOLD_SQL.format('(SELECT title FROM main_category WHERE id = {row}.category_id)')}"
+)
+
+CREATE_TABLE_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "title, description, category, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+
+CREATE_TRIGGERS_SQL = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON main_product BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, description, category)
+        VALUES (new.id, {_INDEXED_ROW_SQL.format(row='new')});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au
+    AFTER UPDATE OF title, description, category_id ON main_product BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        INSERT INTO {FTS_TABLE}(rowid, title, description, category)
+        VALUES (new.id, {_INDEXED_ROW_SQL.format(row='new')});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON main_product BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_category_au AFTER UPDATE OF title ON main_category BEGIN
+        UPDATE {FTS_TABLE} SET category = {FOLD_SQL.format('new.title')}
+        WHERE rowid IN (SELECT id FROM main_product WHERE category_id = new.id);
+    END
+    """,
+)
+
+TRIGGER_NAMES = (
+    f'{FTS_TABLE}_ai',
+    f'{FTS_TABLE}_au',
+    f'{FTS_TABLE}_ad',
+    f'{FTS_TABLE}_category_au',
+)
+
+
+def fts_supported(using='default'):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+
+    supported = getattr(connection, '_product_fts_supported', None)
+    if supported is None:
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA compile_options')
+            supported = 'ENABLE_FTS5' in {row[0] for row in cursor.fetchall()}
+        connection._product_fts_supported = supported
+    return supported
+
+
+def fts_enabled(using='default'):
+    """FTS5 доступен и индекс уже создан."""
+    if not fts_supported(using):
+        return False
+
+    connection = connections[using]
+    enabled = getattr(connection, '_product_fts_enabled', None)
+    if enabled is None:
+        enabled = FTS_TABLE in connection.introspection.table_names()
+        connection._product_fts_enabled = enabled
+    return enabled
+
+
+def install_product_fts(using='default'):
+    """
+    Создаёт таблицу индекса и триггеры, если их нет.
+    Пересоздание таблицы main_product в миграциях SQLite удаляет триггеры,
+    поэтому после восстановления индекс заполняется заново.
+    Возвращает True, если индекс был перестроен.
+    """
+    if not fts_supported(using):
+        return False
+
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name IN (%s)"
+            % ', '.join(['%s'] * (len(TRIGGER_NAMES) + 1)),
+            [FTS_TABLE, *TRIGGER_NAMES]
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+
+    if len(existing) == len(TRIGGER_NAMES) + 1:
+        connection._product_fts_enabled = True
+        return False
+
+    rebuild_product_fts(using)
+    return True
+
+
+def drop_product_fts_triggers(using='default'):
+    """
+    Удаляет триггеры перед миграциями: SQLite пересоздаёт main_product через
+    переименование, и триггер на main_category, ссылающийся на неё, ломает
+    ALTER TABLE. После миграций install_product_fts вернёт их и перестроит индекс.
+    """
+    if not fts_supported(using):
+        return
+
+    with connections[using].cursor() as cursor:
+        for name in TRIGGER_NAMES:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+
+def rebuild_product_fts(using='default'):
+    """Пересоздаёт индекс с нуля. Возвращает количество проиндексированных продуктов."""
+    if not fts_supported(using):
+        raise DatabaseError('SQLite FTS5 недоступен')
+
+    connection = connections[using]
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        for name in TRIGGER_NAMES:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+        cursor.execute(CREATE_TABLE_SQL)
+        for sql in CREATE_TRIGGERS_SQL:
+            cursor.execute(sql)
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}(rowid, title, description, category) "
+            f"SELECT main_product.id, {_INDEXED_ROW_SQL.format(row='main_product')} FROM main_product"
+        )
+        indexed = cursor.rowcount
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+
+    connection._product_fts_enabled = True
+    return indexed
+
+
+def normalize_query(text):
+    return re.findall(r'\w+', text.lower().replace('ё', 'е'))
+
+
+def build_match_expression(terms):
+    # Каждое слово ищется по префиксу, все слова обязательны
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_products(queryset, text):
+    """
+    Фильтрует queryset продуктов по поисковой строке.
+    С FTS5 результаты упорядочены по релевантности (bm25) и
+    аннотированы полем search_rank (меньше — релевантнее).
+    """
+    terms = normalize_query(text or '')
+    if not terms:
+        return queryset
+
+    if not fts_enabled(queryset.db):
+        condition = Q()
+        for term in terms:
+            condition &= (
+                Q(title__icontains=term)
+                | Q(description__icontains=term)
+                | Q(category__title__icontains=term)
+            )
+        return queryset.filter(condition)
+
+    match = build_match_expression(terms)
+    weights = ', '.join(str(weight) for weight in BM25_WEIGHTS)
+    return queryset.filter(
+        id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match])
+    ).annotate(
+        search_rank=RawSQL(
+            f'SELECT bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = main_product.id',
+            [match]
+        )
+    ).order_by('search_rank', 'id')
@@ -0,0 +1,207 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .blobs import add_references, blob_fields
+from .caching import CATALOG, CATEGORIES, invalidate, invalidate_products, product_scope
+from .models import (
+    Category, Image, PaymentMethod, Product, Rating, RatingAnswer, SimilarProduct, apply_rating_delta,
+    touch_reviews
+)
+from .recommendations import SCORE_FIELDS, referrer_ids, schedule_update
+from .thumbnails import schedule_variants, variants_ready
+
+IMAGE_FIELDS = {
+    Product: ('main_image',),
+    Image: ('file',),
+    PaymentMethod: ('qr_image',),
+    get_user_model(): ('avatar',),
+}
+
+
+@receiver(pre_save, sender=Rating)
+def rating_pre_save(sender, instance, raw, **kwargs):
+    if raw or instance.pk is None or hasattr(instance, '_stats_state'):
+        return
+
+    # Объект создан вручную с pk, берём учтённые значения из базы
+    instance._stats_state = (
+        Rating._base_manager.filter(pk=instance.pk).values_list('product_id', 'count').first()
+    )
+
+
+@receiver(post_save, sender=Rating)
+def rating_post_save(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+
+    previous = None if created else getattr(instance, '_stats_state', None)
+    current = (instance.product_id, instance.count)
+
+    if previous != current:
+        if previous is not None:
+            apply_rating_delta(*previous, sign=-1)
+        apply_rating_delta(*current, sign=1)
+    else:
+        touch_reviews(instance.product_id)
+
+    # Средняя оценка и число отзывов видны и в списках
+    invalidate_products({instance.product_id, previous[0] if previous else instance.product_id})
+    instance.remember_stats_state()
+
+
+@receiver(post_delete, sender=Rating)
+def rating_post_delete(sender, instance, **kwargs):
+    product_id, count = getattr(instance, '_stats_state', (instance.product_id, instance.count))
+    apply_rating_delta(product_id, count, sign=-1)
+    invalidate_products([product_id])
+
+
+def score_state(instance):
+    """Загруженные значения полей оценки; отложенные поля не читаются из базы."""
+    return {name: instance.__dict__[name] for name in SCORE_FIELDS if name in instance.__dict__}
+
+
+@receiver(post_init, sender=Product)
+def product_post_init(sender, instance, **kwargs):
+    instance._score_state = score_state(instance)
+
+
+@receiver(post_save, sender=Product)
+def product_post_save(sender, instance, created, raw, update_fields, **kwargs):
+    if raw:
+        return
+
+    previous, current = getattr(instance, '_score_state', {}), score_state(instance)
+    instance._score_state = current
+    # Рейтинг, updated_date и прочие поля на похожие продукты не влияют
+    if update_fields is not None and not set(update_fields) & {'category', *SCORE_FIELDS}:
+        return
+    if created or previous != current:
+        schedule_update([instance.id])
+
+
+@receiver(pre_delete, sender=Product)
+def product_pre_delete(sender, instance, **kwargs):
+    # Связи удалятся каскадом, поэтому соседей запоминаем заранее
+    schedule_update((), referrer_ids(instance.id) - {instance.id})
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_invalidate_cache(sender, instance, **kwargs):
+    invalidate_products([instance.id])
+
+
+@receiver(post_save, sender=RatingAnswer)
+@receiver(post_delete, sender=RatingAnswer)
+def rating_answer_changed(sender, instance, **kwargs):
+    if RatingAnswer.rating.is_cached(instance):
+        product_id = instance.rating.product_id
+    else:
+        product_id = Rating._base_manager.filter(id=instance.rating_id).values_list('product_id', flat=True).first()
+    if product_id is not None:
+        touch_reviews(product_id)
+        invalidate_products([product_id], catalog=False)
+
+
+@receiver(post_save, sender=Category)
+@receiver(pre_delete, sender=Category)
+def category_invalidate_cache(sender, instance, **kwargs):
+    # Список категорий и фасеты меняются, даже если в категории нет продуктов
+    product_ids = Product.objects.filter(category=instance).values_list('id', flat=True)
+    invalidate({CATALOG, CATEGORIES, *map(product_scope, product_ids)})
+
+
+@receiver(post_save, sender=Image)
+@receiver(pre_delete, sender=Image)
+def image_invalidate_cache(sender, instance, **kwargs):
+    # pre_delete: после удаления связей с продуктами уже не найти
+    invalidate_products(instance.product_set.values_list('id', flat=True), catalog=False)
+
+
+@receiver(m2m_changed, sender=Product.images.through)
+def product_images_invalidate_cache(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        invalidate_products([instance.pk], catalog=False)
+    elif action == 'pre_clear':
+        invalidate_products(instance.product_set.values_list('id', flat=True), catalog=False)
+    else:
+        invalidate_products(pk_set, catalog=False)
+
+
+@receiver(post_save, sender=get_user_model())
+def user_invalidate_pages(sender, instance, created, raw, update_fields, **kwargs):
+    # Вход сохраняет только last_login, на страницах он не виден
+    if raw or created or (update_fields is not None and set(update_fields) <= {'last_login', 'password'}):
+        return
+    # Аватар и имя показываются в похожих продуктах и в отзывах
+    product_ids = {
+        *SimilarProduct.objects.filter(similar__user=instance).values_list('product_id', flat=True),
+        *Rating.objects.filter(user=instance).values_list('product_id', flat=True),
+        *RatingAnswer.objects.filter(user=instance).values_list('rating__product_id', flat=True),
+    }
+    invalidate_products(product_ids, catalog=False)
+
+
+def image_post_save(sender, instance, raw, **kwargs):
+    if raw:
+        return
+
+    for field_name in IMAGE_FIELDS[sender]:
+        name = getattr(instance, field_name).name
+        if name and not variants_ready(name):
+            schedule_variants(name)
+
+
+for image_model in IMAGE_FIELDS:
+    post_save.connect(image_post_save, sender=image_model, dispatch_uid=f'image_variants_{image_model.__name__}')
+
+
+def loaded_file_names(instance, fields):
+    """{attname: имя файла} для загруженных полей; отложенные поля не читаются из базы."""
+    names = {}
+    for field in fields:
+        if field.attname in instance.__dict__:
+            value = instance.__dict__[field.attname]
+            names[field.attname] = getattr(value, 'name', value) or ''
+    return names
+
+
+def blob_post_init(sender, instance, **kwargs):
+    instance._blob_names = loaded_file_names(instance, BLOB_FIELDS[sender])
+
+
+def blob_post_save(sender, instance, created, update_fields, **kwargs):
+    old_names = getattr(instance, '_blob_names', {})
+    new_names = loaded_file_names(instance, BLOB_FIELDS[sender])
+    added, removed = [], []
+    for attname, name in new_names.items():
+        if update_fields is not None and attname not in update_fields:
+            new_names[attname] = old_names.get(attname, name)
+        elif created:
+            added.append(name)
+        elif attname in old_names and old_names[attname] != name:
+            added.append(name)
+            removed.append(old_names[attname])
+    add_references(added)
+    add_references(removed, -1)
+    instance._blob_names = new_names
+
+
+def blob_post_delete(sender, instance, **kwargs):
+    add_references(loaded_file_names(instance, BLOB_FIELDS[sender]).values(), -1)
+
+
+# Счётчики ссылок на файлы хранилища по содержимому (main/blobs.py)
+BLOB_FIELDS = {}
+for blob_model, blob_field in blob_fields():
+    BLOB_FIELDS.setdefault(blob_model, []).append(blob_field)
+
+for blob_model in BLOB_FIELDS:
+    uid = f'blob_refcount_{blob_model._meta.label_lower}'
+    post_init.connect(blob_post_init, sender=blob_model, dispatch_uid=uid)
+    post_save.connect(blob_post_save, sender=blob_model, dispatch_uid=uid)
+    post_delete.connect(blob_post_delete, sender=blob_model, dispatch_uid=uid)
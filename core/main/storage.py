@@ -0,0 +1,96 @@
+"""
+Хранилище загрузок по содержимому.
+
+Файл пишется во временный файл и одновременно хешируется (sha256), затем
+переносится в {каталог}/ab/cd/<sha256>.<расширение>. Если такой блоб уже
+есть, временный файл удаляется и возвращается имя существующего: одна
+и та же картинка в обложке, галерее и QR-коде хранится один раз.
+
+Публичные загрузки лежат в MEDIA_BLOB_DIR. Каталоги из
+MEDIA_PRIVATE_UPLOAD_DIRS (чеки) остаются своими каталогами, чтобы
+проверка доступа в main/media.py по-прежнему работала по префиксу.
+
+На каждый блоб заведена строка Blob со счётчиком ссылок из полей
+моделей (main/blobs.py), по нему команда gc_media удаляет ненужные файлы.
+"""
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+DIGEST_LENGTH = 64
+
+
+def blob_dir(name):
+    """Каталог блоба для имени из upload_to."""
+    directory = posixpath.dirname(name)
+    for private_dir in settings.MEDIA_PRIVATE_UPLOAD_DIRS:
+        if directory == private_dir or directory.startswith(f'{private_dir}/'):
+            return private_dir
+    return settings.MEDIA_BLOB_DIR
+
+
+def blob_name(name, digest):
+    _, extension = posixpath.splitext(name)
+    return f'{blob_dir(name)}/{digest[:2]}/{digest[2:4]}/{digest}{extension.lower()}'
+
+
+def is_blob_name(name):
+    stem, _ = posixpath.splitext(posixpath.basename(name))
+    parts = posixpath.dirname(name).split('/')
+    return (
+        len(stem) == DIGEST_LENGTH and len(parts) >= 2
+        and parts[-2] == stem[:2] and parts[-1] == stem[2:4]
+    )
+
+
+def file_digest(file):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file.read(settings.MEDIA_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # Имя определяется содержимым в _save, совпадения с upload_to не важны
+        return name
+
+    def _save(self, name, content):
+        from .blobs import register_blob
+
+        directory = self.path(blob_dir(name))
+        os.makedirs(directory, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        descriptor, tmp_path = tempfile.mkstemp(dir=directory, suffix='.upload')
+        try:
+            with os.fdopen(descriptor, 'wb') as tmp:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    size += len(chunk)
+                    tmp.write(chunk)
+
+            name = blob_name(name, digest.hexdigest())
+            full_path = self.path(name)
+            if os.path.exists(full_path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(tmp_path, self.file_permissions_mode)
+                os.replace(tmp_path, full_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        register_blob(name, size)
+        return name
@@ -0,0 +1,49 @@
+from django import template
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+from main.thumbnails import CONTENT_TYPES, srcset, variant_name, variants_ready
+
+register = template.Library()
+
+
+@register.filter
+def variant_url(image, width):
+    """URL варианта нужной ширины или оригинала, если варианты ещё не готовы."""
+    if not image:
+        return ''
+    width = int(width)
+    if width in settings.IMAGE_VARIANT_WIDTHS and variants_ready(image.name):
+        return default_storage.url(variant_name(image.name, width, settings.IMAGE_VARIANT_FORMATS[-1]))
+    return image.url
+
+
+@register.simple_tag
+def responsive_image(image, sizes='100vw', alt='', css_class='', style=''):
+    """
+    <picture> с srcset по всем вариантам. Браузер сам выбирает
+    наименьшую достаточную ширину; без вариантов выводится оригинал.
+    """
+    if not image:
+        return ''
+
+    if not variants_ready(image.name):
+        return format_html('<img src="{}" alt="{}" class="{}" style="{}">', image.url, alt, css_class, style)
+
+    *preferred, fallback = settings.IMAGE_VARIANT_FORMATS
+    sources = format_html_join(
+        '',
+        '<source type="{}" srcset="{}" sizes="{}">',
+        ((CONTENT_TYPES[image_format], srcset(image.name, image_format), sizes) for image_format in preferred)
+    )
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" style="{}" loading="lazy"></picture>',
+        sources,
+        default_storage.url(variant_name(image.name, settings.IMAGE_VARIANT_WIDTHS[0], fallback)),
+        srcset(image.name, fallback),
+        sizes,
+        alt,
+        css_class,
+        style,
+    )
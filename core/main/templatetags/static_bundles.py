@@ -0,0 +1,23 @@
+from django import template
+from django.conf import settings
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+register = template.Library()
+
+TAGS = {
+    '.css': '<link rel="stylesheet" href="{}">',
+    '.js': '<script src="{}"></script>',
+}
+
+
+@register.simple_tag
+def static_bundle(bundle):
+    """
+    Тег бандла из STATIC_BUNDLES. Без STATIC_PIPELINE бандлы не собраны,
+    поэтому подключаются исходные файлы по отдельности.
+    """
+    tag = TAGS['.css' if bundle.endswith('.css') else '.js']
+    if settings.STATIC_PIPELINE:
+        return format_html(tag, static(bundle))
+    return format_html_join('\n', tag, ((static(source),) for source in settings.STATIC_BUNDLES[bundle]))
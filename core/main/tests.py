@@ -1,3 +1,1494 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import os
+import re
+import tempfile
+import zipfile
+from datetime import timedelta
+from unittest.mock import patch
+from xml.etree import ElementTree
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages import get_messages
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.http import Http404
+from django.template import Context, Template
+from django.test import (
+    AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core.database import sqlite_database
+from core.static_pipeline import StaticFilesApplication
+from user import urls as user_urls
+from user.choices import UserRoleEnum
+from user.models import MyUser
+from . import urls as main_urls
+from . import async_views, benchmark, caching, recommendations, search, thumbnails, views
+from .db_router import routing_context, sync_sqlite_replicas
+from .choices import OrderStatusEnum
+from .benchmark import GIF, RouteRunner, build_routes, compare, run_benchmark, url_names
+from .db_benchmark import run_db_benchmark
+from .facets import cached_categories, catalog_facets, count_facets
+from .ledger import reconcile, record_payments, seller_totals
+from .blobs import collect_garbage, delete_file
+from .models import (
+    Blob, Category, Image, Payment, PaymentMethod, PaymentRequest, Product, Rating, RatingAnswer, SellerDailyRevenue,
+    SimilarProduct
+)
+from .orders import bulk_update_status
+from .pagination import InvalidCursor, KeysetPaginator
+from .query_budget import QueryBudgetExceeded, QueryRecorder, check_budget
+from .recommendations import refresh_similar_products
+from .search import search_products
+from .storage import is_blob_name
+
+
+class TempMediaMixin:
+    """Свой MEDIA_ROOT на класс тестов; каталог удаляется после класса."""
+
+    @classmethod
+    def setUpClass(cls):
+        # Настройки подменяются до setUpTestData, очистка идёт после tearDownClass
+        media_root = cls.enterClassContext(tempfile.TemporaryDirectory())
+        cls.enterClassContext(override_settings(MEDIA_ROOT=media_root, SIMILAR_PRODUCTS_ASYNC=False))
+        super().setUpClass()
+
+
+class RatingStatsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = MyUser.objects.create_user('user@test.kg', '0700000000', 'Пользователь', 'password')
+        category = Category.objects.create(title='Игры')
+        cls.product, cls.other = [
+            Product.objects.create(
+                user=cls.user, title=title, category=category, main_image='media/main_covers/i.jpg',
+                description='Описание', price=100
+            )
+            for title in ('Игра', 'Другая игра')
+        ]
+
+    def rate(self, count, product=None):
+        return Rating.objects.create(user=self.user, product=product or self.product, count=count, comment='Отзыв')
+
+    def stats(self, product=None):
+        product = Product.objects.get(id=(product or self.product).id)
+        return product.rating_count, product.rating_sum, product.rating_histogram
+
+    def expected(self, *counts):
+        return len(counts), sum(counts), {value: counts.count(value) for value in (1, 2, 3, 4, 5)}
+
+    def test_create_update_and_delete(self):
+        five = self.rate(5)
+        three = self.rate(3)
+        self.assertEqual(self.stats(), self.expected(5, 3))
+        self.assertEqual(Product.objects.get(id=self.product.id).rating_avg, 4.0)
+
+        # Изменение текста не меняет статистику, но отмечает изменение отзывов
+        reviews_updated_date = Product.objects.get(id=self.product.id).reviews_updated_date
+        five.comment = 'Новый текст'
+        five.save()
+        self.assertEqual(self.stats(), self.expected(5, 3))
+        self.assertGreater(Product.objects.get(id=self.product.id).reviews_updated_date, reviews_updated_date)
+
+        five.count = 1
+        five.save()
+        self.assertEqual(self.stats(), self.expected(1, 3))
+
+        # Повторное сохранение того же объекта не учитывает отзыв дважды
+        five.save()
+        self.assertEqual(self.stats(), self.expected(1, 3))
+
+        three.product = self.other
+        three.save()
+        self.assertEqual(self.stats(), self.expected(1))
+        self.assertEqual(self.stats(self.other), self.expected(3))
+
+        five.delete()
+        Rating.objects.filter(product=self.other).delete()
+        self.assertEqual(self.stats(), self.expected())
+        self.assertEqual(self.stats(self.other), self.expected())
+        self.assertIsNone(Product.objects.get(id=self.product.id).rating_avg)
+
+    def test_instance_created_with_existing_pk(self):
+        rating = self.rate(2)
+        Rating(
+            id=rating.id, user=self.user, product=self.product, count=4, comment='Отзыв',
+            created_date=rating.created_date
+        ).save()
+        self.assertEqual(self.stats(), self.expected(4))
+
+    def test_bulk_operations_rebuild_stats(self):
+        ratings = Rating.objects.bulk_create([
+            Rating(user=self.user, product=self.product, count=count, comment='Отзыв') for count in (1, 2, 5)
+        ])
+        self.assertEqual(self.stats(), self.expected(1, 2, 5))
+
+        Rating.objects.filter(count=1).update(count=4)
+        self.assertEqual(self.stats(), self.expected(4, 2, 5))
+
+        ratings = list(Rating.objects.filter(product=self.product).order_by('id'))
+        ratings[0].product = self.other
+        Rating.objects.bulk_update(ratings, ['product'])
+        self.assertEqual(self.stats(), self.expected(2, 5))
+        self.assertEqual(self.stats(self.other), self.expected(4))
+
+        Rating.objects.filter(count=5).update(product=self.other)
+        self.assertEqual(self.stats(), self.expected(2))
+        self.assertEqual(self.stats(self.other), self.expected(4, 5))
+
+    def test_rebuild_reports_and_fixes_drift(self):
+        self.rate(5)
+        self.rate(4, self.other)
+        Product.objects.filter(id=self.product.id).update(rating_count=7, rating_5=0)
+
+        versions = caching.get_versions([caching.product_scope(self.product.id)])
+
+        with self.assertRaises(CommandError):
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command('rebuild_rating_stats', '--check', stdout=io.StringIO())
+        self.assertEqual(Product.objects.get(id=self.product.id).rating_count, 7)
+        # Проверка ничего не меняет, в том числе версии кеша
+        self.assertEqual(caching.get_versions([caching.product_scope(self.product.id)]), versions)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            drifted = Product.rebuild_rating_stats()
+        self.assertEqual([product_id for product_id, _, _ in drifted], [self.product.id])
+        self.assertNotEqual(caching.get_versions([caching.product_scope(self.product.id)]), versions)
+        self.assertEqual(self.stats(), self.expected(5))
+        self.assertEqual(Product.rebuild_rating_stats(), [])
+
+
+class ProductSearchTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = MyUser.objects.create_user('user@test.kg', '0700000000', 'Пользователь', 'password')
+        cls.sport, books = Category.objects.create(title='Спорт'), Category.objects.create(title='Книги')
+
+        def create(title, description, category):
+            return Product.objects.create(
+                user=user, title=title, category=category, main_image='media/main_covers/i.jpg',
+                description=description, price=100
+            )
+
+        cls.racket = create('Ракетка теннисная', 'Для игры в теннис', cls.sport)
+        cls.book = create('Самоучитель', 'Как выбрать ракетку и мяч', books)
+        cls.tree = create('Ёлка новогодняя', 'Искусственная', cls.sport)
+
+    def search(self, text):
+        return list(search_products(Product.objects.all(), text))
+
+    def test_fts_ranks_title_matches_first(self):
+        self.assertTrue(search.fts_enabled())
+        self.assertEqual(self.search('ракетк'), [self.racket, self.book])
+        self.assertEqual(self.search('ракетк мяч'), [self.book])
+
+    def test_prefix_and_yo_folding(self):
+        self.assertEqual(self.search('тенн'), [self.racket])
+        self.assertEqual(self.search('елка'), [self.tree])
+        self.assertEqual(self.search('ЁЛК'), [self.tree])
+
+    def test_fts_syntax_is_escaped(self):
+        # Операторы FTS5 не действуют: остаются только слова, все обязательны
+        for text in ('ракетк*', '"ракетк', '(ракетк)', '^ракетк', 'ракетк:', '{ракетк}', "ракетк'"):
+            with self.subTest(text=text):
+                self.assertEqual(self.search(text)[0], self.racket)
+        self.assertEqual(self.search('ракетк OR ёлка'), [])
+        self.assertEqual(self.search('title:ракетк'), [])
+        self.assertEqual(self.search('ракетк NEAR('), [])
+        self.assertEqual(self.search('*"():'), list(Product.objects.all()))
+
+    def test_category_rename_is_indexed(self):
+        self.sport.title = 'Туризм'
+        self.sport.save()
+        self.assertEqual(set(self.search('туризм')), {self.racket, self.tree})
+        self.assertEqual(self.search('спорт'), [])
+
+    def test_icontains_fallback(self):
+        with patch.object(search, 'fts_enabled', return_value=False):
+            self.assertEqual(self.search('теннис'), [self.racket])
+            self.assertEqual(self.search('ракетку мяч'), [self.book])
+
+    def test_catalog_filters_by_search(self):
+        response = self.client.get(reverse('catalog'), {'product_search': 'ракетк', 'category': self.sport.id})
+        self.assertEqual(list(response.context['products'].qs), [self.racket])
+
+    def test_index_survives_trigger_drop_before_migrations(self):
+        search.drop_product_fts_triggers()
+        self.assertTrue(search.install_product_fts())
+        self.assertFalse(search.install_product_fts())
+        Product.objects.filter(id=self.racket.id).update(title='Мяч')
+        self.assertEqual(self.search('мяч'), [self.racket, self.book])
+
+
+class KeysetPaginationTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Повторяющиеся названия: порядок внутри группы задаёт первичный ключ
+        for title in ('Б', 'А', 'В', 'А', 'Б', 'А', 'В'):
+            Category.objects.create(title=title)
+
+    def walk(self, paginator):
+        pages, cursor = [], None
+        while True:
+            page = paginator.page(cursor)
+            pages.append(page)
+            if not page.has_next():
+                return pages
+            cursor = page.next_cursor
+
+    def test_cursor_round_trip(self):
+        paginator = KeysetPaginator(Category.objects.all(), 3, ordering=('-title',))
+        pages = self.walk(paginator)
+
+        expected = list(Category.objects.order_by('-title', '-id'))
+        self.assertEqual([category for page in pages for category in page], expected)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+
+        # Назад по previous_cursor возвращаются те же страницы
+        for previous, page in zip(pages, pages[1:]):
+            self.assertEqual(list(paginator.page(page.previous_cursor)), list(previous))
+        self.assertFalse(pages[0].has_previous())
+        self.assertEqual(paginator.encode_cursor(expected[0]), paginator.encode_cursor(expected[0]))
+
+    def test_equal_sort_keys_are_split_by_primary_key(self):
+        paginator = KeysetPaginator(Category.objects.filter(title='А'), 1, ordering=('title',))
+        pages = self.walk(paginator)
+
+        self.assertEqual(
+            [category.id for page in pages for category in page],
+            list(Category.objects.filter(title='А').order_by('id').values_list('id', flat=True))
+        )
+        self.assertEqual(paginator.ordering, ('title', 'id'))
+
+    def test_tampered_cursor_is_rejected(self):
+        paginator = KeysetPaginator(Category.objects.all(), 2, ordering=('title',))
+        cursor = paginator.page().next_cursor
+        payload, signature = cursor.rsplit(':', 1)
+        forged = KeysetPaginator(Category.objects.all(), 2, ordering=('-title',)).page().next_cursor.rsplit(':', 1)[0]
+
+        for bad_cursor in ('garbage', f'{forged}:{signature}', f'{payload}:{signature[::-1]}'):
+            with self.subTest(cursor=bad_cursor):
+                with self.assertRaises(InvalidCursor):
+                    paginator.page(bad_cursor)
+                self.assertEqual(list(paginator.get_page(bad_cursor)), list(paginator.page()))
+
+        # Подпись верна, но курсор выдан для другой сортировки
+        other_cursor = KeysetPaginator(Category.objects.all(), 2, ordering=('id',)).page().next_cursor
+        with self.assertRaises(InvalidCursor):
+            paginator.page(other_cursor)
+
+
+class ProductReviewsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = MyUser.objects.create_user('seller@test.kg', '0700000000', 'Продавец', 'password')
+        cls.buyer = MyUser.objects.create_user('buyer@test.kg', '0700000001', 'Покупатель', 'password')
+        category = Category.objects.create(title='Игры')
+        cls.product = Product.objects.create(
+            user=cls.seller,
+            title='Игра',
+            category=category,
+            main_image='media/main_covers/i.jpg',
+            description='Описание',
+            price=100
+        )
+
+    def create_reviews(self, count):
+        for _ in range(count):
+            rating = Rating.objects.create(user=self.buyer, product=self.product, count=5, comment='Отлично')
+            RatingAnswer.objects.create(user=self.seller, rating=rating, comment='Спасибо')
+            RatingAnswer.objects.create(user=self.buyer, rating=rating, comment='Пожалуйста')
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response
+
+    def test_reviews_page_queries_do_not_grow_with_reviews(self):
+        url = reverse('product_reviews', args=[self.product.id])
+
+        self.create_reviews(2)
+        few_queries, _ = self.count_queries(url)
+
+        self.create_reviews(20)
+        many_queries, response = self.count_queries(f'{url}?page_size=20')
+
+        self.assertEqual(few_queries, many_queries)
+        self.assertEqual(response.json()['html'].count('Отлично'), 20)
+
+    def test_reviews_are_paginated_by_cursor(self):
+        self.create_reviews(15)
+        url = reverse('product_reviews', args=[self.product.id])
+
+        first_page = self.client.get(url).json()
+        second_page = self.client.get(url, {'cursor': first_page['next_cursor']}).json()
+
+        self.assertEqual(first_page['html'].count('Отлично'), 10)
+        self.assertEqual(second_page['html'].count('Отлично'), 5)
+        self.assertIsNone(second_page['next_cursor'])
+
+    def test_invalid_cursor_is_rejected(self):
+        self.create_reviews(15)
+        url = reverse('product_reviews', args=[self.product.id])
+        cursor = self.client.get(url).json()['next_cursor']
+
+        for bad_cursor in ('garbage', cursor[:-2] + ('AA' if not cursor.endswith('AA') else 'BB')):
+            response = self.client.get(url, {'cursor': bad_cursor})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()['html'], '')
+            self.assertIsNone(response.json()['next_cursor'])
+
+    def test_detail_page_embeds_bounded_first_page(self):
+        self.create_reviews(3)
+        few_queries, _ = self.count_queries(reverse('product_detail', args=[self.product.id]))
+
+        self.create_reviews(30)
+        many_queries, response = self.count_queries(reverse('product_detail', args=[self.product.id]))
+
+        self.assertEqual(few_queries, many_queries)
+        self.assertEqual(len(response.context['reviews_page']), 10)
+        self.assertTrue(response.context['reviews_page'].has_next())
+
+
+
+@override_settings(SIMILAR_PRODUCTS_TOP_K=2)
+class SimilarProductsTestCase(TempMediaMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = MyUser.objects.create_user('seller@test.kg', '0700000000', 'Продавец', 'password')
+        cls.buyer = MyUser.objects.create_user('buyer@test.kg', '0700000001', 'Покупатель', 'password')
+        cls.sport, cls.books = Category.objects.create(title='Спорт'), Category.objects.create(title='Книги')
+        cls.racket = cls.create_product('Ракетка теннисная', 'Лёгкая ракетка для тенниса', 100)
+        cls.twin = cls.create_product('Ракетка теннисная', 'Лёгкая ракетка для тенниса', 100)
+        cls.ball = cls.create_product('Мяч футбольный', 'Кожаный мяч', 90)
+        cls.skis = cls.create_product('Лыжи беговые', 'Пластиковые лыжи', 5000)
+        cls.book = cls.create_product('Самоучитель', 'Книга о теннисе', 300, category=cls.books)
+
+    @classmethod
+    def create_product(cls, title, description, price, category=None):
+        return Product.objects.create(
+            user=cls.seller, title=title, category=category or cls.sport,
+            main_image='media/main_covers/i.jpg', description=description, price=price
+        )
+
+    def setUp(self):
+        recommendations.clear_candidates()
+
+    def links(self, product=None):
+        links = SimilarProduct.objects.order_by('product_id', 'position')
+        if product is not None:
+            links = links.filter(product=product)
+        return [(link.product_id, link.similar_id, link.position, round(link.score, 5)) for link in links]
+
+    def test_scores_top_k_and_self_exclusion(self):
+        refresh_similar_products()
+        weights = settings.SIMILAR_PRODUCTS_WEIGHTS
+
+        links = SimilarProduct.objects.filter(product=self.racket).order_by('position')
+        self.assertEqual([link.similar_id for link in links], [self.twin.id, self.ball.id])
+        # Одинаковые тексты, цена и категория
+        self.assertAlmostEqual(links[0].score, weights['text'] + weights['price'] + weights['category'], places=5)
+        self.assertGreater(links[0].score, links[1].score)
+
+        for product_id, similar_id, position, _ in self.links():
+            self.assertNotEqual(product_id, similar_id)
+            self.assertLess(position, 2)
+        self.assertFalse(SimilarProduct.objects.filter(similar=self.book).exists())
+
+    def test_copurchases_add_candidates_from_other_categories(self):
+        for product in (self.skis, self.book):
+            PaymentRequest.objects.create(
+                user=self.buyer, product=product, quantity=1, check_image='media/check/i.jpg', total_price=1
+            )
+        refresh_similar_products()
+        self.assertIn(self.book.id, [link[1] for link in self.links(self.skis)])
+
+    def test_new_product_enters_neighbour_lists_incrementally(self):
+        refresh_similar_products()
+        self.assertNotIn(self.ball.id, [link[1] for link in self.links(self.skis)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            boots = self.create_product('Ботинки лыжные', 'Ботинки для беговых лыж', 4800)
+        # Новый продукт в чужом списке без полного пересчёта
+        self.assertEqual([link[1] for link in self.links(self.skis)][0], boots.id)
+        self.assertEqual([link[1] for link in self.links(boots)][0], self.skis.id)
+
+        # Совпадает с пересчётом всех продуктов по той же матрице
+        incremental = self.links()
+        refresh_similar_products(list(Product.objects.values_list('id', flat=True)))
+        self.assertEqual(self.links(), incremental)
+
+    def test_update_scores_only_affected_products(self):
+        refresh_similar_products()
+        with patch.object(recommendations, '_save_links', wraps=recommendations._save_links) as save_links:
+            recommendations.update_similar_products([self.book.id])
+        scored = {product_id for call in save_links.call_args_list for product_id in call.args[1]}
+        self.assertEqual(scored, {self.book.id})
+
+    def test_deactivated_product_leaves_lists(self):
+        refresh_similar_products()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.twin.is_active = False
+            self.twin.save()
+
+        self.assertEqual(self.links(self.twin), [])
+        self.assertNotIn(self.twin.id, [link[1] for link in self.links()])
+        self.assertEqual(len(self.links(self.racket)), 2)
+
+    def test_update_only_when_score_fields_change(self):
+        with patch.object(recommendations, 'update_similar_products') as update:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.ball.save(update_fields=['updated_date'])
+                self.ball.rating_count = 3
+                self.ball.save()
+                Product.objects.get(id=self.ball.id).save()
+            update.assert_not_called()
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.ball.description = 'Мяч для мини-футбола'
+                self.ball.save()
+                skis = Product.objects.only('id', 'price').get(id=self.skis.id)
+                skis.price = 4000
+                skis.save(update_fields=['price'])
+        self.assertEqual([call.args[0] for call in update.call_args_list], [{self.ball.id}, {self.skis.id}])
+
+
+
+class LedgerTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = MyUser.objects.create_user('seller@test.kg', '0700000000', 'Продавец', 'password')
+        cls.other = MyUser.objects.create_user('other@test.kg', '0700000001', 'Другой', 'password')
+
+    def pay(self, seller, total_price, quantity=1, days_ago=0, record=True):
+        payment = Payment.objects.create(
+            seller=seller, user='Покупатель', product='Продукт', quantity=quantity,
+            check_image='media/check/i.jpg', total_price=total_price
+        )
+        if days_ago:
+            payment.created_date -= timedelta(days=days_ago)
+            Payment.objects.filter(id=payment.id).update(created_date=payment.created_date)
+        if record:
+            record_payments([payment])
+        return payment
+
+    def rollups(self):
+        return {
+            (row.seller_id, row.date): (row.payments_count, row.quantity, row.revenue)
+            for row in SellerDailyRevenue.objects.all()
+        }
+
+    def test_record_payments_groups_by_seller_and_day(self):
+        today = timezone.localdate()
+        self.pay(self.seller, 100, quantity=2)
+        self.pay(self.seller, 50)
+        self.pay(self.seller, 30, days_ago=1)
+        self.pay(self.other, 10)
+
+        self.assertEqual(self.rollups(), {
+            (self.seller.id, today): (2, 3, 150),
+            (self.seller.id, today - timedelta(days=1)): (1, 1, 30),
+            (self.other.id, today): (1, 1, 10),
+        })
+        self.assertEqual(seller_totals(self.seller), {'payments_count': 3, 'quantity': 4, 'revenue': 180})
+
+    def test_reconcile_detects_and_fixes_drift(self):
+        self.pay(self.seller, 100)
+        self.pay(self.seller, 30, days_ago=1)
+        self.pay(self.other, 10)
+        expected = self.rollups()
+
+        SellerDailyRevenue.objects.filter(seller=self.seller, date=timezone.localdate()).update(revenue=1)
+        SellerDailyRevenue.objects.filter(seller=self.other).delete()
+        unrecorded = self.pay(self.seller, 5, days_ago=1, record=False)
+        expected[self.seller.id, timezone.localdate(unrecorded.created_date)] = (2, 2, 35)
+
+        drifted = self.rollups()
+        self.assertEqual(len(reconcile(fix=False)), 3)
+        self.assertEqual(self.rollups(), drifted)
+        self.assertEqual(len(reconcile([self.other.id], fix=False)), 1)
+
+        self.assertEqual(len(reconcile()), 3)
+        self.assertEqual(self.rollups(), expected)
+        self.assertEqual(reconcile(fix=False), [])
+
+
+def small_image(name='image.gif'):
+    return SimpleUploadedFile(name, GIF, content_type='image/gif')
+
+
+class StorefrontTestCase(TempMediaMixin, TestCase):
+    """Продавец с продуктами, отзывами, заявками и оплатами."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = MyUser.objects.create_user('seller@test.kg', '0700000000', 'Продавец', 'password')
+        cls.buyer = MyUser.objects.create_user('buyer@test.kg', '0700000001', 'Покупатель', 'password')
+        cls.accountant = MyUser.objects.create_user('accountant@test.kg', '0700000002', 'Бухгалтер', 'password')
+        cls.accountant.role = UserRoleEnum.ACCOUNTANT
+        cls.accountant.save()
+
+        categories = [Category.objects.create(title=title) for title in ('Игры', 'Книги', 'Музыка')]
+        images = [Image.objects.create(file=f'media/product_file/{index}.jpg') for index in range(3)]
+        cls.products = []
+        for index in range(12):
+            product = Product.objects.create(
+                user=cls.seller if index % 2 else cls.buyer,
+                title=f'Продукт {index}',
+                category=categories[index % 3],
+                main_image='media/main_covers/i.jpg',
+                description=f'Описание продукта {index}',
+                price=100 + index
+            )
+            product.images.set(images)
+            cls.products.append(product)
+        cls.product = cls.products[1]
+
+        for product in cls.products:
+            for count in (3, 4, 5):
+                rating = Rating.objects.create(user=cls.buyer, product=product, count=count, comment='Отзыв')
+                RatingAnswer.objects.create(user=product.user, rating=rating, comment='Ответ')
+        cls.rating = Rating.objects.filter(product=cls.product).first()
+
+        for index in range(3):
+            PaymentMethod.objects.create(user=cls.seller, title=f'Банк {index}', qr_image='media/qr/mbank.jpg')
+
+        cls.payment_requests = [
+            PaymentRequest.objects.create(
+                user=cls.buyer,
+                product=product,
+                quantity=2,
+                check_image='media/check/i.jpg',
+                total_price=product.price * 2
+            )
+            for product in cls.products if product.user_id == cls.seller.id
+        ]
+        bulk_update_status([payment_request.id for payment_request in cls.payment_requests[:3]], 'accepted')
+        refresh_similar_products()
+
+
+class QueryBudgetTestCase(StorefrontTestCase):
+    """Каждый маршрут укладывается в бюджет из settings.QUERY_BUDGETS и не делает N+1."""
+
+    def routes(self):
+        """url_name -> (метод, args, данные) в худшем по числу запросов состоянии."""
+        pending = self.payment_requests[-1]
+        # Замена картинки из хранилища blob, чек в blob и первая оплата за день
+        old_image = default_storage.save('main_covers/old.gif', ContentFile(b'old'))
+        Product.objects.filter(id=self.product.id).update(main_image=old_image)
+        check_image = default_storage.save('check/check.gif', ContentFile(b'check'))
+        PaymentRequest.objects.filter(id=pending.id).update(check_image=check_image)
+        SellerDailyRevenue.objects.filter(seller=self.seller).delete()
+        return {
+            'index': ('get', [], None),
+            'catalog': ('get', [], {'product_search': 'продукт', 'price__gte': 100}),
+            'product_detail': ('get', [self.product.id], None),
+            'product_reviews': ('get', [self.product.id], None),
+            'product_create': ('post', [], {
+                'title': 'Новый',
+                'category': self.product.category_id,
+                'main_image': small_image(),
+                'images': [image.id for image in Image.objects.all()],
+                'description': 'Описание',
+                'price': 10,
+            }),
+            'product_update': ('post', [self.product.id], {
+                'title': 'Изменённый',
+                'main_image': small_image('new.gif'),
+                'category': self.product.category_id,
+                'images': [image.id for image in Image.objects.all()],
+                'description': 'Описание',
+                'price': 20,
+            }),
+            'rating_create': ('post', [self.product.id], {'comment': 'Хорошо', 'count': 4}),
+            'rating_answer_create': ('post', [self.rating.id], {'comment': 'Спасибо'}),
+            'user_profile': ('get', [], None),
+            'payment_requests': ('get', [], None),
+            'payment_request_update_status': ('post', [pending.id], {'status': 'accepted'}),
+            'payment_request_bulk_update_status': ('post', [], {
+                'status': 'denied',
+                'payment_request_ids': [payment_request.id for payment_request in self.payment_requests[3:5]],
+            }),
+            'payments': ('get', [], None),
+            'product_payment_create': ('post', [self.product.id], {'quantity': 1, 'check': small_image('check.gif')}),
+        }
+
+    def test_every_route_has_budget(self):
+        url_names = {
+            pattern.name
+            for urlconf in (main_urls, user_urls)
+            for pattern in urlconf.urlpatterns
+        }
+        self.assertEqual(url_names - settings.QUERY_BUDGETS.keys(), set())
+
+    def test_routes_within_budget(self):
+        for url_name, (method, args, data) in self.routes().items():
+            with self.subTest(url_name=url_name):
+                self.client.force_login(self.seller)
+                with QueryRecorder() as recorder:
+                    response = getattr(self.client, method)(reverse(url_name, args=args), data)
+                self.assertLess(response.status_code, 400)
+                check_budget(url_name, recorder)
+
+    @override_settings(QUERY_BUDGET_MODE='raise', QUERY_BUDGETS={**settings.QUERY_BUDGETS, 'product_detail': 1})
+    def test_middleware_raises_over_budget(self):
+        cache.clear()
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(reverse('product_detail', args=[self.product.id]))
+
+    @override_settings(QUERY_BUDGET_MODE='warn')
+    def test_middleware_reports_query_count(self):
+        response = self.client.get(reverse('product_detail', args=[self.product.id]))
+        self.assertGreater(int(response['X-Query-Count']), 0)
+
+    @override_settings(QUERY_BUDGET_MODE='off')
+    def test_middleware_disabled_when_off(self):
+        response = self.client.get(reverse('product_detail', args=[self.product.id]))
+        self.assertNotIn('X-Query-Count', response)
+
+
+class BenchmarkTestCase(StorefrontTestCase):
+    def test_benchmark_covers_every_route_and_rolls_back(self):
+        counts = (Product.objects.count(), Rating.objects.count(), PaymentRequest.objects.filter(status='accepted').count())
+        routes = build_routes()
+        media_files = [files for _, _, files in os.walk(settings.MEDIA_ROOT)]
+
+        result = run_benchmark(routes, iterations=2, warmup=0)
+
+        self.assertEqual(result['routes'].keys(), url_names())
+        for url_name, stats in result['routes'].items():
+            with self.subTest(url_name=url_name):
+                self.assertEqual(stats['requests'], 2)
+                self.assertEqual(stats['errors'], 0)
+                self.assertIsNotNone(stats['latency_ms']['p99'])
+        self.assertEqual(
+            counts,
+            (Product.objects.count(), Rating.objects.count(), PaymentRequest.objects.filter(status='accepted').count())
+        )
+        # Загрузки откатанных запросов не остаются в хранилище
+        self.assertEqual([files for _, _, files in os.walk(settings.MEDIA_ROOT)], media_files)
+
+    def test_only_writing_routes_run_in_transaction(self):
+        routes = build_routes()
+        with patch.object(benchmark, 'transaction', wraps=transaction) as mocked:
+            for url_name in ('index', 'product_detail', 'payment_request_update_status', 'logout'):
+                RouteRunner(routes[url_name], iterations=1, concurrency=1, warmup=0).request()
+
+        self.assertEqual(mocked.atomic.call_count, 2)
+        self.assertEqual(mocked.set_rollback.call_count, 2)
+
+    def test_compare_flags_query_regressions(self):
+        base = {'routes': {'index': {'latency_ms': {'p95': 10.0}, 'queries': {'max': 3}, 'peak_memory_kb': 100}}}
+        same = {'routes': {'index': {'latency_ms': {'p95': 10.5}, 'queries': {'max': 3}, 'peak_memory_kb': 105}}}
+        worse = {'routes': {'index': {'latency_ms': {'p95': 10.5}, 'queries': {'max': 4}, 'peak_memory_kb': 105}}}
+
+        self.assertEqual(compare(base, same)[1], [])
+        self.assertEqual([row[1] for row in compare(base, worse)[1]], ['queries.max'])
+
+
+class DatabaseProfileTestCase(StorefrontTestCase):
+    def test_tuned_profile_applies_pragmas_on_connect(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+        self.assertNotIn('transaction_mode', connections['replica'].settings_dict['OPTIONS'])
+        self.assertNotIn('OPTIONS', sqlite_database('db.sqlite3', 'baseline'))
+
+
+class ExportTestCase(StorefrontTestCase):
+    def export(self, kind, **params):
+        self.client.force_login(self.accountant)
+        with QueryRecorder() as recorder:
+            response = self.client.get(reverse('export', args=[kind]), params)
+        return response, recorder
+
+    def test_csv_streams_filtered_requests_within_budget(self):
+        response, recorder = self.export('payment_requests', status='accepted', seller=self.seller.id)
+
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment; filename="payment_requests-', response['Content-Disposition'])
+        check_budget('export', recorder)
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode('utf-8-sig'))))
+        self.assertEqual(rows[0][0], 'ID')
+        self.assertEqual(sorted(int(row[0]) for row in rows[1:]), [item.id for item in self.payment_requests[:3]])
+        self.assertEqual({row[6] for row in rows[1:]}, {'Принято'})
+
+    def test_xlsx_is_a_valid_workbook(self):
+        response, _ = self.export('payments', format='xlsx')
+
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertIsNone(archive.testzip())
+        sheet = ElementTree.fromstring(archive.read('xl/worksheets/sheet1.xml'))
+        namespace = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+        rows = sheet.findall(f'{namespace}sheetData/{namespace}row')
+        self.assertEqual(len(rows), Payment.objects.count() + 1)
+        self.assertEqual(rows[1].find(f'{namespace}c/{namespace}v').text, str(Payment.objects.order_by('id')[0].id))
+
+    def test_only_accountant_and_valid_filters(self):
+        self.client.force_login(self.seller)
+        self.assertEqual(self.client.get(reverse('export', args=['payments'])).status_code, 404)
+
+        response, _ = self.export('payments', date_from='вчера')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('date_from', response.json()['errors'])
+
+    def test_command_writes_gzipped_csv(self):
+        output = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'payments.csv.gz')
+        month = Payment.objects.first().created_date.strftime('%Y-%m')
+
+        call_command('export_payments', 'payments', month=month, output=output, stdout=io.StringIO())
+
+        with gzip.open(output, 'rt', encoding='utf-8-sig') as file:
+            rows = list(csv.reader(file))
+        self.assertEqual(len(rows), Payment.objects.count() + 1)
+
+
+class BulkStatusTestCase(StorefrontTestCase):
+    def post(self, user, payment_requests, status='accepted'):
+        self.client.force_login(user)
+        response = self.client.post(reverse('payment_request_bulk_update_status'), {
+            'status': status,
+            'payment_request_ids': [payment_request.id for payment_request in payment_requests],
+        }, follow=True)
+        return [str(message) for message in get_messages(response.wsgi_request)]
+
+    def statuses(self):
+        return list(
+            PaymentRequest.objects.filter(id__in=[payment_request.id for payment_request in self.payment_requests])
+            .order_by('id').values_list('status', flat=True)
+        )
+
+    def test_accept_creates_payments_and_rollups(self):
+        pending = self.payment_requests[3:5]
+        totals = seller_totals(self.seller)
+
+        self.assertEqual(self.post(self.seller, pending), ['Успешно изменено: 2'])
+
+        self.assertEqual(self.statuses()[3:5], ['accepted', 'accepted'])
+        payments = Payment.objects.filter(seller=self.seller).order_by('-id')[:2]
+        self.assertEqual(
+            sorted(payment.total_price for payment in payments),
+            sorted(payment_request.total_price for payment_request in pending)
+        )
+        new_totals = seller_totals(self.seller)
+        self.assertEqual(new_totals['payments_count'], totals['payments_count'] + 2)
+        self.assertEqual(
+            new_totals['revenue'], totals['revenue'] + sum(payment_request.total_price for payment_request in pending)
+        )
+
+    def test_repeated_accept_counts_only_changed_requests(self):
+        payments_count = Payment.objects.filter(seller=self.seller).count()
+        batch = [self.payment_requests[0], self.payment_requests[3]]
+
+        self.assertEqual(self.post(self.seller, batch), ['Успешно изменено: 1'])
+        self.assertEqual(self.post(self.seller, batch), ['Успешно изменено: 0'])
+        self.assertEqual(Payment.objects.filter(seller=self.seller).count(), payments_count + 1)
+        self.assertEqual(seller_totals(self.seller)['payments_count'], payments_count + 1)
+
+    def test_foreign_requests_reject_whole_batch(self):
+        statuses = self.statuses()
+        foreign = PaymentRequest.objects.create(
+            user=self.seller, product=self.products[0], quantity=1, check_image='media/check/i.jpg', total_price=100
+        )
+
+        self.assertEqual(
+            self.post(self.buyer, self.payment_requests[3:5]),
+            ['Часть заявок не найдена или принадлежит другому продавцу']
+        )
+        self.assertEqual(
+            self.post(self.seller, [self.payment_requests[3], foreign]),
+            ['Часть заявок не найдена или принадлежит другому продавцу']
+        )
+        self.assertEqual(self.post(self.seller, self.payment_requests[3:5], status='paid'), ['Неизвестный статус: paid'])
+
+        self.assertEqual(self.statuses(), statuses)
+        foreign.refresh_from_db()
+        self.assertEqual(foreign.status, OrderStatusEnum.IN_PROCESSING)
+
+
+class StorefrontCacheTestCase(StorefrontTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response.content.decode()
+
+    def test_index_grid_is_cached_until_product_changes(self):
+        first_queries, _ = self.count_queries(reverse('index'))
+        cached_queries, _ = self.count_queries(reverse('index'))
+        self.assertLess(cached_queries, first_queries)
+
+        self.product.title = 'Новое название'
+        self.product.save()
+
+        _, content = self.count_queries(reverse('index'))
+        self.assertIn('Новое название', content)
+
+    def test_anonymous_detail_page_is_cached_with_fresh_csrf_token(self):
+        url = reverse('product_detail', args=[self.product.id])
+        first_queries, _ = self.count_queries(url)
+        cached_queries, content = self.count_queries(url)
+
+        # Остаётся только запрос валидаторов ETag/Last-Modified
+        self.assertEqual(cached_queries, 1)
+        self.assertNotIn(caching.CSRF_PLACEHOLDER, content)
+        self.assertIn('csrfmiddlewaretoken', content)
+
+        Rating.objects.create(user=self.buyer, product=self.product, count=1, comment='Новый отзыв')
+        self.assertIn('Новый отзыв', self.count_queries(url)[1])
+
+    def test_detail_page_is_invalidated_by_image_changes(self):
+        url = reverse('product_detail', args=[self.product.id])
+        self.client.get(url)
+
+        image = Image.objects.create(file='media/product_file/new.jpg')
+        self.product.images.add(image)
+
+        self.assertGreater(self.count_queries(url)[0], 0)
+
+    def test_authenticated_detail_page_is_not_cached(self):
+        self.client.force_login(self.buyer)
+        url = reverse('product_detail', args=[self.product.id])
+        self.client.get(url)
+
+        self.assertGreater(self.count_queries(url)[0], 0)
+
+    def test_catalog_key_ignores_unknown_params_and_order(self):
+        url = reverse('catalog')
+        with patch.object(views, 'render_catalog_results', wraps=views.render_catalog_results) as render_results:
+            self.client.get(url, {'price__gte': 100, 'page_size': 1, 'ordering': 'price'})
+            response = self.client.get(f'{url}?ordering=price&x=1&page_size=1&price__gte=100&utm_source=mail')
+            self.client.get(url, {'price__gte': 'abc'})
+            self.client.get(url, {'x': 2})
+
+        self.assertEqual(render_results.call_count, 2)
+        # Ссылки сохранённого фрагмента не несут посторонних параметров
+        pagination = response.content.decode().split('pagination-block')[1]
+        self.assertIn('?ordering=price&amp;price__gte=100&amp;page_size=1&amp;cursor=', pagination)
+        self.assertNotIn('utm_source', pagination)
+
+    def test_stale_entry_is_served_while_another_request_renders(self):
+        caching.get_or_render('fragment', [], [caching.CATALOG], lambda: 'старое')
+        caching.invalidate([caching.CATALOG])
+        cache.add(f'{caching._entry_key("fragment", [])}:lock', True)
+
+        rendered = []
+        value = caching.get_or_render('fragment', [], [caching.CATALOG], lambda: rendered.append(1) or 'новое')
+
+        self.assertEqual(value, 'старое')
+        self.assertEqual(rendered, [])
+
+
+class CatalogFacetsTestCase(StorefrontTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def filterset(self, **params):
+        return views.catalog_filter(RequestFactory().get(reverse('catalog'), params))
+
+    def test_counts_come_from_one_grouped_query(self):
+        filterset = self.filterset(price__gte=105)
+        with CaptureQueriesContext(connection) as context:
+            counts = count_facets(filterset.qs)
+        self.assertEqual(len(context.captured_queries), 1)
+
+        products = list(filterset.qs)
+        self.assertEqual(counts['total'], len(products))
+        self.assertEqual(
+            counts['categories'],
+            {category_id: [product.category_id for product in products].count(category_id)
+             for category_id in {product.category_id for product in products}}
+        )
+        self.assertEqual(sum(counts['prices']), len(products))
+        # У каждого продукта оценки 3, 4 и 5, средняя 4
+        self.assertEqual(counts['ratings'], {4: len(products), 3: len(products), 2: len(products), 1: len(products)})
+
+    def test_cached_per_normalized_filter(self):
+        category_id = self.product.category_id
+        catalog_facets(self.filterset(category=category_id, ordering='price'))
+
+        with CaptureQueriesContext(connection) as context:
+            facets = catalog_facets(self.filterset(category=category_id, ordering='-rating', cursor='x'))
+        self.assertEqual(len(context.captured_queries), 0)
+        self.assertEqual([category['active'] for category in facets['categories']], [True])
+
+    def test_category_list_cached_until_categories_change(self):
+        cached_categories()
+        with CaptureQueriesContext(connection) as context:
+            cached_categories()
+        self.assertEqual(len(context.captured_queries), 0)
+
+        category = Category.objects.create(title='Аааа')
+        self.assertEqual(cached_categories()[0], (category.id, 'Аааа'))
+
+        response = self.client.get(reverse('catalog'), {'rating__gte': 4})
+        self.assertContains(response, 'Найдено: 12')
+        self.assertContains(response, f'?rating__gte=4&amp;category={self.product.category_id}')
+        self.assertContains(response, '<option value="" selected>---------</option>', html=True)
+
+
+class ConditionalGetTestCase(StorefrontTestCase):
+    def assertNotModified(self, url, **headers):
+        response = self.client.get(url, headers=headers)
+        self.assertEqual(response.status_code, 304)
+
+    def test_detail_page_returns_304_until_product_or_reviews_change(self):
+        url = reverse('product_detail', args=[self.product.id])
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('"'))
+
+        with CaptureQueriesContext(connection) as context:
+            self.assertNotModified(url, if_none_match=etag)
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertNotModified(url, if_modified_since=response['Last-Modified'])
+
+        RatingAnswer.objects.create(user=self.seller, rating=self.rating, comment='Ещё ответ')
+        response = self.client.get(url, headers={'if_none_match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_detail_etag_changes_with_related_objects(self):
+        url = reverse('product_detail', args=[self.product.id])
+        updated_date = Product.objects.get(id=self.product.id).updated_date
+        similar = Product.objects.filter(similar_to__product=self.product).first()
+        image = self.product.images.first()
+
+        changes = [
+            lambda: self.product.images.add(Image.objects.create(file='media/product_file/new.jpg')),
+            lambda: Image.objects.filter(id=image.id).first().save(),
+            lambda: Category.objects.filter(id=self.product.category_id).first().save(),
+            lambda: refresh_similar_products([self.product.id]),
+            lambda: MyUser.objects.filter(id=similar.user_id).first().save(),
+        ]
+        for change in changes:
+            etag = self.client.get(url)['ETag']
+            change()
+            self.assertEqual(self.client.get(url, headers={'if_none_match': etag}).status_code, 200)
+
+        self.assertEqual(Product.objects.get(id=self.product.id).updated_date, updated_date)
+
+    def test_last_login_keeps_etag(self):
+        url = reverse('product_detail', args=[self.product.id])
+        etag = self.client.get(url)['ETag']
+        self.client.login(email='seller@test.kg', password='password')
+        self.client.logout()
+        self.assertNotModified(url, if_none_match=etag)
+
+    def test_etag_depends_on_user(self):
+        url = reverse('index')
+        etag = self.client.get(url)['ETag']
+
+        self.client.force_login(self.buyer)
+        response = self.client.get(url, headers={'if_none_match': etag})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_catalog_etag_changes_when_product_deleted(self):
+        url = reverse('catalog')
+        etag = self.client.get(url)['ETag']
+        self.assertNotModified(url, if_none_match=etag)
+
+        Product.objects.filter(id=self.products[0].id).delete()
+
+        self.assertEqual(self.client.get(url, headers={'if_none_match': etag}).status_code, 200)
+
+
+class AsyncViewsTestCase(StorefrontTestCase):
+    """Async-варианты вьюх отдают то же, что и синхронные."""
+
+    def setUp(self):
+        cache.clear()
+
+    def prepare(self, request, user=None):
+        request.user = user or AnonymousUser()
+        request.session = SessionStore()
+        request._messages = FallbackStorage(request)
+        return request
+
+    async def test_pages_match_sync_views(self):
+        pages = [
+            ('index_view', reverse('index'), {}, None),
+            ('product_list_view', reverse('catalog'), {}, None),
+            ('product_detail_view', reverse('product_detail', args=[self.product.id]), {'product_id': self.product.id}, None),
+            ('user_profile_view', reverse('user_profile'), {}, self.seller),
+        ]
+        for name, url, kwargs, user in pages:
+            with self.subTest(view=name):
+                await cache.aclear()
+                async_response = await getattr(async_views, name)(
+                    self.prepare(AsyncRequestFactory().get(url), user), **kwargs
+                )
+                await cache.aclear()
+                sync_response = await sync_to_async(getattr(views, name))(
+                    self.prepare(RequestFactory().get(url), user), **kwargs
+                )
+
+                self.assertEqual(async_response.status_code, 200)
+                self.assertEqual(
+                    strip_csrf(async_response.content.decode()),
+                    strip_csrf(sync_response.content.decode())
+                )
+
+    async def test_missing_product_is_404(self):
+        with self.assertRaises(Http404):
+            await async_views.product_detail_view(
+                self.prepare(AsyncRequestFactory().get('/product/0/')), product_id=0
+            )
+
+    async def test_profile_redirects_anonymous(self):
+        response = await async_views.user_profile_view(self.prepare(AsyncRequestFactory().get('/profile/')))
+        self.assertEqual(response.status_code, 302)
+
+
+def strip_csrf(content):
+    return re.sub(r'name="csrfmiddlewaretoken" value="[^"]+"', '', content)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTestCase(TempMediaMixin, TransactionTestCase):
+    """Две SQLite-базы: реплика обновляется только через sync_sqlite_replicas."""
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.seller = MyUser.objects.create_user('seller@test.kg', '0700000000', 'Продавец', 'password')
+        self.buyer = MyUser.objects.create_user('buyer@test.kg', '0700000001', 'Покупатель', 'password')
+        category = Category.objects.create(title='Игры')
+        self.product = Product.objects.create(
+            user=self.seller,
+            title='Игра',
+            category=category,
+            main_image='media/main_covers/i.jpg',
+            description='Описание',
+            price=100
+        )
+        self.payment_request = PaymentRequest.objects.create(
+            user=self.buyer,
+            product=self.product,
+            quantity=1,
+            check_image='media/check/i.jpg',
+            total_price=100
+        )
+        sync_sqlite_replicas()
+
+    def test_reads_go_to_replica_until_synced(self):
+        with routing_context():
+            Category.objects.create(title='Книги')
+
+        with routing_context():
+            self.assertEqual(Category.objects.db, 'replica')
+            self.assertFalse(Category.objects.filter(title='Книги').exists())
+
+        sync_sqlite_replicas()
+        with routing_context():
+            self.assertTrue(Category.objects.filter(title='Книги').exists())
+
+    def test_reads_after_write_use_primary(self):
+        with routing_context():
+            Category.objects.create(title='Книги')
+            self.assertEqual(Category.objects.db, 'default')
+            self.assertTrue(Category.objects.filter(title='Книги').exists())
+
+    def test_seller_sees_accepted_request_after_redirect(self):
+        self.client.force_login(self.seller)
+        sync_sqlite_replicas()
+
+        response = self.client.post(
+            reverse('payment_request_update_status', args=[self.payment_request.id]),
+            {'status': 'accepted'}
+        )
+        self.assertIn('db_primary_until', response.cookies)
+
+        response = self.client.get(reverse('payment_requests'))
+        self.assertEqual([item.status for item in response.context['payment_requests']], ['accepted'])
+
+        # Без cookie страница читается с отстающей реплики
+        self.client.cookies.pop('db_primary_until')
+        response = self.client.get(reverse('payment_requests'))
+        self.assertEqual([item.status for item in response.context['payment_requests']], ['in_processing'])
+
+
+class DatabaseBenchmarkTestCase(TempMediaMixin, TransactionTestCase):
+    """Копия базы через backup API видит только закоммиченные данные."""
+
+    def setUp(self):
+        seller = MyUser.objects.create_user('seller@test.kg', '0700000000', 'Продавец', 'password')
+        product = Product.objects.create(
+            user=seller,
+            title='Игра',
+            category=Category.objects.create(title='Игры'),
+            main_image='media/main_covers/i.jpg',
+            description='Описание',
+            price=100
+        )
+        for _ in range(2):
+            PaymentRequest.objects.create(
+                user=seller, product=product, quantity=1, check_image='media/check/i.jpg', total_price=100
+            )
+
+    def test_db_benchmark_uses_copies_of_the_database(self):
+        result = run_db_benchmark(readers=1, writers=2, duration=0.2)
+
+        for profile in ('baseline', 'tuned'):
+            with self.subTest(profile=profile):
+                stats = result['profiles'][profile]
+                self.assertGreater(stats['reads']['operations'], 0)
+                self.assertGreater(stats['writes']['operations'], 0)
+        self.assertFalse(PaymentRequest.objects.filter(status='accepted').exists())
+        self.assertFalse(Payment.objects.exists())
+
+
+@override_settings(
+    STATIC_PIPELINE=True,
+    STORAGES={
+        'default': {'BACKEND': 'main.storage.ContentAddressedStorage'},
+        'staticfiles': {'BACKEND': 'core.static_pipeline.PipelineStaticFilesStorage'},
+    },
+)
+class StaticPipelineTestCase(SimpleTestCase):
+    """collectstatic собирает бандлы с хешами и .gz, WSGI-обёртка их отдаёт."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.enterClassContext(override_settings(STATIC_ROOT=cls.enterClassContext(tempfile.TemporaryDirectory())))
+        # В CSS темы есть ссылки на отсутствующие файлы
+        with cls().assertLogs('core.static_pipeline', 'WARNING'):
+            call_command('collectstatic', interactive=False, verbosity=0)
+        cls.app = StaticFilesApplication(cls.django_app)
+
+    @staticmethod
+    def django_app(environ, start_response):
+        start_response('200 OK', [])
+        return [b'django']
+
+    def get(self, path, **environ):
+        response = {}
+
+        def start_response(status, headers):
+            response['status'] = status
+            response['headers'] = dict(headers)
+
+        body = b''.join(self.app({'PATH_INFO': path, 'REQUEST_METHOD': 'GET', **environ}, start_response))
+        return response['status'], response['headers'], body
+
+    def test_bundles_are_hashed_and_compressed(self):
+        template = Template("{% load static_bundles %}{% static_bundle 'bundles/site.css' %}{% static_bundle 'bundles/site.js' %}")
+        html = template.render(Context())
+        urls = re.findall(r'(?:href|src)="([^"]+)"', html)
+        self.assertEqual(len(urls), 2)
+
+        css_url, js_url = urls
+        self.assertRegex(css_url, r'^/static/bundles/site\.[0-9a-f]{12}\.css$')
+        status, headers, body = self.get(css_url, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertIn('immutable', headers['Cache-Control'])
+        css = gzip.decompress(body).decode()
+        self.assertTrue(css.startswith('@charset "UTF-8";\n@import url("https://fonts.googleapis.com/'))
+        # Относительные url() указывают на файлы с хешем от каталога бандла
+        self.assertRegex(css, r'url\("\.\./assets/webfonts/fa-solid-900\.[0-9a-f]{12}\.woff2"\)')
+
+        status, headers, body = self.get(js_url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertNotIn('Content-Encoding', headers)
+        self.assertEqual(int(headers['Content-Length']), len(body))
+        self.assertIn('jQuery', body.decode())
+
+    def test_conditional_and_unhashed_requests(self):
+        status, headers, _ = self.get('/static/bundles/site.css')
+        self.assertEqual(headers['Cache-Control'], settings.STATIC_CACHE_CONTROL)
+        status, _, body = self.get('/static/bundles/site.css', HTTP_IF_NONE_MATCH=headers['ETag'])
+        self.assertEqual((status, body), ('304 Not Modified', b''))
+
+        self.assertEqual(self.get('/static/missing.css')[0], '404 Not Found')
+        self.assertEqual(self.get('/catalog/')[2], b'django')
+
+
+class MediaServingTestCase(StorefrontTestCase):
+    """Раздача MEDIA_ROOT: кеширование, Range и доступ к чекам."""
+
+    def setUp(self):
+        self.content = bytes(range(256)) * 8
+        for name in ('media/main_covers/cover.jpg', 'media/check/i.jpg'):
+            path = os.path.join(settings.MEDIA_ROOT, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(self.content)
+
+    def test_public_file_caching_and_ranges(self):
+        url = reverse('media', args=['media/main_covers/cover.jpg'])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        partial = self.client.get(url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(partial['Content-Range'], f'bytes 100-199/{len(self.content)}')
+        self.assertEqual(b''.join(partial.streaming_content), self.content[100:200])
+
+        suffix = self.client.get(url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(suffix.streaming_content), self.content[-10:])
+        # Файл изменился с момента первой части — отдаётся целиком
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"other"').status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_RANGE=f'bytes={len(self.content)}-').status_code, 416)
+
+        self.assertEqual(self.client.get(reverse('media', args=['../core/settings.py'])).status_code, 404)
+
+    def test_check_access(self):
+        url = reverse('media', args=['media/check/i.jpg'])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        stranger = MyUser.objects.create_user('stranger@test.kg', '0700000009', 'Чужой', 'password')
+        self.client.force_login(stranger)
+        self.client.get(url)
+        # Пользователь уже в кеше, остаётся только проверка доступа
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+        for user in (self.buyer, self.seller, self.accountant):
+            with self.subTest(user=user.email):
+                self.client.force_login(user)
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('private', response['Cache-Control'])
+                self.assertIn('Cookie', response['Vary'])
+
+    @override_settings(MEDIA_SENDFILE='x-accel-redirect')
+    def test_sendfile_offload(self):
+        self.client.force_login(self.seller)
+        response = self.client.get(reverse('media', args=['media/check/i.jpg']))
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/media/check/i.jpg')
+        self.assertEqual(response.content, b'')
+
+
+class ContentAddressedStorageTestCase(StorefrontTestCase):
+    """Одинаковые загрузки хранятся один раз, счётчики ссылок и перенос старых файлов."""
+
+    def blob(self, name):
+        return Blob.objects.get(name=name)
+
+    def test_identical_uploads_share_one_blob(self):
+        first = Image.objects.create(file=small_image('first.gif'))
+        second = Image.objects.create(file=small_image('second.GIF'))
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertRegex(first.file.name, r'^media/blobs/([0-9a-f]{2})/([0-9a-f]{2})/\1\2[0-9a-f]{60}\.gif$')
+        self.assertEqual(self.blob(first.file.name).refcount, 2)
+
+        payment_request = PaymentRequest.objects.create(
+            user=self.buyer, product=self.product, quantity=1, check_image=small_image(), total_price=100
+        )
+        # Чеки остаются в своём каталоге, доступ к ним проверяется по префиксу
+        self.assertTrue(payment_request.check_image.name.startswith('media/check/'))
+        bulk_update_status([payment_request.id], 'accepted', seller=self.seller)
+        self.assertEqual(self.blob(payment_request.check_image.name).refcount, 2)
+
+        second.file = small_image('other.gif')
+        second.save()
+        self.assertEqual(self.blob(first.file.name).refcount, 2)
+        first.delete()
+        second.delete()
+        self.assertEqual(self.blob(second.file.name).refcount, 0)
+
+    def test_garbage_collection_recounts_before_deleting(self):
+        image = Image.objects.create(file=small_image())
+        name = image.file.name
+        # update() не шлёт сигналов, счётчик отстаёт от базы
+        Image.objects.filter(id=image.id).update(file='')
+        Blob.objects.filter(name=name).update(refcount=1)
+        Image.objects.create(file=small_image())
+        self.assertEqual(self.blob(name).refcount, 2)
+
+        Image.objects.filter(file=name).delete()
+        # Сигнал удаления снял одну ссылку, вторую исправил пересчёт; файл ещё молод
+        stats = collect_garbage(grace=3600)
+        self.assertEqual((stats['recounted'], stats['deleted']), (1, 0))
+        self.assertEqual(collect_garbage(grace=-1)['deleted'], 1)
+        self.assertFalse(Blob.objects.filter(name=name).exists())
+        self.assertFalse(os.path.exists(os.path.join(settings.MEDIA_ROOT, name)))
+
+    def test_dedupe_media_migrates_legacy_files(self):
+        def write(name, content):
+            path = os.path.join(settings.MEDIA_ROOT, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(content)
+
+        for name in ('media/main_covers/i.jpg', 'media/product_file/0.jpg', 'media/qr/mbank.jpg', 'media/check/i.jpg'):
+            write(name, b'same bytes')
+        write('media/product_file/1.jpg', b'other bytes')
+        # media/product_file/2.jpg на диске нет
+
+        call_command('dedupe_media', stdout=io.StringIO())
+
+        shared = Product.objects.values_list('main_image', flat=True).distinct()
+        self.assertEqual(len(shared), 1)
+        self.assertTrue(is_blob_name(shared[0]))
+        self.assertEqual(Image.objects.get(file__endswith=shared[0][-68:]).file.name, shared[0])
+        self.assertEqual(set(PaymentMethod.objects.values_list('qr_image', flat=True)), {shared[0]})
+        # 12 обложек, одна картинка галереи и 3 QR-кода
+        self.assertEqual(self.blob(shared[0]).refcount, 16)
+        check = PaymentRequest.objects.values_list('check_image', flat=True).first()
+        self.assertTrue(check.startswith('media/check/') and is_blob_name(check))
+        self.assertTrue(Image.objects.filter(file='media/product_file/2.jpg').exists())
+        self.assertFalse(os.path.exists(os.path.join(settings.MEDIA_ROOT, 'media/main_covers/i.jpg')))
+        with open(os.path.join(settings.MEDIA_ROOT, shared[0]), 'rb') as file:
+            self.assertEqual(file.read(), b'same bytes')
+
+
+@override_settings(IMAGE_VARIANTS_ASYNC=False)
+class ImageVariantsTestCase(TempMediaMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def save_image(self, width, height, name='main_covers/photo.png'):
+        from PIL import Image as PILImage
+
+        buffer = io.BytesIO()
+        PILImage.new('RGB', (width, height), 'red').save(buffer, format='PNG')
+        return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+    def variant_size(self, name, width, image_format):
+        from PIL import Image as PILImage
+
+        with PILImage.open(default_storage.path(thumbnails.variant_name(name, width, image_format))) as image:
+            return image.format, image.size
+
+    def test_generates_every_width_and_format_without_upscaling(self):
+        name = self.save_image(600, 300)
+
+        created = thumbnails.generate_variants(name)
+
+        self.assertEqual(len(created), len(settings.IMAGE_VARIANT_WIDTHS) * len(settings.IMAGE_VARIANT_FORMATS))
+        self.assertEqual(self.variant_size(name, 200, 'webp'), ('WEBP', (200, 100)))
+        self.assertEqual(self.variant_size(name, 400, 'jpeg'), ('JPEG', (400, 200)))
+        # Шире оригинала не растягивается
+        self.assertEqual(self.variant_size(name, 800, 'jpeg'), ('JPEG', (600, 300)))
+
+        self.assertEqual(thumbnails.generate_variants(name), [])
+        self.assertEqual(len(thumbnails.generate_variants(name, force=True)), len(created))
+        self.assertEqual(thumbnails.generate_variants(thumbnails.variant_name(name, 200, 'webp')), [])
+
+    def test_readiness_is_checked_once_and_set_after_generation(self):
+        name = self.save_image(300, 300)
+
+        with patch.object(default_storage, 'exists', wraps=default_storage.exists) as exists:
+            for _ in range(3):
+                self.assertFalse(thumbnails.variants_ready(name))
+        self.assertEqual(exists.call_count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            thumbnails.schedule_variants(name)
+
+        with patch.object(default_storage, 'exists', wraps=default_storage.exists) as exists:
+            self.assertTrue(thumbnails.variants_ready(name))
+            html = Template('{% load images %}{% responsive_image image %}').render(
+                Context({'image': Image(file=name).file})
+            )
+        exists.assert_not_called()
+        self.assertIn('<picture>', html)
+        self.assertIn(thumbnails.variant_name(name, 200, 'webp'), html)
+
+    def test_upload_schedules_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = Image.objects.create(file=small_image())
+        self.assertTrue(thumbnails.variants_ready(image.file.name))
+
+        freed = delete_file(image.file.name)
+        self.assertGreater(freed, 0)
+        self.assertFalse(thumbnails.variants_ready(image.file.name))
+
+
+@override_settings(IMAGE_VARIANTS_ASYNC=False)
+class GenerateDatasetTestCase(TempMediaMixin, TestCase):
+    options = {
+        'users': 20, 'categories': 3, 'products': 30, 'ratings': 60, 'payment_requests': 40,
+        'batch_size': 7, 'seed': 7,
+    }
+
+    def generate(self, **options):
+        call_command('generate_dataset', stdout=io.StringIO(), **{**self.options, **options})
+
+    def snapshot(self):
+        return (
+            list(Product.objects.order_by('id').values_list('title', 'price', 'category__title', 'user__email')),
+            list(Rating.objects.order_by('id').values_list('user__email', 'product__title', 'count', 'comment')),
+            list(
+                PaymentRequest.objects.order_by('id')
+                .values_list('user__email', 'product__title', 'quantity', 'status', 'total_price')
+            ),
+        )
+
+    def test_row_counts_and_derived_data(self):
+        self.generate()
+
+        self.assertEqual(MyUser.objects.filter(email__startswith='synthetic7-').count(), 20)
+        self.assertEqual(MyUser.objects.filter(role=UserRoleEnum.ACCOUNTANT).count(), 1)
+        self.assertEqual(Category.objects.count(), 3)
+        self.assertEqual(Product.objects.count(), 30)
+        self.assertEqual(Product.images.through.objects.count(), 30 * 3)
+        # 10% пользователей — продавцы, по два способа оплаты
+        self.assertEqual(PaymentMethod.objects.count(), 2 * 2)
+        self.assertEqual(Rating.objects.count(), 60)
+        self.assertEqual(PaymentRequest.objects.count(), 40)
+        self.assertEqual(Payment.objects.count(), PaymentRequest.objects.filter(status='accepted').count())
+
+        self.assertEqual(sum(Product.objects.values_list('rating_count', flat=True)), 60)
+        self.assertEqual(
+            sum(SellerDailyRevenue.objects.values_list('revenue', flat=True)),
+            sum(Payment.objects.values_list('total_price', flat=True))
+        )
+        self.assertTrue(SimilarProduct.objects.exists())
+
+        with self.assertRaises(CommandError):
+            self.generate()
+
+    def test_same_seed_gives_same_data(self):
+        with transaction.atomic():
+            self.generate()
+            first = self.snapshot()
+            transaction.set_rollback(True)
+
+        self.generate()
+        self.assertEqual(self.snapshot(), first)
+        self.assertEqual(len(first[0]), 30)
+
+    def media_files(self):
+        return sorted(os.path.join(path, name) for path, _, files in os.walk(settings.MEDIA_ROOT) for name in files)
+
+    def test_placeholders_are_reused_and_stats_built_without_derived(self):
+        self.generate()
+        media_files = self.media_files()
+
+        self.generate(seed=8, skip_derived=True)
+
+        # Одинаковые заглушки сохраняются один раз, чеки остаются в закрытом каталоге
+        self.assertEqual(self.media_files(), media_files)
+        check_images = PaymentRequest.objects.values_list('check_image', flat=True)
+        self.assertTrue(all(name.startswith('media/check/') for name in check_images))
+        self.assertEqual(sum(Product.objects.values_list('rating_count', flat=True)), 2 * 60)
@@ -0,0 +1,178 @@
+"""
+Уменьшенные варианты загруженных изображений.
+
+Для каждого файла рядом с оригиналом сохраняются копии шириной
+IMAGE_VARIANT_WIDTHS в форматах IMAGE_VARIANT_FORMATS:
+media/main_covers/photo.jpg -> media/main_covers/photo__w400.webp.
+Генерация идёт в пуле процессов после коммита транзакции, чтобы не
+задерживать запрос; шаблоны используют тег {% responsive_image %}.
+Готовность вариантов хранится в кеше: хранилище проверяется один раз,
+а не при каждом рендере, и флаг ставится сразу после генерации.
+"""
+import atexit
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+FORMAT_EXTENSIONS = {
+    'webp': 'webp',
+    'jpeg': 'jpg',
+}
+
+CONTENT_TYPES = {
+    'webp': 'image/webp',
+    'jpeg': 'image/jpeg',
+}
+
+_executor = None
+
+
+def variant_name(name, width, image_format):
+    stem, _ = os.path.splitext(name)
+    return f'{stem}__w{width}.{FORMAT_EXTENSIONS[image_format]}'
+
+
+def variant_names(name):
+    return [
+        variant_name(name, width, image_format)
+        for width in settings.IMAGE_VARIANT_WIDTHS
+        for image_format in settings.IMAGE_VARIANT_FORMATS
+    ]
+
+
+def is_variant(name):
+    stem, _ = os.path.splitext(name)
+    return '__w' in os.path.basename(stem)
+
+
+def render_variants(source_path, targets, quality):
+    """
+    Выполняется в отдельном процессе, поэтому работает только с путями
+    на диске и не обращается к Django.
+    targets: список (путь, ширина, формат). Возвращает список созданных путей.
+    """
+    from PIL import Image, ImageOps
+
+    created = []
+    with Image.open(source_path) as original:
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ('RGB', 'RGBA'):
+            original = original.convert('RGBA' if 'transparency' in original.info else 'RGB')
+
+        for path, width, image_format in targets:
+            image = original
+            if original.width > width:
+                height = round(original.height * width / original.width)
+                image = original.resize((width, height), Image.Resampling.LANCZOS)
+            if image_format == 'jpeg' and image.mode != 'RGB':
+                image = image.convert('RGB')
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.tmp'
+            image.save(tmp_path, format=image_format.upper(), quality=quality, optimize=True)
+            os.replace(tmp_path, path)
+            created.append(path)
+    return created
+
+
+def _build_targets(name, force=False):
+    targets = []
+    for width in settings.IMAGE_VARIANT_WIDTHS:
+        for image_format in settings.IMAGE_VARIANT_FORMATS:
+            target = variant_name(name, width, image_format)
+            if force or not default_storage.exists(target):
+                targets.append((default_storage.path(target), width, image_format))
+    return targets
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=settings.IMAGE_VARIANT_WORKERS)
+        atexit.register(_executor.shutdown, wait=False)
+    return _executor
+
+
+def generate_variants(name, force=False, executor=None):
+    """
+    Создаёт недостающие варианты файла. Без executor работает синхронно
+    и возвращает список путей, иначе возвращает Future.
+    """
+    if not name or is_variant(name):
+        return [] if executor is None else None
+
+    targets = _build_targets(name, force)
+    if not targets:
+        return [] if executor is None else None
+
+    args = (default_storage.path(name), targets, settings.IMAGE_VARIANT_QUALITY)
+    if executor is None:
+        return render_variants(*args)
+    return executor.submit(render_variants, *args)
+
+
+def _generated(name, future):
+    exc = future.exception()
+    if exc is not None:
+        logger.error('Не удалось создать варианты %s: %s', name, exc)
+    else:
+        remember_variants(name, True)
+
+
+def schedule_variants(name):
+    """Ставит генерацию в пул процессов после коммита текущей транзакции."""
+    if not name:
+        return
+
+    def submit():
+        if not settings.IMAGE_VARIANTS_ASYNC:
+            generate_variants(name)
+            remember_variants(name, True)
+            return
+        future = generate_variants(name, executor=get_executor())
+        if future is None:
+            remember_variants(name, True)
+        else:
+            future.add_done_callback(lambda done: _generated(name, done))
+
+    transaction.on_commit(submit)
+
+
+def _ready_key(name):
+    return f'variants:{name}'
+
+
+def remember_variants(name, ready):
+    """Запоминает готовность вариантов; отрицательный ответ живёт недолго."""
+    timeout = settings.IMAGE_VARIANT_READY_TIMEOUT if ready else settings.IMAGE_VARIANT_PENDING_TIMEOUT
+    cache.set(_ready_key(name), ready, timeout)
+
+
+def forget_variants(name):
+    cache.delete(_ready_key(name))
+
+
+def variants_ready(name):
+    if not name:
+        return False
+    ready = cache.get(_ready_key(name))
+    if ready is None:
+        # Все варианты создаются разом, поэтому достаточно проверить последний
+        ready = default_storage.exists(variant_names(name)[-1])
+        remember_variants(name, ready)
+    return ready
+
+
+def srcset(name, image_format):
+    return ', '.join(
+        f'{default_storage.url(variant_name(name, width, image_format))} {width}w'
+        for width in settings.IMAGE_VARIANT_WIDTHS
+    )
+
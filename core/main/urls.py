@@ -1,25 +1,33 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# Читающие страницы витрины: async-варианты для запуска под ASGI
+read_views = async_views if settings.ASYNC_VIEWS else views
 
 
 urlpatterns = [
-    path('', views.index_view, name='index'),
+    path('', read_views.index_view, name='index'),
 
-    path('product/<int:product_id>/', views.product_detail_view, name='product_detail'),
+    path('product/<int:product_id>/', read_views.product_detail_view, name='product_detail'),
+    path('product/<int:product_id>/reviews/', views.product_reviews_view, name='product_reviews'),
     path('product/create/', views.product_create_view, name='product_create'),
     path('product/update/<int:product_id>/', views.product_update_view, name='product_update'),
 
     path('rating/create/<int:product_id>/', views.rating_create_view, name='rating_create'),
     path('rating-answer/create/<int:rating_id>/', views.rating_answer_create_view, name='rating_answer_create'),
 
-    path('profile/', views.user_profile_view, name='user_profile'),
+    path('profile/', read_views.user_profile_view, name='user_profile'),
     path('payment_requests/', views.payment_request_list_view, name='payment_requests'),
     path('payment_request/<int:payment_request_id>/update/', views.payment_request_update_status,
          name='payment_request_update_status'),
+    path('payment_requests/bulk_update/', views.payment_request_bulk_update_status,
+         name='payment_request_bulk_update_status'),
     path('payments/', views.payment_list_view, name='payments'),
+    path('export/<slug:kind>/', views.export_view, name='export'),
 
     path('product/<int:product_id>/payment/create/', views.product_payment_create_view,
          name='product_payment_create'),
 
-    path('catalog/', views.product_list_view, name='catalog')
+    path('catalog/', read_views.product_list_view, name='catalog')
 ]
\ No newline at end of file
@@ -1,39 +1,113 @@
 from decimal import Decimal
 
 from django.shortcuts import render, get_object_or_404, redirect, Http404
+from django.http import JsonResponse, QueryDict, StreamingHttpResponse
+from django.template.loader import render_to_string
 from django.contrib import messages
-from django.db.models import Avg, Sum
-from django.core.paginator import Paginator
-
+from django.db import transaction
+from django.db.models import Prefetch
+from django.conf import settings
+
+from .conditional import catalog_validators, conditional_page, product_validators
+from .caching import CATALOG, cached_page, can_cache_page, get_or_render, product_scope
+from .exports import EXPORTS, FORMATS, ExportFilterError, export_chunks, export_filename
+from .facets import catalog_facets, cleaned_filters
 from .forms import ProductCreateForm, ProductUpdateForm
 from .filters import ProductListFilter
+from .ledger import record_payments, seller_totals
+from .orders import BulkStatusError, bulk_update_status
+from .pagination import InvalidCursor, KeysetPaginator, get_page_size, paginate_request, pagination_params
+from .recommendations import similar_products_for
 from .models import Product, Rating, RatingAnswer, PaymentMethod, PaymentRequest, Category, Payment
 
 
+def index_products():
+    return Product.objects.filter(is_active=True).select_related('category')
+
+
+@conditional_page(catalog_validators)
 def index_view(request):
-    products = Product.objects.filter(is_active=True)
+    products_grid = get_or_render('index_grid', [], [CATALOG], lambda: render_to_string(
+        'main/product_grid.html',
+        {"products": index_products()},
+        request=request
+    ))
 
-    return render(request, 'main/index.html', {"products": products})
+    return render(request, 'main/index.html', {"products_grid": products_grid})
 
 
+def product_reviews_queryset(product_id):
+    # Пользователи и ответы подгружаются пачкой, а не на каждый отзыв
+    return Rating.objects.filter(product_id=product_id).select_related('user').prefetch_related(
+        Prefetch('rating_answers', queryset=RatingAnswer.objects.select_related('user').order_by('id'))
+    ).order_by('-id')
+
+
+@conditional_page(product_validators)
 def product_detail_view(request, product_id):
-    product = get_object_or_404(Product, id=product_id)
-    product_update_form = ProductUpdateForm(instance=product)
-    product_comments = Rating.objects.filter(product=product)
+    if can_cache_page(request):
+        return cached_page(
+            request, 'product_detail', [product_id], [product_scope(product_id)],
+            lambda extra_context: render_product_detail(request, product_id, extra_context)
+        )
+    return render_product_detail(request, product_id)
+
+
+def product_detail_queryset():
+    return Product.objects.select_related('category').prefetch_related('images')
+
+
+def first_reviews_page(product_id):
+    return KeysetPaginator(product_reviews_queryset(product_id), settings.REVIEWS_PAGE_SIZE).page()
+
 
-    rating_avg = product_comments.aggregate(Avg('count'))['count__avg']
-    similar_products = Product.objects.filter(category=product.category).exclude(id=product.id)
+def fallback_similar_products(product):
+    # Индекс ещё не посчитан для нового продукта
+    return Product.objects.filter(
+        category_id=product.category_id,
+        is_active=True
+    ).exclude(id=product.id).select_related('user')[:settings.SIMILAR_PRODUCTS_TOP_K]
+
+
+def product_detail_context(product, reviews_page, similar_products, extra_context=None):
+    return {
+        "product": product,
+        "similar_products": similar_products,
+        "product_update_form": ProductUpdateForm(instance=product),
+        "reviews_page": reviews_page,
+        "rating_avg": product.rating_avg,
+        **(extra_context or {})
+    }
+
+
+def render_product_detail(request, product_id, extra_context=None):
+    product = get_object_or_404(product_detail_queryset(), id=product_id)
+    reviews_page = first_reviews_page(product.id)
+    similar_products = list(similar_products_for(product)) or fallback_similar_products(product)
 
     return render(
         request=request,
         template_name='main/product_detail.html',
-        context={
-            "product": product,
-            "similar_products": similar_products,
-            "product_update_form": product_update_form,
-            "product_comments": product_comments,
-            "rating_avg": rating_avg
-        })
+        context=product_detail_context(product, reviews_page, similar_products, extra_context)
+    )
+
+
+def product_reviews_view(request, product_id):
+    paginator = KeysetPaginator(
+        product_reviews_queryset(product_id),
+        get_page_size(request, settings.REVIEWS_PAGE_SIZE)
+    )
+    try:
+        page = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor:
+        # Первая страница вместо повреждённого курсора продублировала бы отзывы в ленте
+        return JsonResponse({'html': '', 'next_cursor': None, 'error': 'Неверный курсор'}, status=400)
+
+    html = render_to_string('main/review_list.html', {'ratings': page}, request=request)
+    return JsonResponse({
+        'html': html,
+        'next_cursor': page.next_cursor,
+    })
 
 
 def product_create_view(request):
@@ -88,9 +162,9 @@ def rating_create_view(request, product_id):
 
 
 def rating_answer_create_view(request, rating_id):
-    rating = get_object_or_404(Rating, id=rating_id)
+    rating = get_object_or_404(Rating.objects.select_related('product'), id=rating_id)
 
-    if rating.product.user != request.user:
+    if rating.product.user_id != request.user.id:
         messages.error(request, 'Нету доступа')
         return redirect('product_detail', rating.product.id)
 
@@ -114,20 +188,26 @@ def user_profile_view(request):
         messages.error(request, 'Только авторизованные!')
         return redirect('index' )
     
-    payment_requests = PaymentRequest.objects.filter(product__user=request.user, status='in_processing').order_by('-id')[:3]
-  
     return render(
         request=request,
         template_name='main/user_profile.html',
         context={
-            'payment_requests': payment_requests
+            'payment_requests': profile_payment_requests(request.user),
+            'payment_methods': request.user.payment_methods.all()
         }
     )
 
 
+def profile_payment_requests(user):
+    return PaymentRequest.objects.filter(
+        product__user=user,
+        status='in_processing'
+    ).select_related('user', 'product').order_by('-id')[:3]
+
+
 def product_payment_create_view(request, product_id):
     product = get_object_or_404(Product, id=product_id)
-    seller_payment_methods = PaymentMethod.objects.filter(user=product.user)
+    seller_payment_methods = PaymentMethod.objects.filter(user_id=product.user_id)
 
     if request.method == 'POST':
         check = request.FILES.get('check', '')
@@ -155,69 +235,150 @@ def product_payment_create_view(request, product_id):
     )
 
 
+@conditional_page(catalog_validators)
 def product_list_view(request):
-    queryset = Product.objects.filter(is_active=True)
-
-    if 'product_search' in request.GET:
-        product_name = request.GET.get("product_search")
-        queryset = queryset.filter(title__icontains=product_name)
-
-    products = ProductListFilter(request.GET, queryset=queryset)
-
-    # Paginator
-    paginator = Paginator(products.qs, 2)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    products = catalog_filter(request)
+    query = catalog_query(request, products)
+    catalog_results = get_or_render(
+        'catalog', [query.urlencode()], [CATALOG], lambda: render_catalog_results(request, products, query)
+    )
 
-    return render(request, 'main/product_list.html', {'page_obj': page_obj, 'products': products})
+    return render(request, 'main/product_list.html', {
+        'catalog_results': catalog_results,
+        'products': products,
+        'facets': catalog_facets(products),
+    })
+
+
+def catalog_filter(request):
+    queryset = Product.objects.filter(is_active=True).select_related('category').with_rating_score()
+    return ProductListFilter(request.GET, queryset=queryset)
+
+
+def catalog_query(request, products):
+    """
+    Строка запроса каталога только из очищенных формой фильтров и параметров
+    пагинации, в постоянном порядке. Служит ключом кеша и основой ссылок
+    фрагмента, поэтому лишние параметры и их порядок не плодят записи.
+    """
+    query = QueryDict(mutable=True)
+    for name, value in sorted(cleaned_filters(products).items()):
+        if isinstance(value, (list, tuple)):
+            value = ','.join(value)
+        if value not in (None, ''):
+            query[name] = str(value)
+    query.update(pagination_params(request, settings.CATALOG_PAGE_SIZE))
+    return query
+
+
+def render_catalog_results(request, products, query):
+    page_obj = paginate_request(request, products.qs, default_page_size=settings.CATALOG_PAGE_SIZE)
+    return render_to_string(
+        'main/catalog_results.html', {'page_obj': page_obj, 'page_query': query}, request=request
+    )
 
 
 def payment_request_list_view(request):
-    payment_requests = PaymentRequest.objects.filter(product__user=request.user).order_by('-id')
+    payment_requests = PaymentRequest.objects.filter(
+        product__user=request.user
+    ).select_related('user', 'product').order_by('-id')
+    page_obj = paginate_request(request, payment_requests)
 
     return render(
         request=request,
         template_name='main/payment_request.html',
         context={
-            'payment_requests': payment_requests
+            'payment_requests': page_obj,
+            'page_obj': page_obj
         }
     )
 
 
 def payment_request_update_status(request, payment_request_id):
-    payment_request = get_object_or_404(PaymentRequest, id=payment_request_id)
+    payment_request = get_object_or_404(
+        PaymentRequest.objects.select_related('user', 'product'),
+        id=payment_request_id
+    )
 
     if request.method == 'POST':
         status = request.POST.get('status')
-        payment_request.status = status
-        payment_request.save()
 
-        if payment_request.status == 'accepted':
+        with transaction.atomic():
+            payment_request.status = status
+            payment_request.save()
 
-            payment = Payment(
-                seller=payment_request.product.user,
-                user=payment_request.user.first_name,
-                product=payment_request.product.title,
-                quantity=payment_request.quantity,
-                check_image=payment_request.check_image,
-                total_price=payment_request.total_price
-            )
-            payment.save()
+            if payment_request.status == 'accepted':
+
+                payment = Payment(
+                    seller_id=payment_request.product.user_id,
+                    user=payment_request.user.first_name,
+                    product=payment_request.product.title,
+                    quantity=payment_request.quantity,
+                    check_image=payment_request.check_image,
+                    total_price=payment_request.total_price
+                )
+                payment.save()
+                record_payments([payment])
 
         messages.success(request, 'Успешно изменено')
 
     return redirect('payment_requests')
 
+def payment_request_bulk_update_status(request):
+    if not request.user.is_authenticated:
+        raise Http404()
+
+    if request.method == 'POST':
+        try:
+            request_ids = [int(request_id) for request_id in request.POST.getlist('payment_request_ids')]
+            updated, _ = bulk_update_status(request_ids, request.POST.get('status'), seller=request.user)
+        except ValueError:
+            messages.error(request, 'Неверные данные')
+        except BulkStatusError as exc:
+            messages.error(request, str(exc))
+        else:
+            # Заявки, уже имевшие этот статус, не считаются
+            messages.success(request, f'Успешно изменено: {updated}')
+
+    return redirect('payment_requests')
+
+
 def payment_list_view(request):
     payments = Payment.objects.filter(seller=request.user)
 
-    total_payments = payments.aggregate(Sum('total_price'))['total_price__sum']
+    total_payments = seller_totals(request.user)['revenue']
+    daily_revenue = request.user.daily_revenue.order_by('-date')[:30]
+    page_obj = paginate_request(request, payments.order_by('-id'))
 
     return render(
         request=request,
         template_name='main/payments.html',
         context={
-            "payments": payments,
-            "total_payments": total_payments
+            "payments": page_obj,
+            "page_obj": page_obj,
+            "total_payments": total_payments,
+            "daily_revenue": daily_revenue
         }
-    )
\ No newline at end of file
+    )
+
+def export_view(request, kind):
+    if not request.user.is_authenticated or not request.user.is_accountant:
+        raise Http404()
+
+    export = EXPORTS.get(kind)
+    file_format = request.GET.get('format', 'csv')
+    if export is None or file_format not in FORMATS:
+        raise Http404()
+
+    try:
+        queryset = export.queryset(request.GET)
+    except ExportFilterError as exc:
+        return JsonResponse({'errors': exc.errors.get_json_data()}, status=400)
+
+    # Строки читаются по мере отправки ответа
+    response = StreamingHttpResponse(
+        export_chunks(export, queryset, file_format),
+        content_type=FORMATS[file_format][1]
+    )
+    response['Content-Disposition'] = f'attachment; filename="{export_filename(export, file_format)}"'
+    return response
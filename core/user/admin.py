@@ -4,7 +4,7 @@ from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.forms import ReadOnlyPasswordHashField
 from django.core.exceptions import ValidationError
 
-from .models import MyUser
+from .models import MyUser, OutboxEmail
 
 
 class UserCreationForm(forms.ModelForm):
@@ -85,4 +85,11 @@ class UserAdmin(BaseUserAdmin):
     filter_horizontal = ()
 
 
-admin.site.register(MyUser, UserAdmin)
\ No newline at end of file
+admin.site.register(MyUser, UserAdmin)
+
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'status', 'attempts', 'next_attempt_date', 'created_date', 'sent_date')
+    list_filter = ('status', )
+    readonly_fields = ('created_date', 'sent_date', 'last_error', 'locked_by')
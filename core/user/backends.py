@@ -0,0 +1,44 @@
+"""
+Вход по email и паролю, пользователь для сессии берётся из кеша.
+
+AuthenticationMiddleware на каждом запросе вызывает get_user(id из
+сессии), и ModelBackend каждый раз читает MyUser из базы. Здесь строка
+хранится в кеше AUTH_USER_CACHE_TIMEOUT секунд. При сохранении или
+удалении пользователя запись удаляется (user/signals.py), поэтому смена
+пароля, роли или is_otp видна уже на следующем запросе, а сессии со
+старым хешем пароля сбрасываются как обычно.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+UserModel = get_user_model()
+
+
+def user_cache_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            try:
+                user = UserModel._default_manager.get(pk=user_id)
+            except UserModel.DoesNotExist:
+                return None
+            cache.set(key, user, settings.AUTH_USER_CACHE_TIMEOUT)
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = await cache.aget(key)
+        if user is None:
+            try:
+                user = await UserModel._default_manager.aget(pk=user_id)
+            except UserModel.DoesNotExist:
+                return None
+            await cache.aset(key, user, settings.AUTH_USER_CACHE_TIMEOUT)
+        return user if self.user_can_authenticate(user) else None
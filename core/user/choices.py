@@ -0,0 +1,14 @@
+from django.db import models
+
+
+class OutboxStatusEnum(models.TextChoices):
+    PENDING = ('pending', 'В очереди')
+    SENDING = ('sending', 'Отправляется')
+    SENT = ('sent', 'Отправлено')
+    DEAD = ('dead', 'Не доставлено')
+
+
+class UserRoleEnum(models.IntegerChoices):
+    USER = (1, 'Обычный пользователь')
+    MODERATOR = (2, 'Модератор')
+    ACCOUNTANT = (3, 'Бухгалтер')
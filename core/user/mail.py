@@ -0,0 +1,119 @@
+"""
+Очередь исходящих писем.
+
+Вьюхи только кладут письмо в таблицу OutboxEmail, а отправляет их
+команда send_queued_mail пачками через одно SMTP-соединение. Неудачные
+письма повторяются с экспоненциальной задержкой, после
+MAIL_QUEUE_MAX_ATTEMPTS попыток помечаются как DEAD.
+"""
+import logging
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .choices import OutboxStatusEnum
+from .models import OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_mail(subject, message, recipient_list, from_email=None):
+    return OutboxEmail.objects.create(
+        subject=subject,
+        message=message,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipients=list(recipient_list),
+    )
+
+
+def retry_delay(attempts):
+    delay = settings.MAIL_QUEUE_RETRY_DELAY * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, settings.MAIL_QUEUE_MAX_RETRY_DELAY))
+
+
+def claim_batch(batch_size):
+    """
+    Забирает пачку писем, готовых к отправке. Захват делается одним
+    UPDATE с меткой обработчика, поэтому несколько воркеров не отправят
+    одно письмо дважды. Зависшие в SENDING письма забираются после
+    истечения аренды.
+    """
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    due = OutboxEmail.objects.filter(
+        Q(status=OutboxStatusEnum.PENDING) | Q(status=OutboxStatusEnum.SENDING),
+        next_attempt_date__lte=now,
+    )
+    ids = list(due.order_by('next_attempt_date', 'id').values_list('id', flat=True)[:batch_size])
+    if not ids:
+        return []
+
+    due.filter(id__in=ids).update(
+        status=OutboxStatusEnum.SENDING,
+        locked_by=token,
+        next_attempt_date=now + timedelta(seconds=settings.MAIL_QUEUE_LEASE),
+    )
+    return list(OutboxEmail.objects.filter(locked_by=token, status=OutboxStatusEnum.SENDING))
+
+
+def _mark_failed(email, error):
+    email.attempts += 1
+    email.last_error = error
+    email.locked_by = ''
+    if email.attempts >= settings.MAIL_QUEUE_MAX_ATTEMPTS:
+        email.status = OutboxStatusEnum.DEAD
+        logger.error('Письмо %s не доставлено после %s попыток: %s', email.id, email.attempts, error)
+    else:
+        email.status = OutboxStatusEnum.PENDING
+        email.next_attempt_date = timezone.now() + retry_delay(email.attempts)
+    email.save(update_fields=['attempts', 'last_error', 'locked_by', 'status', 'next_attempt_date'])
+
+
+def deliver_batch(batch_size=None):
+    """Отправляет одну пачку. Возвращает (отправлено, ошибок)."""
+    emails = claim_batch(batch_size or settings.MAIL_QUEUE_BATCH_SIZE)
+    if not emails:
+        return 0, 0
+
+    sent = failed = 0
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as exc:
+        for email in emails:
+            _mark_failed(email, f'connection: {exc}')
+        return 0, len(emails)
+
+    try:
+        for email in emails:
+            message = EmailMessage(
+                subject=email.subject,
+                body=email.message,
+                from_email=email.from_email,
+                to=email.recipients,
+                connection=connection,
+            )
+            try:
+                # Бэкенд может не бросить исключение, а вернуть меньше отправленных
+                if connection.send_messages([message]) != 1:
+                    raise RuntimeError('бэкенд не отправил письмо')
+            except Exception as exc:
+                _mark_failed(email, str(exc))
+                failed += 1
+                continue
+
+            email.attempts += 1
+            email.status = OutboxStatusEnum.SENT
+            email.sent_date = timezone.now()
+            email.locked_by = ''
+            email.last_error = ''
+            email.save(update_fields=['attempts', 'status', 'sent_date', 'locked_by', 'last_error'])
+            sent += 1
+    finally:
+        connection.close()
+
+    return sent, failed
@@ -0,0 +1,43 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from user.mail import deliver_batch
+
+
+class Command(BaseCommand):
+    help = 'Отправляет письма из очереди OutboxEmail'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.MAIL_QUEUE_BATCH_SIZE,
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Работать постоянно, опрашивая очередь',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1.0,
+            help='Пауза между опросами пустой очереди в секундах',
+        )
+
+    def handle(self, *args, batch_size=None, loop=False, interval=1.0, **options):
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = deliver_batch(batch_size)
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                self.stdout.write(f'Отправлено: {sent}, ошибок: {failed}')
+                continue
+            if not loop:
+                break
+            time.sleep(interval)
+
+        self.stdout.write(self.style.SUCCESS(f'Всего отправлено: {total_sent}, ошибок: {total_failed}'))
@@ -0,0 +1,12 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from user.throttling import rejected_counts
+
+
+class Command(BaseCommand):
+    help = 'Показывает число отклонённых попыток входа по точкам входа и ключам'
+
+    def handle(self, *args, **options):
+        self.stdout.write(json.dumps(rejected_counts(), ensure_ascii=False, indent=2))
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:50
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0003_myuser_is_otp'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=255, verbose_name='Тема')),
+                ('message', models.TextField(verbose_name='Текст')),
+                ('from_email', models.CharField(max_length=255, verbose_name='Отправитель')),
+                ('recipients', models.JSONField(verbose_name='Получатели')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('sending', 'Отправляется'), ('sent', 'Отправлено'), ('dead', 'Не доставлено')], default='pending', max_length=15, verbose_name='Статус')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')),
+                ('next_attempt_date', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Следующая попытка')),
+                ('locked_by', models.CharField(blank=True, max_length=32, verbose_name='Обработчик')),
+                ('last_error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+                ('created_date', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('sent_date', models.DateTimeField(blank=True, null=True, verbose_name='Дата отправки')),
+            ],
+            options={
+                'verbose_name': 'Письмо в очереди',
+                'verbose_name_plural': 'Очередь писем',
+                'indexes': [models.Index(fields=['status', 'next_attempt_date'], name='user_outbox_status_f7f721_idx')],
+            },
+        ),
+    ]
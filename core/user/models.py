@@ -1,5 +1,8 @@
 from django.contrib.auth.base_user import AbstractBaseUser, BaseUserManager
 from django.db import models
+from django.utils import timezone
+
+from .choices import OutboxStatusEnum, UserRoleEnum
 
 
 class MyUserManager(BaseUserManager):
@@ -61,12 +64,8 @@ class MyUser(AbstractBaseUser):
         null=True
     )
     role = models.PositiveSmallIntegerField(
-        choices=(
-            (1, 'Обычный пользователь'),
-            (2, 'Модератор'),
-            (3, 'Бухгалтер'),
-        ),
-        default=1,
+        choices=UserRoleEnum.choices,
+        default=UserRoleEnum.USER,
         verbose_name='Роль'
     )
     created_date = models.DateTimeField(
@@ -98,6 +97,10 @@ class MyUser(AbstractBaseUser):
         # Simplest possible answer: Yes, always
         return True
 
+    @property
+    def is_accountant(self):
+        return self.role == UserRoleEnum.ACCOUNTANT
+
     @property
     def is_staff(self):
         """Is the user a member of staff?"""
@@ -122,4 +125,63 @@ class OTP(models.Model):
     created_date = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return self.user
\ No newline at end of file
+        return self.user
+
+
+class OutboxEmail(models.Model):
+    subject = models.CharField(
+        max_length=255,
+        verbose_name='Тема'
+    )
+    message = models.TextField(
+        verbose_name='Текст'
+    )
+    from_email = models.CharField(
+        max_length=255,
+        verbose_name='Отправитель'
+    )
+    recipients = models.JSONField(
+        verbose_name='Получатели'
+    )
+    status = models.CharField(
+        choices=OutboxStatusEnum.choices,
+        default=OutboxStatusEnum.PENDING,
+        max_length=15,
+        verbose_name='Статус'
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name='Попыток'
+    )
+    next_attempt_date = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Следующая попытка'
+    )
+    locked_by = models.CharField(
+        max_length=32,
+        blank=True,
+        verbose_name='Обработчик'
+    )
+    last_error = models.TextField(
+        blank=True,
+        verbose_name='Последняя ошибка'
+    )
+    created_date = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата создания'
+    )
+    sent_date = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name='Дата отправки'
+    )
+
+    class Meta:
+        verbose_name = 'Письмо в очереди'
+        verbose_name_plural = 'Очередь писем'
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_date']),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} --> {', '.join(self.recipients)}"
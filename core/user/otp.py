@@ -0,0 +1,92 @@
+"""
+Одноразовые коды для двухфакторного входа.
+
+OTP_MODE = 'totp': код вычисляется как HOTP (RFC 4226) от номера
+временного окна OTP_STEP и секрета пользователя, поэтому ни выдача, ни
+проверка не пишут в базу. Секрет выводится из SECRET_KEY, id и хеша
+пароля, так что смена пароля аннулирует все выданные коды, и из nonce
+конкретной выдачи: вход, начатый в том же окне, получает другой код.
+Nonce хранится в сессии после проверки пароля (user/views.py), без неё
+код не принимается. Повторное использование кода блокируется записью
+в кеше.
+
+OTP_MODE = 'table': прежняя схема с таблицей OTP, оставлена для сравнения.
+"""
+import hmac
+import random
+import struct
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.crypto import get_random_string, salted_hmac
+
+from .models import OTP
+
+OTP_DIGITS = 6
+
+
+def new_nonce():
+    return get_random_string(16)
+
+
+def user_secret(user, nonce=''):
+    return salted_hmac(
+        'user.otp.secret',
+        f'{user.pk}:{user.password}:{nonce}',
+        algorithm='sha256'
+    ).digest()
+
+
+def current_counter():
+    return int(time.time()) // settings.OTP_STEP
+
+
+def hotp(secret, counter):
+    digest = hmac.new(secret, struct.pack('>Q', counter), 'sha1').digest()
+    offset = digest[-1] & 0x0F
+    value = struct.unpack('>I', digest[offset:offset + 4])[0] & 0x7FFFFFFF
+    return str(value % 10 ** OTP_DIGITS).zfill(OTP_DIGITS)
+
+
+def issue_code(user, nonce=''):
+    if settings.OTP_MODE == 'table':
+        code = str(random.randint(100000, 999999))
+        OTP.objects.create(user=user, code=code)
+        return code
+
+    return hotp(user_secret(user, nonce), current_counter())
+
+
+def _verify_totp(user, code, nonce):
+    secret = user_secret(user, nonce)
+    counter = current_counter()
+    for window in range(counter, counter - settings.OTP_VALID_WINDOWS - 1, -1):
+        if hmac.compare_digest(hotp(secret, window), code):
+            # cache.add атомарен: второй вход тем же кодом получит False
+            return cache.add(
+                f'otp-used:{user.pk}:{nonce}:{window}',
+                True,
+                timeout=settings.OTP_STEP * (settings.OTP_VALID_WINDOWS + 1)
+            )
+    return False
+
+
+def _verify_table(user, code):
+    otp = OTP.objects.filter(user=user, if_used=False, code=code).last()
+    if otp is None:
+        return False
+
+    otp.if_used = True
+    otp.save(update_fields=['if_used'])
+    return True
+
+
+def verify_code(user, code, nonce=''):
+    code = (code or '').strip()
+    if len(code) != OTP_DIGITS or not code.isdigit():
+        return False
+
+    if settings.OTP_MODE == 'table':
+        return _verify_table(user, code)
+    return _verify_totp(user, code, nonce)
@@ -0,0 +1,16 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .backends import user_cache_key
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def user_invalidate_cache(sender, instance, **kwargs):
+    key = user_cache_key(instance.pk)
+    cache.delete(key)
+    # Ещё раз после коммита: параллельный запрос мог положить в кеш старую строку
+    transaction.on_commit(lambda: cache.delete(key))
@@ -1,3 +1,356 @@
-from django.test import TestCase
+import io
+from datetime import timedelta
+from unittest.mock import patch
 
-# Create your tests here.
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from main.query_budget import QueryRecorder, check_budget
+from .choices import OutboxStatusEnum, UserRoleEnum
+from .mail import claim_batch, deliver_batch, enqueue_mail
+from .models import OTP, MyUser, OutboxEmail
+from .otp import issue_code, verify_code
+from .throttling import local_store, rejected_counts, take
+from .views import OTP_SESSION_KEY
+
+
+class QueryBudgetTestCase(TestCase):
+    """Маршруты user/urls.py укладываются в бюджеты settings.QUERY_BUDGETS."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = MyUser.objects.create_user('user@test.kg', '0700000000', 'Пользователь', 'password')
+        cls.otp_user = MyUser.objects.create_user('otp@test.kg', '0700000001', 'OTP', 'password')
+        cls.otp_user.is_otp = True
+        cls.otp_user.save()
+
+    def routes(self):
+        """url_name -> (метод, args, данные)."""
+        return {
+            'register': ('post', [], {
+                'first_name': 'Новый',
+                'email': 'new@test.kg',
+                'phone_number': '0700000002',
+                'password1': 'Sup3r-secret-pass',
+                'password2': 'Sup3r-secret-pass',
+            }),
+            'login': ('post', [], {'email': 'otp@test.kg', 'password': 'password'}),
+            # Код выдаётся под nonce из сессии после login
+            'otp_verify': ('post', [self.otp_user.id], lambda: {'otp_code': issue_code(
+                self.otp_user, self.client.session[OTP_SESSION_KEY]['nonce']
+            )}),
+            'logout': ('get', [], None),
+        }
+
+    def test_routes_within_budget(self):
+        for url_name, (method, args, data) in self.routes().items():
+            with self.subTest(url_name=url_name):
+                if callable(data):
+                    data = data()
+                with QueryRecorder() as recorder:
+                    response = getattr(self.client, method)(reverse(url_name, args=args), data)
+                self.assertLess(response.status_code, 400)
+                check_budget(url_name, recorder)
+
+    @override_settings(OTP_MODE='table')
+    def test_table_mode_within_budget(self):
+        # Код из таблицы OTP — худший случай для otp_verify
+        self.test_routes_within_budget()
+
+
+class SessionCacheTestCase(TestCase):
+    """Сессия и пользователь для сессии читаются из кеша."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = MyUser.objects.create_user('user@test.kg', '0700000000', 'Пользователь', 'password')
+
+    def setUp(self):
+        cache.clear()
+
+    def auth_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('index'))
+        self.assertEqual(response.status_code, 200)
+        return [
+            query['sql'] for query in context.captured_queries
+            if 'django_session' in query['sql'] or '"user_myuser"' in query['sql']
+        ]
+
+    def test_page_views_skip_database_for_auth(self):
+        # Аноним: сессию не создаёт, пользователя не ищет
+        self.assertEqual(self.auth_queries(), [])
+
+        self.client.force_login(self.user)
+        self.assertNotEqual(self.auth_queries(), [])
+        self.assertEqual(self.auth_queries(), [])
+
+    def test_user_changes_invalidate_cache(self):
+        self.client.force_login(self.user)
+        self.auth_queries()
+
+        self.user.role = UserRoleEnum.ACCOUNTANT
+        self.user.save()
+        self.assertTrue(self.client.get(reverse('index')).wsgi_request.user.is_accountant)
+
+        self.user.set_password('new-password')
+        self.user.save()
+        self.assertFalse(self.client.get(reverse('index')).wsgi_request.user.is_authenticated)
+
+    def test_messages_stored_in_cookie(self):
+        response = self.client.post(reverse('login'), {'email': 'user@test.kg', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('messages', response.cookies)
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+
+
+@override_settings(LOGIN_THROTTLES={
+    'login': {'ip': (5, 60), 'email': (2, 60)},
+    'otp_verify': {'ip': (5, 60), 'user': (2, 60)},
+})
+class LoginThrottleTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = MyUser.objects.create_user('user@test.kg', '0700000000', 'Пользователь', 'password')
+
+    def setUp(self):
+        cache.clear()
+        local_store.clear()
+
+    def login(self, email='user@test.kg', ip='10.0.0.1'):
+        return self.client.post(reverse('login'), {'email': email, 'password': 'wrong'}, REMOTE_ADDR=ip)
+
+    def test_email_bucket_rejects_before_authenticate(self):
+        for _ in range(2):
+            self.assertEqual(self.login().status_code, 200)
+        # Другой IP, но тот же email
+        with self.assertNumQueries(0):
+            response = self.login(ip='10.0.0.2')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertEqual(rejected_counts()['login'], {'ip': 0, 'email': 1})
+
+    def test_ip_bucket_and_otp(self):
+        for index in range(5):
+            self.assertEqual(self.login(email=f'user{index}@test.kg').status_code, 200)
+        self.assertEqual(self.login(email='other@test.kg').status_code, 429)
+
+        session = self.client.session
+        session[OTP_SESSION_KEY] = {'user_id': self.user.id, 'nonce': 'nonce'}
+        session.save()
+        url = reverse('otp_verify', args=[self.user.id])
+        for _ in range(2):
+            self.assertEqual(self.client.post(url, {'otp_code': '000000'}, REMOTE_ADDR='10.0.0.3').status_code, 200)
+        self.assertEqual(self.client.post(url, {'otp_code': '000000'}, REMOTE_ADDR='10.0.0.3').status_code, 429)
+        self.assertEqual(rejected_counts()['otp_verify']['user'], 1)
+
+    def test_tokens_refill(self):
+        with patch('user.throttling.time.time', return_value=1000.0):
+            self.assertEqual(take('key', 2, 60), 0)
+            self.assertEqual(take('key', 2, 60), 0)
+            self.assertAlmostEqual(take('key', 2, 60), 30)
+        with patch('user.throttling.time.time', return_value=1030.0):
+            self.assertEqual(take('key', 2, 60), 0)
+
+    @override_settings(LOGIN_THROTTLE_STORE='local')
+    def test_local_store(self):
+        for _ in range(2):
+            self.login()
+        self.assertEqual(self.login().status_code, 429)
+        self.assertIsNone(cache.get('throttle:rejected:login:email'))
+        self.assertEqual(rejected_counts()['login']['email'], 1)
+
+
+@override_settings(OTP_MODE='totp', OTP_STEP=300, OTP_VALID_WINDOWS=1, LOGIN_THROTTLES={})
+class OTPTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = MyUser.objects.create_user('otp@test.kg', '0700000001', 'OTP', 'password')
+        cls.user.is_otp = True
+        cls.user.save()
+
+    def setUp(self):
+        cache.clear()
+
+    def start_login(self):
+        response = self.client.post(reverse('login'), {'email': 'otp@test.kg', 'password': 'password'})
+        self.assertRedirects(response, reverse('otp_verify', args=[self.user.id]), fetch_redirect_response=False)
+        return self.client.session[OTP_SESSION_KEY]['nonce']
+
+    def verify(self, code):
+        return self.client.post(reverse('otp_verify', args=[self.user.id]), {'otp_code': code})
+
+    def test_login_with_code(self):
+        nonce = self.start_login()
+        self.assertEqual(self.verify('000000' if issue_code(self.user, nonce) != '000000' else '111111').status_code, 200)
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+        response = self.verify(issue_code(self.user, nonce))
+        self.assertRedirects(response, reverse('index'), fetch_redirect_response=False)
+        self.assertEqual(self.client.session['_auth_user_id'], str(self.user.id))
+        self.assertNotIn(OTP_SESSION_KEY, self.client.session)
+
+    def test_code_requires_password_step(self):
+        # Правильный код без проверки пароля в этой сессии не принимается
+        for pending in (None, {'user_id': self.user.id + 1, 'nonce': ''}):
+            if pending:
+                session = self.client.session
+                session[OTP_SESSION_KEY] = pending
+                session.save()
+            response = self.verify(issue_code(self.user))
+            self.assertRedirects(response, reverse('login'), fetch_redirect_response=False)
+            self.assertNotIn('_auth_user_id', self.client.session)
+
+    def test_code_is_single_use(self):
+        nonce = self.start_login()
+        code = issue_code(self.user, nonce)
+        self.assertTrue(verify_code(self.user, code, nonce))
+        self.assertFalse(verify_code(self.user, code, nonce))
+
+    def test_each_login_gets_own_code(self):
+        with patch('user.otp.time.time', return_value=1_000_000.0):
+            first = self.start_login()
+            self.assertEqual(self.verify(issue_code(self.user, first)).status_code, 302)
+            self.client.logout()
+
+            # Второй вход в том же окне: прежний код не подходит, новый принимается
+            second = self.start_login()
+            self.assertNotEqual(issue_code(self.user, first), issue_code(self.user, second))
+            self.assertFalse(verify_code(self.user, issue_code(self.user, first), second))
+            self.assertEqual(self.verify(issue_code(self.user, second)).status_code, 302)
+
+    def test_validity_windows(self):
+        with patch('user.otp.time.time', return_value=1_000_000.0):
+            code = issue_code(self.user, 'nonce')
+        with patch('user.otp.time.time', return_value=1_000_000.0 + 300):
+            self.assertTrue(verify_code(self.user, code, 'nonce'))
+        with patch('user.otp.time.time', return_value=1_000_000.0 + 600):
+            self.assertFalse(verify_code(self.user, issue_code(self.user, 'other'), 'nonce'))
+            code = issue_code(self.user, 'old')
+        with patch('user.otp.time.time', return_value=1_000_000.0 + 1200):
+            self.assertFalse(verify_code(self.user, code, 'old'))
+
+    def test_password_change_invalidates_code(self):
+        code = issue_code(self.user, 'nonce')
+        self.user.set_password('new-password')
+        self.user.save()
+        self.assertFalse(verify_code(self.user, code, 'nonce'))
+
+    def test_verify_without_queries(self):
+        code = issue_code(self.user, 'nonce')
+        with self.assertNumQueries(0):
+            self.assertTrue(verify_code(self.user, code, 'nonce'))
+
+    @override_settings(OTP_MODE='table')
+    def test_table_mode(self):
+        nonce = self.start_login()
+        otp = OTP.objects.get(user=self.user)
+        self.assertEqual(self.verify(otp.code).status_code, 302)
+        otp.refresh_from_db()
+        self.assertTrue(otp.if_used)
+        self.assertFalse(verify_code(self.user, otp.code, nonce))
+
+    @override_settings(LOGIN_THROTTLES={'otp_verify': {'ip': (100, 60), 'user': (3, 300)}})
+    def test_verify_throttled_per_user(self):
+        self.start_login()
+        wrong = '000000' if issue_code(self.user, 'x') != '000000' else '111111'
+        for ip in ('10.0.0.1', '10.0.0.2', '10.0.0.3'):
+            self.assertEqual(self.client.post(
+                reverse('otp_verify', args=[self.user.id]), {'otp_code': wrong}, REMOTE_ADDR=ip
+            ).status_code, 200)
+        # Смена IP не помогает: корзина по пользователю пуста
+        response = self.client.post(
+            reverse('otp_verify', args=[self.user.id]), {'otp_code': wrong}, REMOTE_ADDR='10.0.0.4'
+        )
+        self.assertEqual(response.status_code, 429)
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    LOGIN_THROTTLES={},
+    MAIL_QUEUE_MAX_ATTEMPTS=3,
+    MAIL_QUEUE_RETRY_DELAY=30,
+    MAIL_QUEUE_LEASE=300,
+)
+class MailQueueTestCase(TestCase):
+    def enqueue(self, count=1):
+        return [enqueue_mail('Тема', f'Письмо {index}', ['user@test.kg']) for index in range(count)]
+
+    def test_login_enqueues_and_worker_sends(self):
+        user = MyUser.objects.create_user('otp@test.kg', '0700000001', 'OTP', 'password')
+        user.is_otp = True
+        user.save()
+
+        self.client.post(reverse('login'), {'email': 'otp@test.kg', 'password': 'password'})
+        self.assertEqual(mail.outbox, [])
+        email = OutboxEmail.objects.get()
+
+        call_command('send_queued_mail', stdout=io.StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['otp@test.kg'])
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboxStatusEnum.SENT, 1))
+
+    def test_enqueue_is_part_of_the_transaction(self):
+        with self.assertRaises(ValueError), transaction.atomic():
+            self.enqueue()
+            raise ValueError()
+        self.assertFalse(OutboxEmail.objects.exists())
+
+    def test_claim_batch_leases_until_expiry(self):
+        emails = self.enqueue(3)
+        claimed = claim_batch(2)
+        self.assertEqual([email.id for email in claimed], [email.id for email in emails[:2]])
+        self.assertEqual([email.id for email in claim_batch(5)], [emails[2].id])
+        self.assertEqual(claim_batch(5), [])
+
+        # Обработчик упал: после аренды письма снова доступны
+        with patch('user.mail.timezone.now', return_value=timezone.now() + timedelta(seconds=301)):
+            self.assertEqual(len(claim_batch(5)), 3)
+
+    def test_retry_backoff_and_dead_letter(self):
+        email, = self.enqueue()
+        started = timezone.now()
+        with patch.object(EmailBackend, 'send_messages', return_value=0):
+            self.assertEqual(deliver_batch(), (0, 1))
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts), (OutboxStatusEnum.PENDING, 1))
+            self.assertGreaterEqual(email.next_attempt_date, started + timedelta(seconds=30))
+            # До следующей попытки письмо не забирается
+            self.assertEqual(deliver_batch(), (0, 0))
+
+            delays = []
+            for _ in range(2):
+                OutboxEmail.objects.filter(id=email.id).update(next_attempt_date=timezone.now())
+                before = timezone.now()
+                deliver_batch()
+                email.refresh_from_db()
+                delays.append(email.next_attempt_date - before)
+
+        self.assertGreaterEqual(delays[0], timedelta(seconds=60))
+        self.assertEqual((email.status, email.attempts), (OutboxStatusEnum.DEAD, 3))
+        self.assertEqual(mail.outbox, [])
+
+    def test_failed_message_does_not_block_batch(self):
+        first, second = self.enqueue(2)
+        original = EmailBackend.send_messages
+
+        def send_messages(backend, messages):
+            if messages[0].body == first.message:
+                raise OSError('550')
+            return original(backend, messages)
+
+        with patch.object(EmailBackend, 'send_messages', send_messages):
+            self.assertEqual(deliver_batch(), (1, 1))
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.last_error), (OutboxStatusEnum.PENDING, '550'))
+        self.assertEqual([message.body for message in mail.outbox], [second.message])
@@ -0,0 +1,179 @@
+"""
+Ограничение частоты попыток входа.
+
+authenticate() считает PBKDF2 сотни миллисекунд процессора, поэтому
+перебор паролей без ограничения занимает все воркеры. Для каждой точки
+входа из LOGIN_THROTTLES заданы корзины токенов по IP и по учётной записи
+(email для входа, id пользователя для OTP): попытка забирает токен из
+каждой корзины, токены восстанавливаются равномерно. Если токена нет,
+вьюха отвечает 429 до хеширования пароля и любых запросов к базе.
+
+Корзины хранятся в общем кеше, поэтому лимит общий для всех процессов.
+Чтение и запись корзины не атомарны между процессами: при гонке
+несколько параллельных попыток могут пройти сверх лимита, но не больше
+числа воркеров. Если кеш недоступен или LOGIN_THROTTLE_STORE = 'local',
+корзины хранятся в памяти процесса.
+
+Отклонённые попытки считаются по точке входа и ключу, см. команду
+throttle_stats.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.shortcuts import render
+
+logger = logging.getLogger(__name__)
+
+
+class LocalStore:
+    """Корзины в памяти процесса, старые ключи вытесняются при переполнении."""
+
+    def __init__(self):
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value, expires = self.data.get(key, (None, 0))
+            if expires < time.monotonic():
+                self.data.pop(key, None)
+                return None
+            return value
+
+    def set(self, key, value, timeout):
+        with self.lock:
+            self.data[key] = (value, time.monotonic() + timeout)
+            self.data.move_to_end(key)
+            while len(self.data) > settings.LOGIN_THROTTLE_LOCAL_MAX_KEYS:
+                self.data.popitem(last=False)
+
+    def incr(self, key, timeout):
+        with self.lock:
+            value, expires = self.data.get(key, (0, 0))
+            if expires < time.monotonic():
+                value = 0
+            self.data[key] = (value + 1, time.monotonic() + timeout)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+class CacheStore:
+    def get(self, key):
+        return cache.get(key)
+
+    def set(self, key, value, timeout):
+        cache.set(key, value, timeout)
+
+    def incr(self, key, timeout):
+        # add + incr атомарны и в Redis, и в памяти
+        if not cache.add(key, 1, timeout):
+            cache.incr(key)
+
+
+local_store = LocalStore()
+cache_store = CacheStore()
+# Корзины одного процесса не должны обновляться параллельно
+_lock = threading.Lock()
+
+
+def _call(operation, *args):
+    if settings.LOGIN_THROTTLE_STORE == 'cache':
+        try:
+            return getattr(cache_store, operation)(*args)
+        except Exception:
+            # Недоступный кеш не должен закрывать вход, лимиты продолжают работать в процессе
+            logger.warning('Кеш ограничения входа недоступен, используется память процесса', exc_info=True)
+    return getattr(local_store, operation)(*args)
+
+
+def identity(value):
+    """Ключ без персональных данных и с допустимыми для кеша символами."""
+    return hashlib.sha256(str(value).strip().lower().encode()).hexdigest()[:32]
+
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR') or 'unknown'
+
+
+def take(key, attempts, period):
+    """
+    Забирает токен из корзины на attempts попыток, которые восстанавливаются
+    за period секунд. Возвращает 0, если токен был, иначе сколько секунд ждать.
+    """
+    rate = attempts / period
+    now = time.time()
+    with _lock:
+        state = _call('get', key)
+        tokens, updated = state if state else (attempts, now)
+        tokens = min(attempts, tokens + (now - updated) * rate)
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0
+        else:
+            wait = (1 - tokens) / rate
+        # Через period корзина в любом случае снова полна
+        _call('set', key, (tokens, now), period)
+    return wait
+
+
+def rejected_key(endpoint, scope):
+    return f'throttle:rejected:{endpoint}:{scope}'
+
+
+def check(endpoint, identifiers):
+    """
+    identifiers — {область: значение}, например {'ip': ..., 'email': ...}.
+    Возвращает (область, секунды ожидания) первой пустой корзины или None.
+    """
+    limits = settings.LOGIN_THROTTLES.get(endpoint, {})
+    for scope, value in identifiers.items():
+        if scope not in limits or not value:
+            continue
+        attempts, period = limits[scope]
+        wait = take(f'throttle:{endpoint}:{scope}:{identity(value)}', attempts, period)
+        if wait:
+            _call('incr', rejected_key(endpoint, scope), settings.LOGIN_THROTTLE_STATS_TIMEOUT)
+            logger.warning('Вход %s ограничен по %s, ждать %.0f с', endpoint, scope, wait)
+            return scope, wait
+    return None
+
+
+def rejected_counts():
+    """{точка входа: {область: число отклонённых попыток}}."""
+    return {
+        endpoint: {scope: _call('get', rejected_key(endpoint, scope)) or 0 for scope in limits}
+        for endpoint, limits in settings.LOGIN_THROTTLES.items()
+    }
+
+
+def throttle(endpoint, template, **identifiers):
+    """
+    Декоратор вьюхи: ограничивает POST-запросы. identifiers — {область:
+    функция(request, **kwargs) -> значение}; IP учитывается всегда.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method == 'POST':
+                values = {'ip': client_ip(request)}
+                values.update({scope: get(request, **kwargs) for scope, get in identifiers.items()})
+                limited = check(endpoint, values)
+                if limited:
+                    _, wait = limited
+                    seconds = max(1, round(wait))
+                    messages.error(request, f'Слишком много попыток входа, повторите через {seconds} с')
+                    response = render(request, template, status=429)
+                    response['Retry-After'] = str(seconds)
+                    return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
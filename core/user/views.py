@@ -1,12 +1,15 @@
-from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
-from django.core.mail import send_mail
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 
 from .forms import UserRegisterForm
-from .models import OTP, MyUser
-import random
+from .mail import enqueue_mail
+from .models import MyUser
+from .otp import issue_code, new_nonce, verify_code
+from .throttling import throttle
+
+# Пользователь, прошедший проверку пароля и ожидающий код, и nonce выданного кода
+OTP_SESSION_KEY = 'otp_pending'
 
 
 def user_register_view(request):
@@ -24,10 +27,7 @@ def user_register_view(request):
     form = UserRegisterForm()
     return render(request, 'account/user_register.html', {"form": form})
 
-def generate_otp_code():
-    random_code = random.randint(100000, 999999)
-    return random_code
-
+@throttle('login', 'account/user_login.html', email=lambda request: request.POST.get('email'))
 def user_login_view(request):
     if request.method == "POST":
         user_email = request.POST['email']
@@ -37,15 +37,14 @@ def user_login_view(request):
 
         if user:
             if user.is_otp:
-                code = generate_otp_code()
-                otp = OTP.objects.create(user=user, code=code)
+                nonce = new_nonce()
+                request.session[OTP_SESSION_KEY] = {'user_id': user.id, 'nonce': nonce}
+                code = issue_code(user, nonce)
 
-                send_mail(
+                enqueue_mail(
                     subject='Ваш одноразовый пароль в CYBORG07',
                     message=f'OTP код\n{code}',
-                    from_email=settings.DEFAULT_FROM_EMAIL,
                     recipient_list=[user_email],
-                    fail_silently = False,
                 )
 
                 messages.success(request, f'Код отправлен вам на почту{user_email}')
@@ -64,16 +63,21 @@ def user_logout_view(request):
     messages.success(request, 'Вы успешно вышли из системы')
     return redirect('index')
 
+@throttle('otp_verify', 'account/otp_verify.html', user=lambda request, user_id: user_id)
 def otp_verification_view(request, user_id):
+    # Без пароля в этой сессии код не проверяется: иначе это вход только по коду
+    pending = request.session.get(OTP_SESSION_KEY)
+    if not pending or pending['user_id'] != user_id:
+        messages.error(request, 'Сначала введите логин и пароль')
+        return redirect('login')
+
     user = get_object_or_404(MyUser, id=user_id)
 
     if request.method == 'POST':
         otp_code = request.POST['otp_code']
 
-        otp = OTP.objects.filter(user=user, if_used=False, code=otp_code).last()
-
-        if otp:
-            otp.if_used = True
+        if verify_code(user, otp_code, pending['nonce']):
+            del request.session[OTP_SESSION_KEY]
             login(request, user)
             messages.success(request, 'Вы успешно вoшли в систему')
             return redirect('index')